@@ -0,0 +1,115 @@
+"""
+Keeps track of whether the game server can be reached
+
+The health is derived from the outcome of the normal WebWrapper requests, no extra requests are made
+while everything works. After a number of failed requests in a row the circuit opens: requests fail
+fast and the game endpoint is probed with an exponential backoff until it answers again.
+"""
+import logging
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ConnectivityMonitor:
+    """
+    Circuit breaker fed with request outcomes
+    """
+    def __init__(self, failure_threshold=3, min_backoff=5, max_backoff=600):
+        self.failure_threshold = failure_threshold
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = 0
+        self.next_probe = None
+        self.opened_at = None
+        self.last_error = None
+        self.outages = 0
+        self.logger = logging.getLogger("Connectivity")
+
+    @property
+    def online(self):
+        return self.state == CLOSED
+
+    def allow_request(self):
+        """
+        Requests are only sent while the circuit is closed, probes bypass this
+        """
+        return self.state == CLOSED
+
+    def record_success(self, now=None):
+        if self.state != CLOSED:
+            if now is None:
+                now = time.time()
+            self.logger.info(
+                "Game server reachable again after %d seconds", now - (self.opened_at or now)
+            )
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = 0
+        self.next_probe = None
+        self.opened_at = None
+
+    def record_failure(self, error=None, now=None):
+        if now is None:
+            now = time.time()
+        self.failures += 1
+        self.last_error = str(error) if error else None
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self._open(now)
+
+    def trip(self, error=None, now=None):
+        """
+        Opens the circuit right away, e.g. when the first probe at startup failed
+        """
+        if now is None:
+            now = time.time()
+        self.failures += 1
+        self.last_error = str(error) if error else None
+        self._open(now)
+
+    def _open(self, now):
+        if self.state == CLOSED:
+            self.outages += 1
+            self.opened_at = now
+            self.logger.warning(
+                "Game server unreachable after %d failed requests (%s)", self.failures, self.last_error
+            )
+        self.state = OPEN
+        self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+        self.next_probe = now + self.backoff
+
+    def seconds_until_probe(self, now=None):
+        if self.state == CLOSED:
+            return 0
+        if now is None:
+            now = time.time()
+        return max(0.0, self.next_probe - now)
+
+    def wait_until_online(self, probe, sleep=None):
+        """
+        Blocks until probe() reports the game server is back, probing with an exponential backoff
+        """
+        sleep = sleep or time.sleep
+        while self.state != CLOSED:
+            delay = self.seconds_until_probe()
+            if delay:
+                self.logger.info("Probing the game server in %d seconds", delay)
+                sleep(delay)
+            self.state = HALF_OPEN
+            if probe():
+                self.record_success()
+            else:
+                self.record_failure(self.last_error)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "outages": self.outages,
+            "backoff": self.backoff,
+            "last_error": self.last_error,
+        }
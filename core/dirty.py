@@ -0,0 +1,69 @@
+"""
+Keeps track of the inputs every manager ran with, so managers whose inputs
+did not change since their last run can be skipped (together with their requests)
+"""
+import hashlib
+import json
+import time
+
+
+class DirtyTracker:
+    """
+    Remembers a fingerprint of the inputs of every stage and the timer it is waiting on.
+    A stage is dirty when its inputs changed, its timer expired or it did not run for max_age seconds.
+    """
+    def __init__(self, max_age=3600):
+        self.max_age = max_age
+        # name -> (fingerprint, ran at, due)
+        self._seen = {}
+        self._pending = {}
+        self.skipped = {}
+
+    @staticmethod
+    def fingerprint(inputs):
+        """
+        Returns a stable hash of json-like inputs
+        """
+        raw = json.dumps(inputs, sort_keys=True, default=str, separators=(",", ":"))
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def is_dirty(self, name, inputs, now=None):
+        """
+        Checks whether a stage has to run, the fingerprint is stored once done() is called
+        """
+        if now is None:
+            now = time.time()
+        fingerprint = self.fingerprint(inputs)
+        self._pending[name] = fingerprint
+        seen = self._seen.get(name)
+        if not seen or seen[0] != fingerprint:
+            return True
+        _, ran_at, due = seen
+        if due is not None and due <= now:
+            return True
+        if self.max_age is not None and now - ran_at >= self.max_age:
+            return True
+        self.skipped[name] = self.skipped.get(name, 0) + 1
+        return False
+
+    def done(self, name, inputs=None, due=None, now=None):
+        """
+        Marks a stage as ran
+        Passing the inputs again stores the state after the run, so the changes made by the stage itself
+        do not trigger another run. `due` is the timer that makes the stage dirty again.
+        """
+        if now is None:
+            now = time.time()
+        fingerprint = self._pending.pop(name, None)
+        if inputs is not None:
+            fingerprint = self.fingerprint(inputs)
+        self._seen[name] = (fingerprint, now, float(due) if due is not None else None)
+
+    def invalidate(self, name=None):
+        """
+        Forces a stage (or all of them) to run the next time
+        """
+        if name is None:
+            self._seen = {}
+        else:
+            self._seen.pop(name, None)
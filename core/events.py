@@ -0,0 +1,89 @@
+"""
+Village state deltas for the web manager
+
+Every time a village writes its cache entry the fields the dashboard shows live are compared with
+what was published before, and only the changed ones are appended to cache/events.jsonl.
+The web manager tails that file and pushes the lines to browsers (Server-Sent Events).
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from core.filemanager import FileManager
+
+# Fields of the cache/managed entry that are pushed to the dashboard
+LIVE_FIELDS = ("status", "resources", "building_queue", "under_attack", "farm_bag", "last_run")
+
+
+def diff(previous, current):
+    """
+    Returns the fields that changed, nested dicts only include their changed keys
+    """
+    changes = {}
+    for key, value in current.items():
+        old = previous.get(key) if previous else None
+        if value == old:
+            continue
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = {k: v for k, v in value.items() if old.get(k) != v}
+            # Removed keys are sent as null
+            nested.update({k: None for k in old if k not in value})
+            changes[key] = nested
+        else:
+            changes[key] = value
+    return changes
+
+
+class _EventLog:
+    path = "cache/events.jsonl"
+    # Once the log is larger than this only the last `keep_lines` are kept
+    max_size = 1024 * 1024
+    keep_lines = 500
+
+    def __init__(self):
+        self.published = {}
+        self.last_id = 0
+        self.logger = logging.getLogger("Events")
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        # Millisecond timestamps, so ids keep increasing when the bot restarts
+        self.last_id = max(self.last_id + 1, int(time.time() * 1000))
+        return self.last_id
+
+    def publish_village(self, village_id, entry):
+        """
+        Appends the changed live fields of a village, returns the event (None if nothing changed)
+        """
+        current = {key: entry.get(key) for key in LIVE_FIELDS}
+        with self._lock:
+            changes = diff(self.published.get(village_id), current)
+            self.published[village_id] = current
+            if not changes or list(changes) == ["last_run"]:
+                return None
+            event = {"id": self.next_id(), "village": village_id, "changes": changes}
+            self.append(event)
+        return event
+
+    def append(self, event):
+        path = FileManager.get_path(self.path)
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps(event, separators=(",", ":")) + "\n")
+            if os.path.getsize(path) > self.max_size:
+                self.rotate(path)
+        except OSError as e:
+            self.logger.debug("Unable to write event: %s", e)
+
+    def rotate(self, path):
+        with open(path, "r") as f:
+            lines = f.readlines()[-self.keep_lines:]
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(lines)
+        os.replace(tmp, path)
+
+
+EventLog = _EventLog()
@@ -9,9 +9,21 @@ class FileManager:
 
     @staticmethod
     def get_root():
-        """Returns the root directory of the project."""
+        """Returns the root directory of the running bot (config, cache and session).
+        Defaults to the install directory, TWB_HOME (or twb.py --home) moves it elsewhere
+        so multiple worlds can run from a single install."""
+        return os.environ.get("TWB_HOME") or FileManager.get_install_root()
+
+    @staticmethod
+    def get_install_root():
+        """Returns the directory the bot is installed in (code, templates and config.example.json)."""
         return os.path.join(os.path.dirname(__file__), "..")
 
+    @staticmethod
+    def get_install_path(path):
+        """Returns the full path of a file or directory shipped with the bot."""
+        return os.path.join(FileManager.get_install_root(), path)
+
     @staticmethod
     def get_path(path):
         """Returns the full path of a file or directory in the project."""
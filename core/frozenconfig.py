@@ -0,0 +1,64 @@
+"""
+Read-only config snapshots
+
+The config is frozen once every time config.json changes and the same snapshot is shared
+by all villages, so nothing has to be deep-copied per cycle or per village.
+Frozen dicts are still dicts, so reading code and json.dumps keep working;
+code that wants to change the config has to thaw() it first.
+"""
+
+
+class FrozenDict(dict):
+    """
+    A dict that refuses to be changed
+    """
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Config snapshots are read-only, use thaw() to get a mutable copy")
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    __ior__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __reduce__(self):
+        # copy / pickle would otherwise rebuild the dict using __setitem__
+        return FrozenDict, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __repr__(self):
+        return "FrozenDict(%s)" % dict.__repr__(self)
+
+
+def freeze(value):
+    """
+    Returns a read-only copy, dicts become FrozenDicts and lists become tuples
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """
+    Returns a mutable copy of a (frozen) config value
+    """
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
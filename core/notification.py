@@ -1,10 +1,25 @@
-import asyncio
+"""
+Telegram notifications
 
-import telegram
+Messages are queued and sent by a background thread running its own asyncio loop, so the bot
+never waits for Telegram. Messages sharing a key are merged into one message when they arrive within
+`coalesce_seconds`, at most one message is sent every `min_interval` seconds and failed sends are
+retried with a backoff. The config is read and the thread is started when the first message is sent,
+so importing this module stays cheap (telegram is a heavy import).
+"""
+import atexit
+import collections
+import itertools
+import logging
+import threading
+import time
 
 from core.filemanager import FileManager
 from core.exceptions import InvalidJSONException
 
+# Lines kept of a merged message
+MAX_LINES = 20
+
 
 class _Notification:
     bot = None
@@ -12,19 +27,33 @@ class _Notification:
     channel_id = None
     token = None
 
-    def __init__(self):
+    def __init__(self, bot=None):
         self.loop = None
-        self.get_config()
+        self.configured = False
+        self.coalesce_seconds = 10
+        self.min_interval = 1.0
+        self.max_queue = 100
+        self.max_retries = 5
+        self.retry_delay = 2.0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.logger = logging.getLogger("Notification")
+        if bot is not None:
+            # Used by the tests, any object with an async send_message(chat_id, text)
+            self.bot = bot
+            self.enabled = True
+            self.configured = True
 
-        if self.enabled:
-            self.loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(self.loop)
-            self.bot = telegram.Bot(token=self.token)
-
-    def __del__(self):
-        """Cleanup event loop on destruction"""
-        if self.loop and not self.loop.is_closed():
-            self.loop.close()
+        # key -> [first queued at, window, messages]
+        self._pending = collections.OrderedDict()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wakeup = None
+        self._thread = None
+        self._closing = False
+        self._last_sent = 0
 
     def get_config(self):
         try:
@@ -37,16 +66,144 @@ class _Notification:
             self.enabled = notification_config.get("enabled", False)
             self.channel_id = notification_config.get("channel_id")
             self.token = notification_config.get("token")
+            self.coalesce_seconds = notification_config.get("coalesce_seconds", self.coalesce_seconds)
+            self.min_interval = notification_config.get("min_interval", self.min_interval)
+
+    def setup(self):
+        self.configured = True
+        self.get_config()
+        if self.enabled:
+            import telegram
+
+            self.bot = telegram.Bot(token=self.token)
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="TWB-Notification", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        atexit.register(self.close)
 
-    def send(self, message):
-        if not self.enabled or not self.bot:
+    def send(self, message, key=None):
+        """
+        Queues a message, messages with the same key are merged into one
+        """
+        if not self.configured:
+            self.setup()
+        if not self.enabled or not self.bot or self._closing:
             return
+        self.start()
+        now = time.monotonic()
+        with self._lock:
+            if key is not None and key in self._pending:
+                self._pending[key][2].append(message)
+            else:
+                if len(self._pending) >= self.max_queue:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                if key is None:
+                    self._pending[("message", next(self._counter))] = [now, 0, [message]]
+                else:
+                    self._pending[key] = [now, self.coalesce_seconds, [message]]
+        self._wake()
+
+    def _wake(self):
+        if self.loop and not self.loop.is_closed():
+            try:
+                self.loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass
+
+    @staticmethod
+    def merge(messages):
+        unique = list(dict.fromkeys(messages))
+        text = "\n".join(unique[:MAX_LINES])
+        if len(unique) > MAX_LINES:
+            text += "\n... and %d more" % (len(unique) - MAX_LINES)
+        return text
 
-        task = self.loop.create_task(self.send_async(message))
-        self.loop.run_until_complete(task)
+    def _pop_ready(self, now):
+        """
+        Returns the next message that is ready to be sent and the seconds until the next one is
+        """
+        wait = None
+        with self._lock:
+            for key, (queued, window, messages) in self._pending.items():
+                remaining = queued + window - now
+                if remaining <= 0 or self._closing:
+                    del self._pending[key]
+                    return self.merge(messages), 0
+                wait = remaining if wait is None else min(wait, remaining)
+        return None, wait
 
-    async def send_async(self, message):
-        await self.bot.send_message(chat_id=self.channel_id, text=message)
+    def _run(self):
+        import asyncio
+
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._worker())
+        finally:
+            self.loop.close()
+
+    async def _worker(self):
+        import asyncio
+
+        self._wakeup = asyncio.Event()
+        self._ready.set()
+        while True:
+            text, wait = self._pop_ready(time.monotonic())
+            if text is None:
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            delay = self._last_sent + self.min_interval - time.monotonic()
+            if delay > 0 and not self._closing:
+                await asyncio.sleep(delay)
+            await self.deliver(text)
+            self._last_sent = time.monotonic()
+
+    async def deliver(self, text):
+        """
+        Sends a single message, retrying with a backoff (or the delay Telegram asks for)
+        """
+        import asyncio
+
+        backoff = self.retry_delay
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self.bot.send_message(chat_id=self.channel_id, text=text)
+                self.sent += 1
+                return True
+            except Exception as e:
+                retry_after = getattr(e, "retry_after", None)
+                if hasattr(retry_after, "total_seconds"):
+                    retry_after = retry_after.total_seconds()
+                delay = retry_after if isinstance(retry_after, (int, float)) else backoff
+                self.logger.warning(
+                    "Unable to send notification (attempt %d/%d): %s", attempt, self.max_retries, e
+                )
+                if attempt == self.max_retries:
+                    break
+                await asyncio.sleep(min(delay, 1.0) if self._closing else delay)
+                backoff = min(300, backoff * 2)
+        self.failed += 1
+        return False
+
+    def close(self, timeout=10):
+        """
+        Sends what is still queued (ignoring the coalesce window) and stops the thread
+        """
+        if not self._thread or self._closing:
+            return
+        self._closing = True
+        self._wake()
+        self._thread.join(timeout)
 
 
 Notification = _Notification()
@@ -0,0 +1,350 @@
+"""
+Low overhead sampling profiler for the bot cycles
+
+A background thread samples the stack of the bot thread every few milliseconds.
+Every sample is tagged with the current stage (set by TWB / Village) and a category:
+  sleep    - the random delays of the WebWrapper
+  network  - waiting for the game server
+  parsing  - HTML / JSON parsing (core/extractors.py, bs4, pyquery)
+  logic    - everything else
+
+After every cycle the samples are written to cache/logs as collapsed stacks
+(usable with any flamegraph tool), a rendered flamegraph SVG and a summary
+with the top functions by self time (shown in the web manager).
+"""
+import collections
+import html
+import logging
+import os
+import sys
+import threading
+import time
+
+from core.filemanager import FileManager
+
+CATEGORIES = ("sleep", "network", "parsing", "logic")
+
+CATEGORY_COLORS = {
+    "sleep": (180, 180, 180),
+    "network": (90, 140, 220),
+    "parsing": (240, 160, 40),
+    "logic": (220, 80, 60),
+}
+
+PARSING_FILES = (
+    os.path.join("core", "extractors.py"),
+    os.path.join("bs4", ""),
+    os.path.join("pyquery", ""),
+    os.path.join("lxml", ""),
+    os.path.join("html", "parser.py"),
+)
+
+NETWORK_FILES = (
+    os.path.join("requests", ""),
+    os.path.join("urllib3", ""),
+    os.path.join("http", "client.py"),
+    "socket.py",
+    "ssl.py",
+)
+
+MAX_DEPTH = 64
+
+
+class _Activity:
+    """
+    Marks the time spent inside the with block as a category
+    """
+    __slots__ = ("profiler", "category", "previous")
+
+    def __init__(self, profiler, category):
+        self.profiler = profiler
+        self.category = category
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = self.profiler._activity
+        self.profiler._activity = self.category
+        return self
+
+    def __exit__(self, *_):
+        self.profiler._activity = self.previous
+        return False
+
+
+class _NoActivity:
+    """
+    Used when profiling is disabled so marking activities costs next to nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+
+_NO_ACTIVITY = _NoActivity()
+
+
+class _Profiler:
+    """
+    Per cycle sampling profiler, use the module level Profiler object
+    """
+    def __init__(self):
+        self.enabled = False
+        self.interval = 0.005
+        self.output_dir = "cache/logs"
+        self.keep = 20
+        self.logger = logging.getLogger("Profiler")
+        self.last_summary = None
+        self.cycle = 0
+
+        self._thread = None
+        self._target = None
+        self._sampling = False
+        self._stage = "main"
+        self._activity = None
+        self._labels = {}
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._stacks = collections.Counter()
+        self._self = collections.Counter()
+        self._categories = collections.Counter()
+        self._stage_samples = collections.Counter()
+        self._samples = 0
+        self._started = None
+        self._last_sample = None
+
+    def enable(self, interval=None, keep=None):
+        if interval:
+            self.interval = interval
+        if keep:
+            self.keep = keep
+        if self.enabled:
+            return
+        self.enabled = True
+        self._thread = threading.Thread(target=self._run, name="TWB-Profiler", daemon=True)
+        self._thread.start()
+        self.logger.info("Profiling enabled (sampling every %.1f ms)", self.interval * 1000)
+
+    def disable(self):
+        self.enabled = False
+        self._sampling = False
+
+    def activity(self, category):
+        """
+        Context manager tagging the enclosed time (e.g. sleep or network)
+        """
+        if not self.enabled:
+            return _NO_ACTIVITY
+        return _Activity(self, category)
+
+    def set_stage(self, stage):
+        self._stage = stage
+
+    def start_cycle(self, thread_id=None):
+        """
+        Starts sampling the calling (or given) thread
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._reset()
+            self.cycle += 1
+            self._target = thread_id or threading.get_ident()
+            self._stage = "main"
+            self._started = time.time()
+            self._last_sample = time.perf_counter()
+            self._sampling = True
+
+    def end_cycle(self):
+        """
+        Stops sampling and writes the results of the cycle, returns the summary
+        """
+        if not self.enabled or not self._sampling:
+            return None
+        with self._lock:
+            self._sampling = False
+            duration = time.time() - self._started
+            summary = self.summary(duration)
+            stacks = dict(self._stacks)
+        try:
+            self.write(summary, stacks)
+        except Exception as e:
+            self.logger.warning("Unable to write profile: %s", e)
+        self.last_summary = summary
+        return summary
+
+    def _run(self):
+        while self.enabled:
+            time.sleep(self.interval)
+            if self._sampling:
+                with self._lock:
+                    if self._sampling:
+                        self.sample()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            root = os.path.abspath(FileManager.get_install_root())
+            if os.path.abspath(filename).startswith(root):
+                module = os.path.relpath(filename, root)
+            else:
+                module = os.path.basename(filename)
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = "%s:%s" % (module.replace(os.sep, "/"), name)
+        return label
+
+    @staticmethod
+    def _detect(filenames):
+        for filename in filenames:
+            if any(part in filename for part in PARSING_FILES):
+                return "parsing"
+        for filename in filenames:
+            if any(part in filename for part in NETWORK_FILES):
+                return "network"
+        return "logic"
+
+    def sample(self):
+        """
+        Takes a single sample of the target thread
+        """
+        now = time.perf_counter()
+        # The bot thread holds the GIL while running Python code, so samples are not evenly spaced.
+        # Every sample is weighted with the time since the previous one to keep the totals fair.
+        weight = now - self._last_sample
+        self._last_sample = now
+        frame = sys._current_frames().get(self._target)
+        if frame is None:
+            return
+        labels = []
+        filenames = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            filenames.append(frame.f_code.co_filename)
+            frame = frame.f_back
+        labels.reverse()
+
+        category = self._activity or self._detect(filenames)
+        if category in ("sleep", "network") and self._activity:
+            # The time is spent in C code, show it as its own leaf
+            labels.append("[%s]" % category)
+
+        stage = self._stage
+        self._stacks[";".join([stage, category] + labels)] += weight
+        self._self[labels[-1] if labels else "[unknown]"] += weight
+        self._categories[category] += weight
+        self._stage_samples[stage] += weight
+        self._samples += 1
+
+    def summary(self, duration, top=25):
+        """
+        Returns the sampled seconds per category, stage and function (self time)
+        """
+        sampled = sum(self._categories.values()) or 1.0
+        return {
+            "cycle": self.cycle,
+            "started": int(self._started),
+            "duration": round(duration, 3),
+            "samples": self._samples,
+            "categories": {
+                category: round(self._categories.get(category, 0), 3) for category in CATEGORIES
+            },
+            "stages": {
+                stage: round(seconds, 3) for stage, seconds in self._stage_samples.most_common()
+            },
+            "top": [
+                [function, round(seconds, 3), round(100.0 * seconds / sampled, 1)]
+                for function, seconds in self._self.most_common(top)
+            ],
+        }
+
+    def write(self, summary, stacks):
+        """
+        Writes the collapsed stacks, the flamegraph and the summary of a cycle to cache/logs
+        """
+        FileManager.create_directories([self.output_dir])
+        name = "profile-%d-%d" % (summary["started"], summary["cycle"])
+        with open(FileManager.get_path(os.path.join(self.output_dir, name + ".folded")), "w",
+                  encoding="utf-8") as folded:
+            # Collapsed stacks use integer weights, milliseconds here
+            for stack, seconds in sorted(stacks.items()):
+                folded.write("%s %d\n" % (stack, max(1, round(seconds * 1000))))
+        with open(FileManager.get_path(os.path.join(self.output_dir, name + ".svg")), "w",
+                  encoding="utf-8") as svg:
+            svg.write(flamegraph_svg(stacks, title="Cycle %d (%.1fs)" % (summary["cycle"], summary["duration"])))
+        summary["flamegraph"] = name + ".svg"
+
+        history = FileManager.load_json_file(os.path.join(self.output_dir, "profile.json")) or []
+        history.append(summary)
+        for old in history[:-self.keep]:
+            for extension in (".svg", ".folded"):
+                FileManager.remove_file(os.path.join(self.output_dir, old["flamegraph"].replace(".svg", extension)))
+        FileManager.save_json_file(history[-self.keep:], os.path.join(self.output_dir, "profile.json"))
+
+
+def flamegraph_svg(stacks, title="", width=1200, row_height=16):
+    """
+    Renders collapsed stacks ({"a;b;c": weight}) as a flamegraph SVG
+    """
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, count in stacks.items():
+        root["value"] += count
+        node = root
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"name": frame, "value": 0, "children": {}})
+            node["value"] += count
+
+    def depth(node):
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    rows = depth(root)
+    height = (rows + 2) * row_height
+    total = root["value"] or 1
+    scale = (width - 20) / total
+    rects = []
+
+    def draw(node, x, level, category):
+        node_width = node["value"] * scale
+        if node_width < 0.3:
+            return
+        if level == 2 and node["name"] in CATEGORY_COLORS:
+            category = node["name"]
+        red, green, blue = CATEGORY_COLORS.get(category, (200, 200, 120))
+        shade = (hash(node["name"]) % 40) - 20
+        color = "rgb(%d,%d,%d)" % (
+            max(0, min(255, red + shade)), max(0, min(255, green + shade)), max(0, min(255, blue + shade))
+        )
+        y = height - (level + 2) * row_height
+        label = html.escape(node["name"])
+        percent = 100.0 * node["value"] / total
+        text = label if node_width > 7 * len(node["name"]) else label[:max(0, int(node_width / 7) - 2)] + (
+            ".." if node_width > 21 else "")
+        rects.append(
+            '<g><title>%s (%.3gs, %.1f%%)</title>'
+            '<rect x="%.1f" y="%d" width="%.1f" height="%d" fill="%s" rx="2"/>'
+            '<text x="%.1f" y="%d">%s</text></g>' % (
+                label, node["value"], percent, x, y, node_width, row_height - 1, color,
+                x + 3, y + row_height - 4, text if node_width > 21 else ""
+            )
+        )
+        child_x = x
+        for child in sorted(node["children"].values(), key=lambda item: item["name"]):
+            draw(child, child_x, level + 1, category)
+            child_x += child["value"] * scale
+
+    draw(root, 10, 0, None)
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" font-family="Verdana" font-size="11">'
+        '<rect width="100%%" height="100%%" fill="#fafafa"/>'
+        '<text x="%d" y="16" text-anchor="middle" font-size="14">%s</text>%s</svg>' % (
+            width, height, width / 2, html.escape(title), "".join(rects)
+        )
+    )
+
+
+Profiler = _Profiler()
@@ -1,10 +1,20 @@
 """
-This module can be used in order to report actions to a file or remote MySQL server
+This module can be used in order to report actions to a file, a local SQLite database or remote MySQL server
 """
+import atexit
+import datetime
+import json
 import logging
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
 import time
 import warnings
 
+from core.filemanager import FileManager
+
 try:
     import pymysql
 
@@ -12,6 +22,116 @@ try:
 except ImportError:
     HAS_PYMYSQL = False
 
+# Wakes up the writer thread without adding a row
+_WAKE = object()
+# MySQL error for a key name that already exists (ER_DUP_KEYNAME)
+ER_DUP_KEYNAME = 1061
+
+
+class BatchWriter:
+    """
+    Collects rows on a background thread and hands them to `flush` in batches
+    A batch is written once it holds `max_batch` rows, after `max_delay` seconds and on close().
+    When flush raises the batch is kept and retried with a backoff, at most `max_queue` rows are held
+    (queued and pending) and new rows are dropped while that many wait.
+    """
+    def __init__(self, flush, max_batch=200, max_delay=5.0, max_queue=10000, name="TWB-Reporter"):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.logger = logging.getLogger("BatchWriter")
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue()
+        self._pending = []
+        # Rows in the queue and in _pending
+        self._held = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flush_now = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, kind, row):
+        if self._closed.is_set():
+            return
+        with self._lock:
+            if self._held >= self.max_queue:
+                self.dropped += 1
+                return
+            self._held += 1
+        self._queue.put((kind, row))
+
+    def request_flush(self):
+        self._flush_now.set()
+        self._queue.put(_WAKE)
+
+    def _drain(self, timeout):
+        try:
+            item = self._queue.get(timeout=timeout)
+            while True:
+                if item is not _WAKE:
+                    self._pending.append(item)
+                if len(self._pending) >= self.max_batch:
+                    break
+                item = self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _write(self):
+        if not self._pending:
+            return True
+        try:
+            self.flush(self._pending)
+        except Exception as e:
+            self.logger.warning("Unable to write %d rows, retrying later: %s", len(self._pending), e)
+            return False
+        self.written += len(self._pending)
+        self._release(len(self._pending))
+        self._pending = []
+        return True
+
+    def _release(self, rows):
+        with self._lock:
+            self._held -= rows
+
+    def _run(self):
+        backoff = 0
+        deadline = time.monotonic() + self.max_delay
+        while not self._closed.is_set():
+            self._drain(timeout=max(0.05, min(1.0, deadline - time.monotonic())))
+            now = time.monotonic()
+            # A full batch is only written early while there is no backoff, a failing server is not hammered
+            full = len(self._pending) >= self.max_batch and backoff == 0
+            if full or now >= deadline or self._flush_now.is_set():
+                self._flush_now.clear()
+                if self._write():
+                    backoff = 0
+                else:
+                    backoff = min(300, max(self.max_delay, backoff * 2))
+                deadline = time.monotonic() + (backoff or self.max_delay)
+
+    def close(self, timeout=10):
+        """
+        Stops the thread and writes everything that is still queued
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._queue.put(_WAKE)
+        self._thread.join(timeout)
+        while True:
+            self._drain(timeout=0)
+            if not self._pending or not self._write():
+                break
+        if self._pending:
+            self.logger.warning("Dropped %d rows that could not be written", len(self._pending))
+            self.dropped += len(self._pending)
+            self._release(len(self._pending))
+            self._pending = []
+
 
 class RemoteReporter:
     """
@@ -41,6 +161,12 @@ class RemoteReporter:
         """
         return
 
+    def close(self):
+        """
+        Writes pending data and releases the connection
+        """
+        return
+
 
 class FileReporter:
     """
@@ -73,11 +199,27 @@ class FileReporter:
         with open(connection, 'w', encoding="utf-8") as f:
             f.write("Starting bot at %d\n" % time.time())
 
+    def close(self):
+        """
+        Nothing is kept open
+        """
+        return
+
 
 class MySQLReporter(RemoteReporter):
     """
     Uses a (remote) MySQL server for logging
+    Rows are queued and written in batches by a background thread using a single persistent connection,
+    so the bot never waits for the database.
     """
+    def __init__(self, max_batch=200, max_delay=5.0):
+        self.connection = None
+        self.con = None
+        self.writer = None
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.logger = logging.getLogger("MySQLReporter")
+
     @staticmethod
     def connection_from_object(cobj):
         """
@@ -90,55 +232,79 @@ class MySQLReporter(RemoteReporter):
             password=cobj['password'],
             database=cobj['database'])
 
+    def get_connection(self):
+        """
+        Returns the persistent connection, reconnecting when it was lost
+        """
+        if self.con is not None and getattr(self.con, "open", True):
+            return self.con
+        self.con = self.connection_from_object(self.connection)
+        return self.con
+
+    def drop_connection(self):
+        if self.con is not None:
+            try:
+                self.con.close()
+            except Exception:
+                pass
+        self.con = None
+
     def report(self, connection, village_id, action, data):
         """
         Add a report entry
         """
-        con = MySQLReporter.connection_from_object(connection)
-        cur = con.cursor()
-        cur.execute("INSERT INTO twb_logs (village, action, data, ts) VALUES (%s, %s, %s, NOW())",
-                    (village_id, action, data))
-        con.commit()
-        cur.close()
-        con.close()
+        self.writer.put("log", (village_id, action, data, datetime.datetime.now()))
 
     def add_data(self, connection, village_id, data_type, data):
         """
         Saves data to a remote MySQL server
         """
-        con = self.connection_from_object(connection)
-        cur = con.cursor()
-        cur.execute(
-            "SELECT * FROM twb_data WHERE village_id = %s AND data_type = %s",
-            (village_id, data_type)
-        )
-        if cur.rowcount > 0:
-            cur.execute(
-                "UPDATE twb_data SET data = %s, last_update = NOW() WHERE village_id = %s AND data_type = %s",
-                (data, village_id, data_type)
-            )
-        else:
-            cur.execute(
-                "INSERT INTO twb_data (village_id, data_type, data, last_update) VALUES (%s, %s, %s, NOW())",
-                (village_id, data_type, data)
-            )
-        con.commit()
-        cur.close()
-        con.close()
+        self.writer.put("data", (village_id, data_type, data, datetime.datetime.now()))
+
+    def write_batch(self, batch):
+        """
+        Writes a batch of queued rows, logs as one multi-row INSERT and data as one upsert
+        """
+        logs = [row for kind, row in batch if kind == "log"]
+        # Only the last value of every (village, type) pair matters
+        data = {}
+        for kind, row in batch:
+            if kind == "data":
+                data[(row[0], row[1])] = row
+        try:
+            con = self.get_connection()
+            cur = con.cursor()
+            if logs:
+                cur.executemany(
+                    "INSERT INTO twb_logs (village_id, action, data, ts) VALUES (%s, %s, %s, %s)", logs
+                )
+            if data:
+                cur.executemany(
+                    "INSERT INTO twb_data (village_id, data_type, data, last_update) VALUES (%s, %s, %s, %s) "
+                    "ON DUPLICATE KEY UPDATE data = VALUES(data), last_update = VALUES(last_update)",
+                    list(data.values())
+                )
+            con.commit()
+            cur.close()
+        except Exception:
+            self.drop_connection()
+            raise
 
     def setup(self, connection):
         """
         Creates the initial database tables
         """
+        self.connection = connection
         try:
-            con = self.connection_from_object(connection)
+            con = self.get_connection()
             query_data = """CREATE TABLE IF NOT EXISTS `twb_data` (
                     `id`  int NOT NULL AUTO_INCREMENT ,
                     `village_id`  int NULL ,
                     `data_type`  varchar(50) NULL ,
                     `data`  text NULL ,
                     `last_update`  datetime NULL ,
-                    PRIMARY KEY (`id`)
+                    PRIMARY KEY (`id`),
+                    UNIQUE KEY `village_data` (`village_id`, `data_type`)
                     )"""
             query_logs = """CREATE TABLE IF NOT EXISTS `twb_logs` (
                             `id`  int NOT NULL AUTO_INCREMENT ,
@@ -154,12 +320,261 @@ class MySQLReporter(RemoteReporter):
                 cur.execute(query_data)
                 cur.execute(query_logs)
                 con.commit()
+            try:
+                # Tables created by older versions miss the key the upserts depend on
+                cur.execute("ALTER TABLE `twb_data` ADD UNIQUE KEY `village_data` (`village_id`, `data_type`)")
+                con.commit()
+            except Exception as e:
+                if not e.args or e.args[0] != ER_DUP_KEYNAME:
+                    # e.g. duplicate rows from older versions, the upserts would keep adding rows
+                    self.logger.error(
+                        "Unable to add the unique key on twb_data (village_id, data_type), "
+                        "remove the duplicate rows and restart: %s", e
+                    )
             cur.close()
-            con.close()
-            return True
         except Exception as e:
             print(f"MYSQL ERROR: {e}")
+            self.drop_connection()
             return False
+        self.writer = BatchWriter(self.write_batch, max_batch=self.max_batch, max_delay=self.max_delay)
+        return True
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.drop_connection()
+
+
+class ReportDatabase:
+    """
+    SQLite store for reports, the last snapshot of every data type and numeric time series
+    Also used (read-only) by the web manager to chart the history of a village.
+    """
+    # Snapshots of these types are also stored as time series, one row per numeric value
+    SERIES_TYPES = ("village.resources", "village.buildings", "village.troops", "village.farm_bag")
+    # (age in seconds, resolution in seconds), older values are averaged into buckets of the resolution
+    DOWNSAMPLE = ((2 * 86400, 3600), (30 * 86400, 86400))
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        if read_only:
+            # Readers leave the schema and the journal mode to the bot that writes the database
+            uri = "%s?mode=ro" % pathlib.Path(os.path.abspath(path)).as_uri()
+            self.con = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30)
+        else:
+            self.con = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self.create_tables()
+
+    def create_tables(self):
+        with self.lock, self.con:
+            self.con.execute("PRAGMA journal_mode=WAL")
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS logs ("
+                "id INTEGER PRIMARY KEY, ts REAL, village_id TEXT, action TEXT, data TEXT)"
+            )
+            self.con.execute("CREATE INDEX IF NOT EXISTS logs_village ON logs (village_id, ts)")
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                "village_id TEXT, data_type TEXT, data TEXT, ts REAL, PRIMARY KEY (village_id, data_type))"
+            )
+            self.con.execute(
+                "CREATE TABLE IF NOT EXISTS series ("
+                "ts INTEGER, village_id TEXT, data_type TEXT, key TEXT, value REAL, resolution INTEGER DEFAULT 0)"
+            )
+            self.con.execute("CREATE INDEX IF NOT EXISTS series_village ON series (village_id, data_type, ts)")
+
+    @staticmethod
+    def flatten(data, prefix=""):
+        """
+        Returns the numeric values of a (nested) snapshot as {"key.sub": value}
+        """
+        output = {}
+        for key, value in data.items():
+            name = "%s%s" % (prefix, key)
+            if isinstance(value, dict):
+                output.update(ReportDatabase.flatten(value, prefix=name + "."))
+            elif isinstance(value, bool) or value is None:
+                continue
+            else:
+                try:
+                    output[name] = float(value)
+                except (TypeError, ValueError):
+                    continue
+        return output
+
+    def write(self, logs=(), snapshots=()):
+        """
+        Writes log rows (ts, village_id, action, data) and snapshots (ts, village_id, data_type, data)
+        in a single transaction
+        """
+        series = []
+        for ts, village_id, data_type, data in snapshots:
+            if data_type not in self.SERIES_TYPES:
+                continue
+            try:
+                values = json.loads(data)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(values, dict):
+                series.extend(
+                    (int(ts), village_id, data_type, key, value)
+                    for key, value in self.flatten(values).items()
+                )
+        with self.lock, self.con:
+            self.con.executemany(
+                "INSERT INTO logs (ts, village_id, action, data) VALUES (?, ?, ?, ?)", logs
+            )
+            self.con.executemany(
+                "INSERT OR REPLACE INTO snapshots (ts, village_id, data_type, data) VALUES (?, ?, ?, ?)",
+                snapshots
+            )
+            self.con.executemany(
+                "INSERT INTO series (ts, village_id, data_type, key, value) VALUES (?, ?, ?, ?, ?)", series
+            )
+
+    def downsample(self, now=None):
+        """
+        Replaces old series values by their average per hour (after 2 days) or day (after 30 days)
+        """
+        if now is None:
+            now = time.time()
+        with self.lock, self.con:
+            for age, resolution in self.DOWNSAMPLE:
+                cutoff = int(now - age) // resolution * resolution
+                self.con.execute(
+                    "INSERT INTO series (ts, village_id, data_type, key, value, resolution) "
+                    "SELECT (ts / :res) * :res, village_id, data_type, key, AVG(value), :res FROM series "
+                    "WHERE resolution < :res AND ts < :cutoff "
+                    "GROUP BY ts / :res, village_id, data_type, key",
+                    {"res": resolution, "cutoff": cutoff}
+                )
+                self.con.execute(
+                    "DELETE FROM series WHERE resolution < :res AND ts < :cutoff",
+                    {"res": resolution, "cutoff": cutoff}
+                )
+
+    def logs(self, village_id=None, action=None, since=None, limit=100):
+        """
+        Returns the newest log rows as dicts, newest first
+        """
+        query = "SELECT ts, village_id, action, data FROM logs WHERE 1 = 1"
+        args = []
+        for column, value in (("village_id", village_id), ("action", action)):
+            if value is not None:
+                query += " AND %s = ?" % column
+                args.append(str(value))
+        if since is not None:
+            query += " AND ts >= ?"
+            args.append(since)
+        query += " ORDER BY ts DESC, id DESC LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            rows = self.con.execute(query, args).fetchall()
+        return [{"ts": ts, "village_id": vid, "action": act, "data": data} for ts, vid, act, data in rows]
+
+    def latest(self, village_id=None, data_type=None):
+        """
+        Returns the last snapshots as {village_id: {data_type: data}}
+        """
+        query = "SELECT village_id, data_type, data FROM snapshots WHERE 1 = 1"
+        args = []
+        for column, value in (("village_id", village_id), ("data_type", data_type)):
+            if value is not None:
+                query += " AND %s = ?" % column
+                args.append(str(value))
+        with self.lock:
+            rows = self.con.execute(query, args).fetchall()
+        output = {}
+        for vid, dtype, data in rows:
+            try:
+                data = json.loads(data)
+            except (TypeError, ValueError):
+                pass
+            output.setdefault(vid, {})[dtype] = data
+        return output
+
+    def series(self, village_id, data_type, keys=None, since=None, until=None):
+        """
+        Returns {key: [[ts, value], ...]} sorted by time, ready to be charted
+        """
+        query = "SELECT ts, key, value FROM series WHERE village_id = ? AND data_type = ?"
+        args = [str(village_id), data_type]
+        if keys:
+            query += " AND key IN (%s)" % ", ".join("?" * len(keys))
+            args.extend(keys)
+        if since is not None:
+            query += " AND ts >= ?"
+            args.append(int(since))
+        if until is not None:
+            query += " AND ts <= ?"
+            args.append(int(until))
+        query += " ORDER BY ts"
+        with self.lock:
+            rows = self.con.execute(query, args).fetchall()
+        output = {}
+        for ts, key, value in rows:
+            output.setdefault(key, []).append([ts, value])
+        return output
+
+    def close(self):
+        with self.lock:
+            self.con.close()
+
+
+class SQLiteReporter(RemoteReporter):
+    """
+    Stores reports and data snapshots in a local SQLite database
+    Rows are buffered and written in one transaction per batch by a background thread.
+    """
+    # Seconds between two downsampling runs
+    downsample_interval = 3600
+
+    def __init__(self, max_batch=500, max_delay=10.0):
+        self.database = None
+        self.writer = None
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.last_downsample = 0
+
+    def report(self, connection, village_id, action, data):
+        """
+        Add a report entry
+        """
+        self.writer.put("log", (time.time(), str(village_id), action, str(data)))
+
+    def add_data(self, connection, village_id, data_type, data):
+        """
+        Add a data snapshot
+        """
+        self.writer.put("data", (time.time(), str(village_id), data_type, data))
+
+    def write_batch(self, batch):
+        self.database.write(
+            logs=[row for kind, row in batch if kind == "log"],
+            snapshots=[row for kind, row in batch if kind == "data"],
+        )
+        if time.time() - self.last_downsample >= self.downsample_interval:
+            self.last_downsample = time.time()
+            self.database.downsample()
+
+    def setup(self, connection):
+        """
+        Opens (and creates) the database
+        """
+        directory = os.path.dirname(connection)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.database = ReportDatabase(connection)
+        self.writer = BatchWriter(self.write_batch, max_batch=self.max_batch, max_delay=self.max_delay)
+        return True
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        if self.database:
+            self.database.close()
 
 
 class ReporterObject:
@@ -204,6 +619,12 @@ class ReporterObject:
             else:
                 self.logger.info("Unable to set-up MySQL logging, disabling!")
                 self.enabled = False
+        elif connection_string.startswith('sqlite://'):
+            outfile = connection_string.split("://")[1]
+            outfile = outfile.replace('{ts}', str(int(time.time())))
+            self.connection = FileManager.get_path(outfile)
+            self.object = SQLiteReporter()
+            self.object.setup(self.connection)
         elif connection_string.startswith('file://'):
             outfile = connection_string.split("://")[1]
             outfile = outfile.replace('{ts}', str(int(time.time())))
@@ -236,3 +657,10 @@ class ReporterObject:
         if self.enabled:
             return self.object.get_config(self.connection, village_id, action, data)
         return
+
+    def close(self):
+        """
+        Writes everything the reporter still has queued
+        """
+        if self.object:
+            self.object.close()
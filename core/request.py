@@ -2,10 +2,11 @@
 Class for using one generic cookie jar, emulating a single tab
 """
 
-import requests
-
+from core.connectivity import ConnectivityMonitor
 from core.filemanager import FileManager
 from core.notification import Notification
+from core.profiler import Profiler
+from core.tracing import Tracer
 
 import logging
 import re
@@ -34,12 +35,19 @@ class WebWrapper:
     auth_endpoint = None
     reporter = None
     delay = 1.0
+    # Connect / read timeout in seconds
+    timeout = (10, 60)
 
     def __init__(self, url, server=None, endpoint=None, reporter_enabled=False, reporter_constr=None):
         """
         Construct the session and detect variables
         """
+        import requests
+
         self.web = requests.session()
+        # Only failures of the connection itself count against the game server
+        self.transport_errors = (requests.ConnectionError, requests.Timeout)
+        self.connectivity = ConnectivityMonitor()
         self.auth_endpoint = url
         self.server = server
         self.endpoint = endpoint
@@ -66,15 +74,24 @@ class WebWrapper:
         Fetches a URL using a basic GET request
         """
         self.headers['Origin'] = (self.endpoint if self.endpoint else self.auth_endpoint).rstrip('/')
-        if not self.priority_mode:
-            time.sleep(random.randint(int(3 * self.delay), int(7 * self.delay)))
         url = urljoin(self.endpoint if self.endpoint else self.auth_endpoint, url)
+        if not self.connectivity.allow_request():
+            self.logger.debug("Skipping GET %s, the game server is unreachable", url)
+            return None
+        if not self.priority_mode:
+            with Profiler.activity("sleep"):
+                time.sleep(random.randint(int(3 * self.delay), int(7 * self.delay)))
         if not headers:
             headers = self.headers
         try:
-            res = self.web.get(url=url, headers=headers)
-            self.logger.debug("GET %s [%d]", url, res.status_code)
-            self.post_process(res)
+            with Tracer.span("http.get", url=url, requests=1) as span:
+                with Profiler.activity("network"):
+                    res = self.web.get(url=url, headers=headers, timeout=self.timeout)
+                self.record_outcome(res)
+                span.set(status_code=res.status_code, bytes=len(res.content or b""))
+                self.logger.debug("GET %s [%d]", url, res.status_code)
+                with Profiler.activity("parsing"):
+                    self.post_process(res)
             if 'data-bot-protect="forced"' in res.text:
                 self.logger.warning("Bot protection hit! cannot continue")
                 self.reporter.report(
@@ -85,30 +102,72 @@ class WebWrapper:
             return res
         except Exception as e:
             self.logger.warning("GET %s: %s", url, str(e))
+            if isinstance(e, self.transport_errors):
+                self.connectivity.record_failure(e)
             return None
 
     def post_url(self, url, data, headers=None):
         """
         Sends a basic POST request with urlencoded postdata
         """
-        if not self.priority_mode:
-            time.sleep(
-                random.randint(int(3 * self.delay), int(7 * self.delay))
-            )
         self.headers['Origin'] = (self.endpoint if self.endpoint else self.auth_endpoint).rstrip('/')
         url = urljoin(self.endpoint if self.endpoint else self.auth_endpoint, url)
+        if not self.connectivity.allow_request():
+            self.logger.debug("Skipping POST %s, the game server is unreachable", url)
+            return None
+        if not self.priority_mode:
+            with Profiler.activity("sleep"):
+                time.sleep(
+                    random.randint(int(3 * self.delay), int(7 * self.delay))
+                )
         enc = urlencode(data)
         if not headers:
             headers = self.headers
         try:
-            res = self.web.post(url=url, data=data, headers=headers)
-            self.logger.debug("POST %s %s [%d]", url, enc, res.status_code)
-            self.post_process(res)
+            with Tracer.span("http.post", url=url, requests=1) as span:
+                with Profiler.activity("network"):
+                    res = self.web.post(url=url, data=data, headers=headers, timeout=self.timeout)
+                self.record_outcome(res)
+                span.set(status_code=res.status_code, bytes=len(res.content or b""))
+                self.logger.debug("POST %s %s [%d]", url, enc, res.status_code)
+                with Profiler.activity("parsing"):
+                    self.post_process(res)
             return res
         except Exception as e:
             self.logger.warning("POST %s %s: %s", url, enc, str(e))
+            if isinstance(e, self.transport_errors):
+                self.connectivity.record_failure(e)
             return None
 
+    def record_outcome(self, response):
+        """
+        Feeds the connectivity monitor, server errors count as failures as well
+        """
+        if response.status_code >= 500:
+            self.connectivity.record_failure("HTTP %d" % response.status_code)
+        else:
+            self.connectivity.record_success()
+
+    def probe(self):
+        """
+        Checks whether the game server answers again, bypasses the circuit breaker and the random delay
+        """
+        url = urljoin(self.endpoint if self.endpoint else self.auth_endpoint, "game.php")
+        try:
+            res = self.web.get(url=url, headers=self.headers, timeout=self.timeout)
+        except Exception as e:
+            self.logger.debug("Probe %s: %s", url, str(e))
+            self.connectivity.last_error = str(e)
+            return False
+        return res.status_code < 500
+
+    def wait_for_connection(self):
+        """
+        Blocks until the game server can be reached again
+        """
+        with Profiler.activity("sleep"):
+            self.connectivity.wait_until_online(self.probe)
+
     def start(self, ):
         """
         Start the bot and verify whether the last session is still valid
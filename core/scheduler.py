@@ -0,0 +1,103 @@
+"""
+Priority queue of next-due times per village and task
+Used by the main loop to only wake the villages that have something to do
+"""
+import heapq
+import itertools
+import time
+
+
+class VillageScheduler:
+    """
+    Keeps the next due time for every (village, task) pair.
+    Outdated heap entries are skipped lazily when they are popped.
+    """
+    def __init__(self, min_interval=60):
+        # A village is never woken up more often than this (seconds)
+        self.min_interval = min_interval
+        self._heap = []
+        self._due = {}
+        self._counter = itertools.count()
+
+    def set_due(self, village_id, task, due):
+        """
+        Sets (or moves) the due time of a single task
+        """
+        self._due.setdefault(village_id, {})[task] = due
+        heapq.heappush(self._heap, (due, next(self._counter), village_id, task))
+
+    def update(self, village_id, due_times, fallback, now=None):
+        """
+        Replaces all tasks of a village after it has run
+        `fallback` is the latest time the village will be visited again, even when idle
+        """
+        if now is None:
+            now = time.time()
+        earliest = now + self.min_interval
+        self._due[village_id] = {}
+        for task, due in due_times.items():
+            if due is None:
+                continue
+            self.set_due(village_id, task, max(due, earliest))
+        self.set_due(village_id, "idle", max(fallback, earliest))
+
+    def remove(self, village_id):
+        self._due.pop(village_id, None)
+
+    def _is_current(self, entry):
+        due, _, village_id, task = entry
+        return self._due.get(village_id, {}).get(task) == due
+
+    def next_due(self):
+        """
+        Returns the earliest due time or None when nothing is scheduled
+        """
+        while self._heap and not self._is_current(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def seconds_until_next(self, now=None):
+        """
+        Returns the seconds until the next due task or None when nothing is scheduled
+        """
+        if now is None:
+            now = time.time()
+        due = self.next_due()
+        if due is None:
+            return None
+        return max(0.0, due - now)
+
+    def pop_due(self, now=None):
+        """
+        Returns {village_id: [tasks]} for everything that is due
+        The tasks are removed, a village has to be re-scheduled using update() after it ran
+        """
+        if now is None:
+            now = time.time()
+        output = {}
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if not self._is_current(entry):
+                continue
+            _, _, village_id, task = entry
+            del self._due[village_id][task]
+            output.setdefault(village_id, []).append(task)
+        return output
+
+    def requeue(self, due, now=None, skip=()):
+        """
+        Puts tasks returned by pop_due() back, for villages that did not get to run
+        """
+        if now is None:
+            now = time.time()
+        for village_id, tasks in due.items():
+            if village_id in skip:
+                continue
+            for task in tasks:
+                self.set_due(village_id, task, now)
+
+    def pending(self, village_id):
+        """
+        Returns the scheduled tasks for a village
+        """
+        return dict(self._due.get(village_id, {}))
@@ -0,0 +1,210 @@
+"""
+Runs one bot process per world / account and keeps them alive
+
+Every world gets its own home directory holding config.json, the cache and the session,
+the code and templates are shared with this install.
+
+Usage:
+    python -m core.supervisor worlds/nl01 worlds/en130
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import psutil
+
+from core.filemanager import FileManager
+
+
+class Worker:
+    """
+    A single bot process running from its own home directory
+    """
+    def __init__(self, home, name=None):
+        self.home = os.path.abspath(home)
+        self.name = name or os.path.basename(self.home.rstrip(os.sep))
+        self.process = None
+        self.started = None
+        self.restarts = 0
+        self.backoff = 0
+        self.restart_at = None
+        self.last_exit_code = None
+        self._ps = None
+
+    def command(self):
+        return [sys.executable, FileManager.get_install_path("twb.py"), "--home", self.home]
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def cycle_stats(self):
+        """
+        Reads the stats file the bot writes after every cycle
+        """
+        path = os.path.join(self.home, "cache", "worker.json")
+        try:
+            with open(path, "r", encoding="utf-8") as stats_file:
+                return json.load(stats_file)
+        except (OSError, ValueError):
+            return {}
+
+    def process_stats(self):
+        """
+        Returns the CPU and memory usage of the bot process
+        """
+        if not self.is_running():
+            return {}
+        try:
+            if not self._ps or self._ps.pid != self.process.pid:
+                self._ps = psutil.Process(self.process.pid)
+                # The first call always returns 0.0, it sets the starting point
+                self._ps.cpu_percent(None)
+            with self._ps.oneshot():
+                return {
+                    "cpu_percent": self._ps.cpu_percent(None),
+                    "cpu_time": sum(self._ps.cpu_times()[:2]),
+                    "memory_rss": self._ps.memory_info().rss,
+                }
+        except psutil.Error:
+            return {}
+
+
+class Supervisor:
+    """
+    Starts the workers, restarts crashed ones with an exponential backoff
+    and writes the stats of all workers to a single file
+    """
+    def __init__(self, homes, min_backoff=5, max_backoff=600, stable_after=300,
+                 stats_file="cache/supervisor.json", spawn=None):
+        self.workers = [Worker(home) for home in homes]
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        # A worker that ran this long before crashing starts over with the minimal backoff
+        self.stable_after = stable_after
+        self.stats_file = stats_file
+        self.spawn = spawn or self._spawn
+        self.should_run = True
+        self.logger = logging.getLogger("Supervisor")
+
+    @staticmethod
+    def _spawn(worker):
+        return subprocess.Popen(worker.command(), cwd=worker.home)
+
+    def start_worker(self, worker, now=None):
+        os.makedirs(worker.home, exist_ok=True)
+        worker.process = self.spawn(worker)
+        worker.started = now if now is not None else time.time()
+        worker.restart_at = None
+        self.logger.info("Started worker %s (pid %s)", worker.name, worker.process.pid)
+
+    def check_worker(self, worker, now=None):
+        """
+        Starts a worker that is not running or schedules the restart of a crashed one
+        """
+        if now is None:
+            now = time.time()
+        if worker.is_running():
+            return
+        if worker.process is not None and worker.restart_at is None:
+            worker.last_exit_code = worker.process.returncode
+            if now - worker.started >= self.stable_after:
+                worker.backoff = self.min_backoff
+            else:
+                worker.backoff = min(self.max_backoff, max(self.min_backoff, worker.backoff * 2))
+            worker.restart_at = now + worker.backoff
+            self.logger.warning(
+                "Worker %s exited with code %s, restarting in %d seconds",
+                worker.name, worker.last_exit_code, worker.backoff
+            )
+            return
+        if worker.restart_at is None or now >= worker.restart_at:
+            if worker.process is not None:
+                worker.restarts += 1
+            self.start_worker(worker, now=now)
+
+    def stats(self):
+        output = {}
+        for worker in self.workers:
+            output[worker.name] = {
+                "home": worker.home,
+                "running": worker.is_running(),
+                "pid": worker.process.pid if worker.is_running() else None,
+                "started": worker.started,
+                "restarts": worker.restarts,
+                "last_exit_code": worker.last_exit_code,
+                "restart_at": worker.restart_at,
+                "process": worker.process_stats(),
+                "cycle": worker.cycle_stats(),
+            }
+        return output
+
+    def write_stats(self):
+        try:
+            FileManager.save_json_file({"updated": int(time.time()), "workers": self.stats()}, self.stats_file)
+        except Exception as e:
+            self.logger.warning("Unable to write supervisor stats: %s", e)
+
+    def stop(self, *_):
+        self.should_run = False
+
+    def shutdown(self, timeout=30):
+        """
+        Stops all workers, killing the ones that do not exit in time
+        """
+        for worker in self.workers:
+            if worker.is_running():
+                worker.process.terminate()
+        deadline = time.time() + timeout
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.process.wait(timeout=max(0.0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+
+    def run(self, interval=1.0, stats_interval=10.0):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        next_stats = 0
+        try:
+            while self.should_run:
+                now = time.time()
+                for worker in self.workers:
+                    self.check_worker(worker, now=now)
+                if now >= next_stats:
+                    self.write_stats()
+                    next_stats = now + stats_interval
+                time.sleep(interval)
+        finally:
+            self.shutdown()
+            self.write_stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a bot process for every world directory")
+    parser.add_argument("homes", nargs="+", help="World directories, each holding its own config.json")
+    parser.add_argument("--min-backoff", type=int, default=5)
+    parser.add_argument("--max-backoff", type=int, default=600)
+    parser.add_argument("--stable-after", type=int, default=300)
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    for home in args.homes:
+        if not os.path.exists(os.path.join(home, "config.json")):
+            logging.warning("%s has no config.json yet, the worker will ask for one", home)
+    FileManager.create_directories(["cache"])
+    supervisor = Supervisor(args.homes, min_backoff=args.min_backoff, max_backoff=args.max_backoff,
+                            stable_after=args.stable_after)
+    supervisor.run(stats_interval=args.stats_interval)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -18,9 +18,9 @@ class TemplateManager:
         if isinstance(template, list):
             return template
 
-        path = f"templates/{category}/{template}.txt"
+        path = FileManager.get_install_path(f"templates/{category}/{template}.txt")
         if output_json:
-            json_path = f"templates/{category}/{template}.json"
+            json_path = FileManager.get_install_path(f"templates/{category}/{template}.json")
             if FileManager.path_exists(json_path):
                 return FileManager.load_json_file(json_path)
             try:
@@ -0,0 +1,261 @@
+"""
+Lightweight timing spans for the bot cycles
+
+Spans are opened around every village stage and every request of the WebWrapper.
+Finished spans are kept in a ring buffer, the request count and the transferred bytes
+of a span are added to its parent so every stage knows how many requests it made.
+
+When enabled the spans of every cycle are appended to cache/logs/traces.jsonl,
+one OpenTelemetry (OTLP/JSON) document per line, so they can be loaded by any OTel tool.
+
+Usage:
+    with Tracer.span("village.builder", village_id=vid) as span:
+        span.set(queued=2)
+
+    @Tracer.trace("planner.search")
+    def search(...):
+"""
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from core.filemanager import FileManager
+
+# These attributes are added to the parent span when a span ends
+ROLLUP_ATTRIBUTES = ("requests", "bytes")
+
+
+def _new_id(size):
+    return os.urandom(size).hex()
+
+
+class Span:
+    """
+    A single timed operation
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attributes", "start", "end_time", "error", "_tracer")
+
+    def __init__(self, tracer, name, parent=None, attributes=None):
+        self._tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else _new_id(16)
+        self.span_id = _new_id(8)
+        self.attributes = dict(attributes or {})
+        self.start = time.time_ns()
+        self.end_time = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    @property
+    def ended(self):
+        return self.end_time is not None
+
+    @property
+    def duration(self):
+        """
+        Duration in seconds, up to now for spans that are still open
+        """
+        return ((self.end_time or time.time_ns()) - self.start) / 1e9
+
+    def end(self):
+        if self.end_time is None:
+            self._tracer.end_span(self)
+
+    def to_otlp(self):
+        output = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end_time or self.start),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+        }
+        if self.parent:
+            output["parentSpanId"] = self.parent.span_id
+        if self.error:
+            output["status"] = {"code": 2, "message": self.error}
+        return output
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class _SpanContext(contextlib.ContextDecorator):
+    """
+    Context manager / decorator opening a span
+    """
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span = None
+
+    def _recreate_cm(self):
+        # Every call of a decorated function needs its own span
+        return _SpanContext(self.tracer, self.name, self.attributes)
+
+    def __enter__(self):
+        self.span = self.tracer.start_span(self.name, **self.attributes)
+        return self.span
+
+    def __exit__(self, exc_type, exc, _):
+        if exc_type is not None:
+            self.span.error = "%s: %s" % (exc_type.__name__, exc)
+        self.span.end()
+        return False
+
+
+class _Tracer:
+    """
+    Keeps the open spans of every thread and the last finished ones, use the module level Tracer object
+    """
+    def __init__(self, buffer_size=2000):
+        self.buffer = collections.deque(maxlen=buffer_size)
+        self.export_enabled = False
+        self.output_file = "cache/logs/traces.jsonl"
+        # The trace file is rotated once it grows larger than this
+        self.max_file_size = 5 * 1024 * 1024
+        self.logger = logging.getLogger("Tracer")
+        self._local = threading.local()
+        self._unexported = []
+        self._lock = threading.Lock()
+
+    def configure(self, export=None, buffer_size=None):
+        if export is not None:
+            self.export_enabled = export
+            if not export:
+                self._unexported = []
+        if buffer_size and buffer_size != self.buffer.maxlen:
+            self.buffer = collections.deque(self.buffer, maxlen=buffer_size)
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name, **attributes):
+        """
+        Opens a span as a child of the current one, it has to be closed with span.end()
+        """
+        span = Span(self, name, parent=self.current(), attributes=attributes)
+        self._stack().append(span)
+        return span
+
+    def end_span(self, span):
+        """
+        Closes a span together with the children that were left open
+        """
+        stack = self._stack()
+        if span in stack:
+            while stack:
+                top = stack.pop()
+                self._finish(top)
+                if top is span:
+                    break
+        else:
+            self._finish(span)
+
+    def _finish(self, span):
+        if span.end_time is not None:
+            return
+        span.end_time = time.time_ns()
+        parent = span.parent
+        if parent is not None and not parent.ended:
+            for key in ROLLUP_ATTRIBUTES:
+                if key in span.attributes:
+                    parent.attributes[key] = parent.attributes.get(key, 0) + span.attributes[key]
+        with self._lock:
+            self.buffer.append(span)
+            if self.export_enabled:
+                self._unexported.append(span)
+
+    def span(self, name, **attributes):
+        """
+        Context manager / decorator timing the enclosed block
+        """
+        return _SpanContext(self, name, attributes)
+
+    trace = span
+
+    def recent(self, name=None, limit=None):
+        """
+        Returns the finished spans from the ring buffer, newest last
+        """
+        with self._lock:
+            spans = [span for span in self.buffer if name is None or span.name == name]
+        return spans[-limit:] if limit else spans
+
+    @staticmethod
+    def summary(spans, prefix=""):
+        """
+        Sums duration, request count and bytes per span name (without prefix)
+        """
+        output = {}
+        for span in spans:
+            if not span.ended:
+                continue
+            name = span.name[len(prefix):] if prefix and span.name.startswith(prefix) else span.name
+            entry = output.setdefault(name, {"duration": 0.0, "requests": 0, "bytes": 0, "count": 0})
+            entry["duration"] = round(entry["duration"] + span.duration, 3)
+            entry["requests"] += span.attributes.get("requests", 0)
+            entry["bytes"] += span.attributes.get("bytes", 0)
+            entry["count"] += 1
+        return output
+
+    def to_otlp(self, spans):
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _otlp_attribute("service.name", "twb"),
+                    _otlp_attribute("process.pid", os.getpid()),
+                ]},
+                "scopeSpans": [{
+                    "scope": {"name": "twb"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+
+    def export(self):
+        """
+        Appends the spans finished since the last export to the trace file
+        """
+        with self._lock:
+            spans, self._unexported = self._unexported, []
+        if not spans:
+            return 0
+        try:
+            FileManager.create_directories([os.path.dirname(self.output_file)])
+            path = FileManager.get_path(self.output_file)
+            if os.path.exists(path) and os.path.getsize(path) > self.max_file_size:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(json.dumps(self.to_otlp(spans), separators=(",", ":")) + "\n")
+        except OSError as e:
+            self.logger.warning("Unable to write traces: %s", e)
+            return 0
+        return len(spans)
+
+
+Tracer = _Tracer()
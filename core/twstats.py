@@ -7,9 +7,6 @@ import logging
 import sys
 from collections import defaultdict
 
-import requests
-from pyquery import PyQuery as pq
-
 from core.filemanager import FileManager
 
 
@@ -48,6 +45,9 @@ class TwStats:
         """
         Detects building data from TWStats
         """
+        import requests
+        from pyquery import PyQuery as pq
+
         output = defaultdict(dict)
         for upgrade_building in self.max_levels:
             geturl = f"http://twstats.com/{world}/index.php?page=buildings&detail={upgrade_building}"
@@ -5,9 +5,10 @@ Update checking logic
 import json
 import os.path
 import time
-import requests
 import logging
 
+from core.filemanager import FileManager
+
 
 def check_update():
     """
@@ -20,16 +21,14 @@ def check_update():
         "config.example.json"
     )
 
-    get_local_config_version = os.path.join(
-        os.path.dirname(__file__),
-        "..",
-        "config.json"
-    )
+    get_local_config_version = FileManager.get_path("config.json")
     if os.path.exists(get_local_config_version):
         with open(get_local_config_version, "r", encoding="utf-8") as running_cf:
             parsed = json.load(fp=running_cf)
             if not parsed["bot"].get("check_update", False):
                 return
+    import requests
+
     with open(get_local_config_template_version, "r", encoding="utf-8") as local_cf:
         parsed = json.load(fp=local_cf)
         get_remote_version = requests.get(
@@ -1,11 +1,36 @@
 """
 This module contains the ActionGenerator class, which is responsible for
 generating all possible actions from a given GameState.
+
+Templates and costs are compiled once in `update_data` into small indexed
+structures, so `generate` (called in the planner's innermost loop) is a
+cheap lookup instead of re-parsing the raw templates.
 """
+import copy
 
 from game.gamestate import GameState
 from game.actions import BuildAction, RecruitAction, ResearchAction
 
+RECRUIT_BATCH = 10 # Recruit in batches of 10
+
+
+def _to_int(value):
+    """Converts a cost value from the game data, ignoring non-numeric values."""
+    if isinstance(value, bool):
+        return 0
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return 0
+
+
+def _compile_cost(raw):
+    """Returns a (cost dict, duration) pair holding only the resource costs."""
+    cost = {res: _to_int(raw.get(res, 0)) for res in ('wood', 'stone', 'iron', 'pop') if res in raw}
+    return cost, _to_int(raw.get('build_time', 0))
+
+
 class ActionGenerator:
     """
     Generates possible actions based on the current game state and templates.
@@ -17,27 +42,123 @@ class ActionGenerator:
         self.recruit_costs = {}
         self.research_costs = {}
 
+        # Compiled structures, rebuilt only when their source changes
+        self._sources = {}
+        self._build_targets = []      # [(building, highest target level)] in template order
+        self._build_costs = {}        # building -> (cost dict, build time)
+        self._build_actions = {}      # (building, level) -> BuildAction
+        self._recruit_actions = []    # [(required building, RecruitAction)]
+        self._research_targets = []   # [(unit, target level)]
+        self._research_actions = {}   # unit -> (ResearchAction, requirements)
+
     def update_data(self, building_templates, troop_templates, building_costs, recruit_costs, research_costs):
         """
         Updates the generator with the latest templates and costs.
+        Only the parts that actually changed are recompiled.
         """
+        sources = {
+            'building_templates': building_templates,
+            'troop_templates': troop_templates,
+            'building_costs': building_costs,
+            'recruit_costs': recruit_costs,
+            'research_costs': research_costs,
+        }
+        changed = {key for key, value in sources.items()
+                   if key not in self._sources or self._sources[key] != value}
+        # Keep a private copy so in-place changes of the caller's data are detected as well
+        for key in changed:
+            self._sources[key] = copy.deepcopy(sources[key])
+
         self.building_templates = building_templates
         self.troop_templates = troop_templates
         self.building_costs = building_costs
         self.recruit_costs = recruit_costs
         self.research_costs = research_costs
 
-    def generate(self, state: GameState):
+        if 'building_templates' in changed:
+            self._compile_build_template()
+        if 'building_costs' in changed:
+            self._compile_build_costs()
+        if changed & {'troop_templates', 'recruit_costs'}:
+            self._compile_recruit_actions()
+        if changed & {'troop_templates', 'research_costs'}:
+            self._compile_research_actions()
+
+    def _compile_build_template(self):
+        targets = {}
+        template_data = (self.building_templates or {}).get('template_data') or []
+        for item in template_data:
+            if not isinstance(item, str) or ":" not in item or item.startswith("#"):
+                continue
+            parts = item.split(":")
+            if len(parts) != 2:
+                continue
+            building, target_level_str = parts[0].strip(), parts[1].strip()
+            if not target_level_str.isdigit():
+                continue
+            targets[building] = max(targets.get(building, 0), int(target_level_str))
+        self._build_targets = list(targets.items())
+
+    def _compile_build_costs(self):
+        self._build_costs = {
+            building: _compile_cost(raw)
+            for building, raw in (self.building_costs or {}).items()
+            if isinstance(raw, dict)
+        }
+        self._build_actions = {}
+
+    def _compile_recruit_actions(self):
+        self._recruit_actions = []
+        seen = set()
+        template_data = (self.troop_templates or {}).get('template_data') or []
+        for entry in template_data:
+            if not isinstance(entry, dict) or 'build' not in entry:
+                continue
+            for building, units in entry['build'].items():
+                for unit in units:
+                    raw = (self.recruit_costs or {}).get(unit)
+                    if (building, unit) in seen or not isinstance(raw, dict):
+                        continue
+                    seen.add((building, unit))
+                    cost, unit_time = _compile_cost(raw)
+                    action = RecruitAction(unit, RECRUIT_BATCH, cost, unit_time * RECRUIT_BATCH)
+                    self._recruit_actions.append((building, action))
+
+    def _compile_research_actions(self):
+        targets = {}
+        template_data = (self.troop_templates or {}).get('template_data') or []
+        for entry in template_data:
+            if not isinstance(entry, dict) or 'upgrades' not in entry:
+                continue
+            for unit, target_level in entry['upgrades'].items():
+                targets[unit] = max(targets.get(unit, 0), target_level)
+        self._research_targets = list(targets.items())
+
+        self._research_actions = {}
+        available = (self.research_costs or {}).get('available', {})
+        for unit, target_level in self._research_targets:
+            if unit not in available:
+                continue
+            cost, _ = _compile_cost(available[unit])
+            cost.pop('pop', None)
+            requirements = tuple(available[unit].get('requirements', {}).items())
+            self._research_actions[unit] = (ResearchAction(unit, target_level, cost), requirements)
+
+    def generate(self, state: GameState, affordable_only=True):
         """
         Generates a list of all possible actions.
+        With affordable_only disabled the actions that still need resources are
+        included as well, which is used to schedule actions ahead of time.
         """
         actions = []
-        actions.extend(self._generate_build_actions(state))
-        actions.extend(self._generate_recruit_actions(state))
-        actions.extend(self._generate_research_actions(state))
+        actions.extend(self._generate_build_actions(state, affordable_only))
+        actions.extend(self._generate_recruit_actions(state, affordable_only))
+        actions.extend(self._generate_research_actions(state, affordable_only))
         return actions
 
-    def _can_afford(self, state: GameState, cost):
+    def _can_afford(self, state: GameState, cost, affordable_only=True):
+        if not affordable_only:
+            return True
         return (state.resources['wood'] >= cost.get('wood', 0) and
                 state.resources['stone'] >= cost.get('stone', 0) and
                 state.resources['iron'] >= cost.get('iron', 0))
@@ -46,71 +167,45 @@ class ActionGenerator:
         """
         Checks if the prerequisites for researching a unit are met.
         """
-        if self.research_costs and unit in self.research_costs.get('available', {}):
-            prerequisites = self.research_costs['available'][unit].get('requirements', {})
-            for building, required_level in prerequisites.items():
-                if state.building_levels.get(building, 0) < required_level:
-                    return False
-            return True
-        return False
+        compiled = self._research_actions.get(unit)
+        if not compiled:
+            return False
+        for building, required_level in compiled[1]:
+            if state.building_levels.get(building, 0) < required_level:
+                return False
+        return True
 
-    def _generate_build_actions(self, state: GameState):
+    def _generate_build_actions(self, state: GameState, affordable_only=True):
         build_actions = []
-        if not self.building_templates or 'template_data' not in self.building_templates:
-            return build_actions
-
-        template_data = self.building_templates['template_data']
-        for item in template_data:
-            if ":" not in item or item.startswith("#"):
-                continue
-            parts = item.split(":")
-            if len(parts) != 2:
+        for building, target_level in self._build_targets:
+            current_level = state.building_levels.get(building, 0)
+            if current_level >= target_level or building not in self._build_costs:
                 continue
-            building, target_level_str = parts
-            building = building.strip()
-            if not target_level_str.isdigit():
+            cost, build_time = self._build_costs[building]
+            if not self._can_afford(state, cost, affordable_only):
                 continue
-            target_level = int(target_level_str)
-            current_level = state.building_levels.get(building, 0)
-            if current_level < target_level:
-                if building in self.building_costs:
-                    cost_str = self.building_costs[building]
-                    cost = {k: int(v) for k, v in cost_str.items() if str(v).isdigit()}
-                    if self._can_afford(state, cost):
-                        build_actions.append(BuildAction(building, current_level + 1, cost))
+            key = (building, current_level + 1)
+            action = self._build_actions.get(key)
+            if action is None:
+                action = self._build_actions[key] = BuildAction(building, current_level + 1, cost, build_time)
+            build_actions.append(action)
         return build_actions
 
-    def _generate_recruit_actions(self, state: GameState):
-        recruit_actions = []
-        if not self.troop_templates or 'template_data' not in self.troop_templates:
-            return recruit_actions
+    def _generate_recruit_actions(self, state: GameState, affordable_only=True):
+        return [
+            action for building, action in self._recruit_actions
+            if state.building_levels.get(building, 0) > 0
+            and self._can_afford(state, action.cost(), affordable_only)
+        ]
 
-        template_data = self.troop_templates['template_data']
-        for entry in template_data:
-            if 'build' in entry:
-                for building, units in entry['build'].items():
-                    if state.building_levels.get(building, 0) > 0:
-                        for unit, amount in units.items():
-                            if unit in self.recruit_costs:
-                                cost = self.recruit_costs[unit]
-                                if self._can_afford(state, cost):
-                                    recruit_actions.append(RecruitAction(unit, 10, cost)) # Recruit in batches of 10
-        return recruit_actions
-
-    def _generate_research_actions(self, state: GameState):
+    def _generate_research_actions(self, state: GameState, affordable_only=True):
         research_actions = []
-        if not self.troop_templates or 'template_data' not in self.troop_templates:
+        if state.building_levels.get('smith', 0) <= 0:
             return research_actions
-
-        if state.building_levels.get('smith', 0) > 0:
-            template_data = self.troop_templates['template_data']
-            for entry in template_data:
-                if 'upgrades' in entry:
-                    for unit, target_level in entry['upgrades'].items():
-                        current_level = state.research_levels.get(unit, 0)
-                        if target_level > current_level:
-                            if self.research_costs and unit in self.research_costs.get('available', {}):
-                                cost = self.research_costs['available'][unit]
-                                if self._can_afford(state, cost) and self._are_prerequisites_met(state, unit):
-                                    research_actions.append(ResearchAction(unit, target_level, cost))
+        for unit, target_level in self._research_targets:
+            if target_level <= state.research_levels.get(unit, 0) or unit not in self._research_actions:
+                continue
+            action = self._research_actions[unit][0]
+            if self._can_afford(state, action.cost(), affordable_only) and self._are_prerequisites_met(state, unit):
+                research_actions.append(action)
         return research_actions
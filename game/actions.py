@@ -2,12 +2,14 @@
 This module defines the action space for the TWB bot. Each action is
 represented by a class that encapsulates the action's name, any relevant
 parameters, and a method to calculate its cost.
+Actions also carry their duration in seconds, used by the timeline simulator.
 """
 
 class Action:
     """Base class for all actions."""
-    def __init__(self, name):
+    def __init__(self, name, duration=0):
         self.name = name
+        self.duration = duration
 
     def __repr__(self):
         return f"<Action: {self.name}>"
@@ -19,8 +21,8 @@ class Action:
 
 class BuildAction(Action):
     """Represents a building construction or upgrade action."""
-    def __init__(self, building, level, cost_data):
-        super().__init__(f"Build {building} to level {level}")
+    def __init__(self, building, level, cost_data, duration=0):
+        super().__init__(f"Build {building} to level {level}", duration)
         self.building = building
         self.level = level
         self._cost = cost_data
@@ -31,8 +33,8 @@ class BuildAction(Action):
 
 class RecruitAction(Action):
     """Represents a troop recruitment action."""
-    def __init__(self, unit, amount, cost_data):
-        super().__init__(f"Recruit {amount} of {unit}")
+    def __init__(self, unit, amount, cost_data, duration=0):
+        super().__init__(f"Recruit {amount} of {unit}", duration)
         self.unit = unit
         self.amount = amount
         self._cost = {
@@ -48,8 +50,8 @@ class RecruitAction(Action):
 
 class ResearchAction(Action):
     """Represents a research action."""
-    def __init__(self, unit, level, cost_data):
-        super().__init__(f"Research {unit} to level {level}")
+    def __init__(self, unit, level, cost_data, duration=0):
+        super().__init__(f"Research {unit} to level {level}", duration)
         self.unit = unit
         self.level = level
         self._cost = cost_data
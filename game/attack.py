@@ -13,6 +13,7 @@ from datetime import timedelta
 
 from core.extractors import Extractor
 from core.filemanager import FileManager
+from game.farm_optimizer import UNIT_CARRY
 
 
 class AttackManager:
@@ -187,6 +188,42 @@ class AttackManager:
         self.targets = sorted(output, key=lambda x: x[1])
         return self.targets
 
+    def has_farm_troops(self):
+        """
+        Checks if units that can carry loot are at home
+        """
+        if not self.troopmanager or not self.troopmanager.can_attack:
+            return False
+        return any(
+            UNIT_CARRY.get(unit, 0) > 0 and int(amount or 0) > 0
+            for unit, amount in (self.troopmanager.troops or {}).items()
+        )
+
+    def next_farm_time(self):
+        """
+        Returns the timestamp at which the first of the closest farm targets can be attacked again
+        None while no farm can be sent, the troops are out and the village is woken by its other timers
+        """
+        if not self.has_farm_troops():
+            return None
+        next_time = None
+        for village, _ in list(self.targets)[:self.max_farms]:
+            cache_entry = AttackCache.get_cache(village["id"])
+            if not cache_entry or not cache_entry.get("last_attack"):
+                # Never attacked, can be farmed (or scouted) right away
+                return int(time.time())
+            if not cache_entry.get("safe", True):
+                continue
+            wait = self.farm_default_wait
+            if cache_entry.get("high_profile"):
+                wait = self.farm_high_prio_wait
+            if cache_entry.get("low_profile"):
+                wait = self.farm_low_prio_wait
+            eligible = cache_entry["last_attack"] + wait
+            if next_time is None or eligible < next_time:
+                next_time = eligible
+        return next_time
+
     def attacked(self, vid, scout=False, high_profile=False, safe=True, low_profile=False):
         """
         The farm was sent and this is a callback on what happened
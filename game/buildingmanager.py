@@ -57,6 +57,8 @@ class BuildingManager:
         """
         game_state_model.building_levels = self.levels
         game_state_model.building_queue = self.waits_building
+        now = time.time()
+        game_state_model.building_queue_times = [w - now for w in self.waits if w > now]
 
     def create_update_links(self, extracted_buildings):
         """
@@ -222,6 +224,36 @@ class BuildingManager:
             self.last_status = f"Waiting for resources to build {build_item['name'].title()}..."
         return r
 
+    def dirty_inputs(self, overview_game_data, resources):
+        """
+        The inputs a builder run depends on, the run is skipped when these did not change
+        Resources are reduced to the buildings that are affordable, which only changes when a threshold is crossed
+        """
+        village = (overview_game_data or {}).get("village", {})
+        affordable = []
+        for building, data in (self.costs or {}).items():
+            if not isinstance(data, dict):
+                continue
+            if all(resources.get(res, 0) >= int(data.get(res, 0) or 0) for res in ("wood", "stone", "iron")):
+                affordable.append(building)
+        now = time.time()
+        return {
+            "levels": village.get("buildings"),
+            "farm_space": village.get("pop_max", 0) - village.get("pop", 0) > 0,
+            "queue": len([w for w in self.waits if w > now]),
+            "affordable": sorted(affordable),
+            "template": self.raw_template,
+            "max_queue_len": self.max_queue_len,
+        }
+
+    def next_due_time(self):
+        """
+        Returns the timestamp at which the next queued building finishes
+        """
+        now = time.time()
+        pending = [w for w in self.waits if w > now]
+        return min(pending) if pending else None
+
     def get_level(self, building):
         return self.levels.get(building, 0)
 
@@ -2,6 +2,7 @@ import json
 import logging
 import random
 import re
+import time
 
 from core.extractors import Extractor
 
@@ -45,6 +46,9 @@ class DefenceManager:
 
     _sf_logged = False
 
+    # Seconds between checks while an attack is incoming
+    under_attack_recheck = 120
+
     supported = []
 
     def __init__(self, village_id=None, wrapper=None):
@@ -52,6 +56,14 @@ class DefenceManager:
         self.wrapper = wrapper
         self.logger = logging.getLogger("Defence Manager")
 
+    def next_due_time(self):
+        """
+        Returns when the village should be checked again because of an incoming attack
+        """
+        if self.under_attack:
+            return time.time() + self.under_attack_recheck
+        return None
+
     def support_other(self, requesting_village):
 
         if self.under_attack or not self.allow_support_send:
@@ -6,6 +6,13 @@ and historical report information.
 import logging
 import math
 
+# Resources a single unit can carry
+UNIT_CARRY = {
+    'spear': 25, 'sword': 15, 'axe': 10, 'archer': 10,
+    'spy': 0, 'light': 80, 'marcher': 50, 'heavy': 50,
+    'ram': 0, 'catapult': 0, 'knight': 100, 'snob': 0
+}
+
 class FarmOptimizer:
     """
     Optimizes farming operations to maximize resource income per hour.
@@ -135,11 +142,7 @@ class FarmOptimizer:
         }
 
     def _get_unit_carry_capacity(self):
-        return {
-            'spear': 25, 'sword': 15, 'axe': 10, 'archer': 10,
-            'spy': 0, 'light': 80, 'marcher': 50, 'heavy': 50,
-            'ram': 0, 'catapult': 0, 'knight': 100, 'snob': 0
-        }
+        return dict(UNIT_CARRY)
 
     def calculate_marginal_income(self, available_troops, targets):
         """
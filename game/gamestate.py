@@ -4,6 +4,8 @@ model for all information related to a single village. It is designed to be
 populated by various manager classes and then used by an optimizing agent to
 make decisions.
 """
+import copy
+
 
 class GameState:
     """
@@ -30,6 +32,7 @@ class GameState:
         # --- Buildings ---
         self.building_levels = {}
         self.building_queue = []
+        self.building_queue_times = [] # Seconds until each queued build finishes
 
         # --- Troops ---
         self.troop_counts = {}
@@ -49,5 +52,25 @@ class GameState:
         # --- AI Planner State ---
         self.last_action = None # The action that led to this state
 
+    def clone(self):
+        """
+        Returns a copy of this state for simulation purposes.
+        Only the mutable containers are copied, which is considerably cheaper
+        than a deepcopy inside the planner loops.
+        """
+        new_state = copy.copy(self)
+        new_state.resources = dict(self.resources)
+        new_state.resource_income = dict(self.resource_income)
+        new_state.building_levels = dict(self.building_levels)
+        new_state.building_queue = list(self.building_queue)
+        new_state.building_queue_times = list(self.building_queue_times)
+        new_state.troop_counts = dict(self.troop_counts)
+        new_state.units_in_village = dict(self.units_in_village)
+        new_state.units_outside_village = dict(self.units_outside_village)
+        new_state.research_levels = dict(self.research_levels)
+        new_state.troop_queue = dict(self.troop_queue)
+        new_state.flags = dict(self.flags)
+        return new_state
+
     def __repr__(self):
         return f"<GameState for Village {self.village_id} at {self.timestamp}>"
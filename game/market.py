@@ -0,0 +1,169 @@
+"""
+Offers of other players on the market, read once per cycle
+
+The other_offer page of a village is parsed once into an index of the offers by
+(offered, wanted) resource, sorted by ratio and distance. Matching a surplus to an
+offer is then a lookup instead of loading and parsing the page again.
+
+Usage (benchmark with recorded pages):
+    python -m game.market tests/mock_data/market_other_offer.html --repeat 200
+"""
+import argparse
+import glob
+import json
+import re
+import sys
+import time
+
+OFFER_ROW = re.compile(r"(?:<!-- insert the offer -->\n+)\s+<tr>(.*?)<\/tr>", re.S | re.M)
+OFFER_RESOURCE = re.compile(r"<span class=\"icon header (.+?)\".+?>(.+?)</td>")
+OFFER_ID = re.compile(r"<input type=\"hidden\" name=\"id\" value=\"(\d+)")
+OFFER_DURATION = re.compile(r"<td>\s*(\d+):(\d{2}):(\d{2})\s*</td>")
+INCOMING = re.compile(r"Aankomend:\s.+\"icon header (.+?)\".+?<\/span>(.+) ", re.M)
+
+RESOURCES = ("wood", "stone", "iron")
+
+
+def parse_amount(text):
+    digits = "".join(s for s in text if s.isdigit())
+    return int(digits) if digits else 0
+
+
+def parse_offer(row):
+    """
+    Parses an offer row, returns None for offers we can not accept (no id)
+    """
+    offer_id = OFFER_ID.findall(row)
+    resources = OFFER_RESOURCE.findall(row)
+    if not offer_id or len(resources) < 2:
+        return None
+    (offered, offer_amount), (wanted, wanted_amount) = resources[:2]
+    offer_amount = parse_amount(offer_amount)
+    wanted_amount = parse_amount(wanted_amount)
+    if not offer_amount:
+        return None
+    duration = OFFER_DURATION.search(row)
+    return {
+        "id": offer_id[0],
+        "offered": offered.strip(),
+        "offer_amount": offer_amount,
+        "wanted": wanted.strip(),
+        "wanted_amount": wanted_amount,
+        # What we pay per resource we get, lower is better
+        "ratio": wanted_amount / offer_amount,
+        # Travel time of the merchants in seconds, unknown offers go last
+        "duration": int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + int(duration.group(3))
+        if duration else sys.maxsize,
+    }
+
+
+def parse_incoming(html):
+    incoming = {}
+    found = INCOMING.findall(html)
+    if found:
+        incoming[found[0][0].strip()] = parse_amount(found[0][1])
+    return incoming
+
+
+class OfferIndex:
+    def __init__(self, offers=(), incoming=None):
+        self.incoming = incoming or {}
+        # (offered, wanted) -> offers, best ratio first and the nearest of equal ratios
+        self.offers = {}
+        for offer in offers:
+            self.offers.setdefault((offer["offered"], offer["wanted"]), []).append(offer)
+        for bucket in self.offers.values():
+            bucket.sort(key=lambda offer: (offer["ratio"], offer["duration"]))
+
+    @classmethod
+    def from_html(cls, html):
+        offers = [offer for offer in map(parse_offer, OFFER_ROW.findall(html)) if offer]
+        return cls(offers, parse_incoming(html))
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.offers.values())
+
+    def match(self, offered, wanted, min_amount, max_wanted):
+        """
+        Best offer giving at least `min_amount` of `offered` for at most `max_wanted` of `wanted`
+        """
+        for offer in self.offers.get((offered, wanted), ()):
+            if offer["offer_amount"] >= min_amount and offer["wanted_amount"] <= max_wanted:
+                return offer
+        return None
+
+    def remove(self, offer):
+        bucket = self.offers.get((offer["offered"], offer["wanted"]))
+        if bucket and offer in bucket:
+            bucket.remove(offer)
+
+
+def lookups(index, amounts=(250, 1000, 5000)):
+    # Every resource pair at a few amounts, what a cycle of manage_market can ask for
+    for offered in RESOURCES:
+        for wanted in RESOURCES:
+            if offered != wanted:
+                for amount in amounts:
+                    yield offered, wanted, amount, amount * 2
+
+
+def run_benchmark(pages, repeat=100):
+    """
+    Compares parsing the page for every check (as every check used to load the page)
+    with parsing it once and looking the checks up in the index
+    """
+    checks = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            for offered, wanted, amount, max_wanted in lookups(OfferIndex()):
+                OfferIndex.from_html(html).match(offered, wanted, amount, max_wanted)
+                checks += 1
+    per_check = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            index = OfferIndex.from_html(html)
+            for offered, wanted, amount, max_wanted in lookups(index):
+                index.match(offered, wanted, amount, max_wanted)
+    indexed = time.perf_counter() - started
+
+    offers = sum(len(OfferIndex.from_html(html)) for html in pages)
+    return {
+        "pages": len(pages),
+        "offers": offers,
+        "checks": checks,
+        "page_loads": {"per_check": checks, "indexed": len(pages) * repeat},
+        "ms": {"per_check": round(per_check * 1000, 3), "indexed": round(indexed * 1000, 3)},
+        "speedup": round(per_check / indexed, 1) if indexed else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the market offer index on recorded other_offer pages")
+    parser.add_argument("pages", nargs="+", help="Recorded pages (glob patterns are expanded)")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args(argv)
+
+    pages = []
+    for pattern in args.pages:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, "r", encoding="utf-8") as f:
+                pages.append(f.read())
+
+    result = run_benchmark(pages, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print("%d pages, %d offers, %d checks" % (result["pages"], result["offers"], result["checks"]))
+        print("Page loads: per check %d  indexed %d" % (
+            result["page_loads"]["per_check"], result["page_loads"]["indexed"]))
+        print("Parse + match (ms): per check %.1f  indexed %.1f  (x%s)" % (
+            result["ms"]["per_check"], result["ms"]["indexed"], result["speedup"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Small min-cost flow solver (primal-dual successive shortest paths)
+
+Every phase runs Dijkstra on the reduced costs, updates the node potentials and then pushes a
+blocking flow over all arcs that are now on a shortest path (reduced cost 0), so paths of the
+same length are augmented together. With integer costs the amount of phases is bounded by the
+amount of distinct path lengths.
+
+Potentials are kept between runs, so sinks and nodes can be added while the flow is built up
+as long as they get a potential that keeps every residual arc at a non-negative reduced cost
+(see entry_potential).
+"""
+import heapq
+
+INF = float("inf")
+
+
+class MinCostFlow:
+    def __init__(self):
+        # Edge e goes to `head[e]`, its reverse edge is e ^ 1
+        self.head = []
+        self.cap = []
+        self.cost = []
+        # node -> outgoing edge indices
+        self.edges = []
+        self.potential = []
+
+    def add_node(self, potential=0):
+        self.edges.append([])
+        self.potential.append(potential)
+        return len(self.edges) - 1
+
+    def add_edge(self, u, v, cap, cost):
+        """
+        Adds an arc u -> v with an integer cost, returns its index
+        """
+        index = len(self.head)
+        self.head += [v, u]
+        self.cap += [cap, 0]
+        self.cost += [cost, -cost]
+        self.edges[u].append(index)
+        self.edges[v].append(index + 1)
+        return index
+
+    def flow(self, edge):
+        return self.cap[edge ^ 1]
+
+    def entry_potential(self, sources):
+        """
+        Potential for a new node that is only entered through arcs (from, cost) in `sources`
+        """
+        return min((self.potential[u] + cost for u, cost in sources), default=0)
+
+    def _update_potentials(self, s, t):
+        """
+        Dijkstra on the reduced costs, returns False when t can not be reached
+        """
+        head, cap, cost, edges, potential = self.head, self.cap, self.cost, self.edges, self.potential
+        dist = [INF] * len(edges)
+        dist[s] = 0
+        queue = [(0, s)]
+        while queue:
+            d, u = heapq.heappop(queue)
+            if d > dist[u]:
+                continue
+            pu = potential[u] + d
+            for e in edges[u]:
+                if cap[e] > 0:
+                    v = head[e]
+                    nd = pu + cost[e] - potential[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        heapq.heappush(queue, (nd, v))
+        limit = dist[t]
+        if limit == INF:
+            return False
+        # Nodes further away than t are moved as far as t, the reduced costs stay non-negative
+        for v, d in enumerate(dist):
+            potential[v] += d if d < limit else limit
+        return True
+
+    def _blocking_flow(self, s, t):
+        """
+        Dinic on the arcs with a reduced cost of 0, returns (flow, cost)
+        """
+        head, cap, cost, edges, potential = self.head, self.cap, self.cost, self.edges, self.potential
+        total_flow = total_cost = 0
+        while True:
+            level = [-1] * len(edges)
+            level[s] = 0
+            frontier = [s]
+            while frontier and level[t] < 0:
+                following = []
+                for u in frontier:
+                    pu = potential[u]
+                    next_level = level[u] + 1
+                    for e in edges[u]:
+                        v = head[e]
+                        if level[v] < 0 and cap[e] > 0 and cost[e] + pu == potential[v]:
+                            level[v] = next_level
+                            following.append(v)
+                frontier = following
+            if level[t] < 0:
+                return total_flow, total_cost
+            pointer = [0] * len(edges)
+            while True:
+                # Iterative DFS along the level graph
+                path = []
+                u = s
+                while u != t:
+                    adjacent = edges[u]
+                    pu = potential[u]
+                    next_level = level[u] + 1
+                    i = pointer[u]
+                    while i < len(adjacent):
+                        e = adjacent[i]
+                        v = head[e]
+                        if level[v] == next_level and cap[e] > 0 and cost[e] + pu == potential[v]:
+                            break
+                        i += 1
+                    pointer[u] = i
+                    if i == len(adjacent):
+                        if not path:
+                            break
+                        # Dead end, never tried again in this level graph
+                        level[u] = -1
+                        e = path.pop()
+                        u = head[e ^ 1]
+                        pointer[u] += 1
+                        continue
+                    path.append(adjacent[i])
+                    u = head[adjacent[i]]
+                if u != t:
+                    break
+                amount = min(cap[e] for e in path)
+                for e in path:
+                    cap[e] -= amount
+                    cap[e ^ 1] += amount
+                    total_cost += amount * cost[e]
+                total_flow += amount
+
+    def run(self, s, t):
+        """
+        Sends as much as possible from s to t at the lowest cost, returns (flow, cost)
+        """
+        total_flow = total_cost = 0
+        while self._update_potentials(s, t):
+            amount, spent = self._blocking_flow(s, t)
+            if not amount:
+                break
+            total_flow += amount
+            total_cost += spent
+        return total_flow, total_cost
@@ -0,0 +1,259 @@
+"""
+Records the planner inputs of every cycle and replays them through a planner
+to measure plan latency, allocations and plan quality outside a live run.
+
+Snapshots are stored as length-prefixed, zlib compressed JSON frames so a
+recording can be appended to cheaply and read back as a stream.
+
+Usage:
+    python -m game.planner_replay cache/planner/*.twbr --planner beam --time-budget 0.1
+"""
+import argparse
+import glob
+import importlib
+import json
+import logging
+import os
+import statistics
+import struct
+import sys
+import time
+import tracemalloc
+import zlib
+
+from game.action_generator import ActionGenerator
+from game.actions import RecruitAction
+from game.gamestate import GameState
+from game.solver import MultiActionPlanner, BeamSearchPlanner, evaluate_state
+
+FRAME_HEADER = struct.Struct("<I")
+
+PLANNERS = {
+    "greedy": MultiActionPlanner,
+    "beam": BeamSearchPlanner,
+}
+
+
+def state_to_dict(state: GameState):
+    """
+    Converts a GameState to plain data, the planner-only attributes are left out.
+    """
+    data = {key: value for key, value in vars(state).items() if key != "last_action"}
+    data["village_id"] = str(state.village_id)
+    return data
+
+
+def state_from_dict(data):
+    """
+    Re-creates a GameState from plain data created by state_to_dict.
+    """
+    state = GameState(village_id=data.get("village_id"))
+    for key, value in data.items():
+        setattr(state, key, value)
+    state.last_action = None
+    return state
+
+
+class PlannerRecorder:
+    """
+    Appends planner snapshots to a recording file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.logger = logging.getLogger("PlannerRecorder")
+
+    def record(self, game_state, building_templates, troop_templates, building_costs,
+               recruit_costs, research_costs, marginal_incomes):
+        """
+        Writes a single snapshot, errors are logged and never interrupt the bot.
+        """
+        snapshot = {
+            "ts": time.time(),
+            "state": state_to_dict(game_state),
+            "building_templates": building_templates,
+            "troop_templates": troop_templates,
+            "building_costs": building_costs,
+            "recruit_costs": recruit_costs,
+            "research_costs": research_costs,
+            "marginal_incomes": marginal_incomes,
+        }
+        try:
+            payload = zlib.compress(json.dumps(snapshot, separators=(",", ":"), default=str).encode("utf-8"))
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "ab") as recording:
+                recording.write(FRAME_HEADER.pack(len(payload)))
+                recording.write(payload)
+            return True
+        except (OSError, TypeError, ValueError) as e:
+            self.logger.warning("Unable to record planner snapshot: %s", e)
+            return False
+
+
+def read_snapshots(path):
+    """
+    Yields all snapshots stored in a recording file, a truncated last frame is ignored.
+    """
+    with open(path, "rb") as recording:
+        while True:
+            header = recording.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            (length,) = FRAME_HEADER.unpack(header)
+            payload = recording.read(length)
+            if len(payload) < length:
+                return
+            yield json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def plan_value(initial_state, plan, marginal_incomes, planner):
+    """
+    Scores a plan the same way for every planner: the heuristic value of the
+    final state plus the marginal income of all recruited units.
+    """
+    state = initial_state.clone()
+    income = 0.0
+    for action in plan:
+        state = planner._simulate_action(state, action)
+        if isinstance(action, RecruitAction):
+            income += marginal_incomes.get(action.unit, 0) * action.amount
+    state.last_action = None
+    return evaluate_state(state, {}) + income
+
+
+def percentile(values, pct):
+    """
+    Returns the nearest-rank percentile of a list of values.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def load_planner_class(name):
+    """
+    Returns a planner class by short name or by a module:Class path.
+    """
+    if name in PLANNERS:
+        return PLANNERS[name]
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def run_benchmark(snapshots, planner_factory, max_actions=None, measure_allocations=True):
+    """
+    Replays snapshots through a planner.
+    planner_factory gets an ActionGenerator and returns the planner to test.
+    max_actions is passed to plan_actions only when set, so planners keep their own limit otherwise.
+    """
+    plan_args = (max_actions,) if max_actions is not None else ()
+    latencies = []
+    scores = []
+    plan_lengths = []
+    peak_allocations = []
+
+    for snapshot in snapshots:
+        generator = ActionGenerator()
+        generator.update_data(
+            building_templates=snapshot.get("building_templates") or {},
+            troop_templates=snapshot.get("troop_templates") or {},
+            building_costs=snapshot.get("building_costs") or {},
+            recruit_costs=snapshot.get("recruit_costs") or {},
+            research_costs=snapshot.get("research_costs") or {},
+        )
+        planner = planner_factory(generator)
+        state = state_from_dict(snapshot["state"])
+        marginal_incomes = snapshot.get("marginal_incomes") or {}
+
+        started = time.perf_counter()
+        plan = planner.plan_actions(state, marginal_incomes, *plan_args)
+        latencies.append(time.perf_counter() - started)
+
+        if measure_allocations:
+            tracemalloc.start()
+            planner.plan_actions(state, marginal_incomes, *plan_args)
+            peak_allocations.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        scores.append(plan_value(state, plan, marginal_incomes, planner))
+        plan_lengths.append(len(plan))
+
+    return {
+        "snapshots": len(latencies),
+        "latency_ms": {
+            "p50": percentile(latencies, 50) * 1000,
+            "p90": percentile(latencies, 90) * 1000,
+            "p99": percentile(latencies, 99) * 1000,
+            "max": max(latencies) * 1000 if latencies else 0.0,
+            "total": sum(latencies) * 1000,
+        },
+        "peak_alloc_kb": {
+            "p50": percentile(peak_allocations, 50) / 1024,
+            "max": max(peak_allocations) / 1024 if peak_allocations else 0.0,
+        },
+        "score": {
+            "mean": statistics.mean(scores) if scores else 0.0,
+            "total": sum(scores),
+        },
+        "mean_plan_length": statistics.mean(plan_lengths) if plan_lengths else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded planner snapshots and benchmark a planner")
+    parser.add_argument("recordings", nargs="+", help="Recording files (glob patterns are expanded)")
+    parser.add_argument("--planner", default="greedy", help="greedy, beam or module:Class")
+    parser.add_argument("--beam-width", type=int, default=4)
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--time-budget", type=float, default=0.25)
+    parser.add_argument("--max-actions", type=int, default=None,
+                        help="Max plan length (default: the planner's own limit, --max-depth for beam)")
+    parser.add_argument("--limit", type=int, default=0, help="Max amount of snapshots to replay")
+    parser.add_argument("--no-alloc", action="store_true", help="Skip the allocation measurement")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args(argv)
+
+    planner_class = load_planner_class(args.planner)
+
+    def planner_factory(generator):
+        if issubclass(planner_class, BeamSearchPlanner):
+            return planner_class(generator, beam_width=args.beam_width,
+                                 max_depth=args.max_depth, time_budget=args.time_budget)
+        return planner_class(generator)
+
+    files = []
+    for pattern in args.recordings:
+        files.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    snapshots = []
+    for path in files:
+        for snapshot in read_snapshots(path):
+            snapshots.append(snapshot)
+            if args.limit and len(snapshots) >= args.limit:
+                break
+        if args.limit and len(snapshots) >= args.limit:
+            break
+
+    result = run_benchmark(snapshots, planner_factory, max_actions=args.max_actions,
+                           measure_allocations=not args.no_alloc)
+    result["planner"] = args.planner
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        latency = result["latency_ms"]
+        print("Planner: %s - %d snapshots" % (args.planner, result["snapshots"]))
+        print("Latency (ms): p50 %.3f  p90 %.3f  p99 %.3f  max %.3f  total %.1f" % (
+            latency["p50"], latency["p90"], latency["p99"], latency["max"], latency["total"]))
+        print("Peak allocations (KB): p50 %.1f  max %.1f" % (
+            result["peak_alloc_kb"]["p50"], result["peak_alloc_kb"]["max"]))
+        print("Score: mean %.2f  total %.2f  (mean plan length %.2f)" % (
+            result["score"]["mean"], result["score"]["total"], result["mean_plan_length"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
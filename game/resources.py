@@ -1,11 +1,14 @@
 """
 Anything with resources goes here
 """
+import heapq
 import logging
+import math
 import re
 import time
 
 from core.extractors import Extractor
+from game.market import OfferIndex
 from game.reports import ReportCache
 
 
@@ -79,15 +82,74 @@ class PremiumExchange:
 
         return c["resource_base_price"] - c["resource_price_elasticity"] * e / denominator
 
+    @classmethod
+    def from_data(cls, wrapper, data):
+        """
+        Creates the exchange from the data of the exchange page (Extractor.premium_data)
+        """
+        return cls(
+            wrapper=wrapper,
+            stock=data["stock"],
+            capacity=data["capacity"],
+            tax=data["tax"],
+            constants=data["constants"],
+            duration=data["duration"],
+            merchants=data["merchants"],
+        )
+
+    def _sell_curve(self, item, stock=None):
+        """
+        The marginal price falls linearly with the stock: p(t) = base - slope * t
+        Returns (tax factor, price at the current stock, slope)
+        """
+        c = self.constants
+        denominator = self.capacity[item] + c["stock_size_modifier"]
+        if denominator == 0:
+            raise ZeroDivisionError("Stock size modifier results in division by zero")
+        slope = c["resource_price_elasticity"] / denominator
+        stock = self.stock[item] if stock is None else stock
+        return 1.0 + float(self.tax.get("sell", 0.0)), c["resource_base_price"] - slope * stock, slope
+
+    def marginal_sell_price(self, item, stock=None):
+        """
+        Premium points paid for the next resource sold
+        """
+        factor, price, _ = self._sell_curve(item, stock)
+        return factor * price
+
+    def points_for(self, item, amount, stock=None):
+        """
+        Premium points paid for selling `amount`, same as -calculate_cost(item, -amount) without the checks
+        """
+        factor, price, slope = self._sell_curve(item, stock)
+        return factor * (price * amount - slope * amount * amount / 2.0)
+
+    def amount_for_points(self, item, points, stock=None):
+        """
+        Resources to sell for `points` premium points, solved from the price curve
+        Returns None when the exchange can never pay that much
+        """
+        factor, price, slope = self._sell_curve(item, stock)
+        if factor <= 0 or price <= 0:
+            return None
+        target = points / factor
+        if slope == 0:
+            return target / price
+        discriminant = price * price - 2.0 * slope * target
+        if discriminant < 0:
+            return None
+        # The smaller root, the larger one is past the point where the price reaches zero
+        return (price - math.sqrt(discriminant)) / slope
+
     def calculate_rate_for_one_point(self, item: str):
         """
-        Findet die ungefähre Ressourcenmenge für einen Premium-Punkt.
+        Findet die Ressourcenmenge für einen Premium-Punkt.
 
         Args:
             item: Resource type (wood, stone, iron)
 
         Returns:
-            Number of resources needed for ~1 premium point
+            Number of resources needed for 1 premium point (the capacity left when it is not reachable)
 
         Raises:
             ValueError: If item not found in stock
@@ -99,44 +161,16 @@ class PremiumExchange:
         if max_amount <= 0:
             raise ValueError(f"No capacity available for selling {item}")
 
-        target = 1.0
-        high = 1
-
-        try:
-            cost = abs(self.calculate_cost(item, -high))
-        except ValueError as exc:
-            raise ValueError(f"Unable to evaluate premium exchange cost: {exc}")
-
-        # Exponentiell nach oben erweitern, bis wir >= 1 PP erreichen
-        while cost < target and high < max_amount:
-            high = min(max_amount, high * 2)
-            try:
-                cost = abs(self.calculate_cost(item, -high))
-            except ValueError:
-                break
-
-        if cost < target:
-            # Selbst mit maximal möglicher Menge erreichen wir keine 1 PP
-            return high
-
-        low = max(1, high // 2)
-        best = high
-
-        while low <= high:
-            mid = max(1, (low + high) // 2)
-            try:
-                mid_cost = abs(self.calculate_cost(item, -mid))
-            except ValueError:
-                high = mid - 1
-                continue
-
-            if mid_cost >= target:
-                best = mid
-                high = mid - 1
-            else:
-                low = mid + 1
-
-        return best
+        amount = self.amount_for_points(item, 1.0)
+        if amount is None or amount > max_amount:
+            return max_amount
+        amount = max(1, math.ceil(amount))
+        # Rounding of the square root
+        while amount > 1 and self.points_for(item, amount - 1) >= 1.0:
+            amount -= 1
+        while amount < max_amount and self.points_for(item, amount) < 1.0:
+            amount += 1
+        return amount
 
     @staticmethod
     def optimize_n(amount, sell_price, merchants, size=1000):
@@ -202,6 +236,184 @@ class PremiumExchange:
         }
 
 
+class PremiumSellPlanner:
+    """
+    Splits the premium exchange sales of a cycle over all villages
+
+    Merchant loads are handed out one at a time to the resource the exchange currently pays the most for,
+    taken from the village with the largest surplus of it. Every load raises the stock of that resource
+    and so lowers its price, which is what spreads the sales over the resources.
+    """
+    RESOURCES = ("wood", "stone", "iron")
+
+    def __init__(self, exchange, merchant_capacity=1000, min_load=0.55, max_points=None):
+        self.exchange = exchange
+        self.merchant_capacity = merchant_capacity
+        # Loads filled less than this are not worth a merchant (wait for more surplus)
+        self.min_load = min_load
+        self.max_points = max_points
+
+    def plan(self, offers):
+        """
+        offers: [{"village_id", "surplus": {resource: amount}, "merchants": available merchants}]
+        Returns the sales [{"village_id", "resource", "amount", "points"}] in the order they should be made
+        """
+        exchange = self.exchange
+        stock = dict(exchange.stock)
+        merchants = {offer["village_id"]: offer.get("merchants", 0) for offer in offers}
+        surplus = {}
+        heaps = {resource: [] for resource in self.RESOURCES}
+        for offer in offers:
+            for resource, amount in offer.get("surplus", {}).items():
+                if resource in heaps and amount > 0 and merchants[offer["village_id"]] > 0:
+                    surplus[(offer["village_id"], resource)] = amount
+                    heaps[resource].append((-amount, offer["village_id"]))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+
+        minimum = self.min_load * self.merchant_capacity
+        allocated = {}
+        points = 0.0
+        while True:
+            best = None
+            for resource, heap in heaps.items():
+                room = exchange.capacity.get(resource, 0) - stock.get(resource, 0)
+                # Drop villages that ran out of merchants or of surplus worth a load
+                while heap and (merchants[heap[0][1]] < 1 or min(-heap[0][0], room) < minimum):
+                    heapq.heappop(heap)
+                if not heap:
+                    continue
+                price = exchange.marginal_sell_price(resource, stock[resource])
+                if price > 0 and (best is None or price > best[0]):
+                    best = (price, resource, room)
+            if best is None:
+                break
+            _, resource, room = best
+            village_id = heapq.heappop(heaps[resource])[1]
+            amount = min(self.merchant_capacity, surplus[(village_id, resource)], room)
+            if self.max_points is not None:
+                left = self.max_points - points
+                if exchange.points_for(resource, amount, stock[resource]) > left:
+                    needed = exchange.amount_for_points(resource, left, stock[resource])
+                    amount = min(amount, math.ceil(needed)) if needed is not None else amount
+                    heaps = {}
+            points += exchange.points_for(resource, amount, stock[resource])
+            stock[resource] += amount
+            merchants[village_id] -= 1
+            surplus[(village_id, resource)] -= amount
+            allocated[(village_id, resource)] = allocated.get((village_id, resource), 0) + amount
+            if surplus[(village_id, resource)] > 0 and heaps:
+                heapq.heappush(heaps[resource], (-surplus[(village_id, resource)], village_id))
+
+        # One sale per village and resource, the points follow the price as the sales are made
+        stock = dict(exchange.stock)
+        sales = []
+        for (village_id, resource), amount in allocated.items():
+            earned = exchange.points_for(resource, amount, stock[resource])
+            stock[resource] += amount
+            sales.append({"village_id": village_id, "resource": resource, "amount": amount, "points": earned})
+        return sales
+
+
+class PremiumTrader:
+    """
+    Sells the premium offers of all villages once per cycle with a single look at the exchange
+    """
+    def __init__(self, wrapper, max_points=None, overview=None):
+        self.wrapper = wrapper
+        self.max_points = max_points
+        # OverviewSnapshot of the cycle, the trader overview is shared with the resource balancer
+        self.overview = overview
+        self.logger = logging.getLogger("PremiumTrader")
+
+    def fetch_exchange(self, village_id):
+        res = self.wrapper.get_url(f"game.php?village={village_id}&screen=market&mode=exchange")
+        data = Extractor.premium_data(res.text) if res else None
+        if not data:
+            self.logger.warning("[Premium] Error reading premium data!")
+            return None
+        try:
+            return PremiumExchange.from_data(self.wrapper, data)
+        except KeyError as e:
+            self.logger.warning("[Premium] Incomplete premium data: missing %s", e)
+            return None
+
+    def fetch_merchants(self, village_id):
+        """
+        Available merchants of every village from the trader overview
+        """
+        if self.overview:
+            data = self.overview.trader("own")
+        else:
+            res = self.wrapper.get_url(f"game.php?village={village_id}&screen=overview_villages&mode=trader&type=own")
+            if not res:
+                return {}
+            data = Extractor.overview_trader_data(res.text, overview_type="own")
+        return {vid: entry.get("merchants_avail", 0) for vid, entry in data.items()}
+
+    def run(self, offers):
+        """
+        Plans and makes the sales, returns the sales that were made
+        """
+        offers = [offer for offer in offers if offer]
+        if not offers:
+            return []
+        village_id = offers[0]["village_id"]
+        exchange = self.fetch_exchange(village_id)
+        if not exchange:
+            return []
+        merchants = self.fetch_merchants(village_id)
+        for offer in offers:
+            if str(offer["village_id"]) in merchants:
+                offer["merchants"] = merchants[str(offer["village_id"])]
+            elif offer["village_id"] == village_id:
+                offer["merchants"] = exchange.merchants
+            else:
+                # No overview (no premium account), the exchange page knows the merchants of its own village
+                own = self.fetch_exchange(offer["village_id"])
+                offer["merchants"] = own.merchants if own else 0
+
+        planner = PremiumSellPlanner(exchange, max_points=self.max_points)
+        sold = []
+        for sale in planner.plan(offers):
+            if sale["points"] < 1:
+                self.logger.debug("[Premium] Skipping %s, it would yield < 1 PP", sale)
+                continue
+            if self.sell(sale):
+                sold.append(sale)
+        if sold and self.overview:
+            # The merchants are on their way now
+            self.overview.invalidate(self.overview.TRADER_OWN)
+        return sold
+
+    def sell(self, sale):
+        village_id, resource, amount = sale["village_id"], sale["resource"], sale["amount"]
+        self.logger.info(
+            "[Premium] Selling %d %s from village %s for ~%.2f PP", amount, resource, village_id, sale["points"]
+        )
+        result = self.wrapper.get_api_action(
+            village_id, action="exchange_begin", params={"screen": "market"}, data={f"sell_{resource}": amount}
+        )
+        try:
+            rate_hash = result["response"][0]["rate_hash"]
+        except (KeyError, IndexError, TypeError) as e:
+            self.logger.warning(f"[Premium] Trade failed: Missing rate_hash in response ({e})")
+            return False
+        result = self.wrapper.get_api_action(
+            village_id,
+            action="exchange_confirm",
+            params={"screen": "market"},
+            data={f"sell_{resource}": amount, "rate_hash": rate_hash, "mb": "1"},
+        )
+        if not result:
+            self.logger.warning("[Premium] Trade failed: exchange_confirm error")
+            return False
+        self.wrapper.reporter.report(
+            village_id, "TWB_PREMIUM_TRADE", f"Sold {amount} {resource} for ~{sale['points']:.2f} Premium Points"
+        )
+        return True
+
+
 class ResourceManager:
     """
     Class to calculate, store and reserve resources for actions
@@ -234,6 +446,9 @@ class ResourceManager:
         self.wrapper = wrapper
         self.village_id = village_id
         self.last_troop_recruit_time = 0
+        # Per village, not shared with the other villages through the class
+        self.actual = {}
+        self.requested = {}
 
     def calculate_income(self, game_state):
         """
@@ -337,247 +552,31 @@ class ResourceManager:
             game_state_model.resource_income['iron'] = self.income['total'].get('iron', 0)
 
 
-    def do_premium_stuff(self):
+    def premium_offer(self):
         """
-        Smart Premium Exchange: Verkauft Ressourcen-Überschuss für Premium-Punkte
-
-        Neue Features:
-        - Bug-Fix: Berechnet echten Überschuss (nicht API-Dummy-Wert)
-        - Vorausschauend: Verkauft proaktiv wenn Storage bald voll
-        - Kein Minimum: Verkauft auch kleine Mengen wenn effizient (ratio <= 0.45)
-        - Detailliertes Logging für Transparenz
+        Surplus this village can sell on the premium exchange, the sales of all villages are planned
+        together by the PremiumTrader at the end of the cycle
         """
-        # Prüfe ob Premium-Trade aktiviert
         if not self.do_premium_trade:
-            return
-
-        def _format_pp(value: float) -> str:
-            rounded = round(value, 2)
-            if abs(rounded - round(rounded)) < 1e-6:
-                return str(int(round(rounded)))
-            return f"{rounded:.2f}"
-
-        # Finde Ressource mit dem meisten Überschuss
-        gpl = self.get_plenty_off()
-
-        if not gpl:
-            self.logger.debug("Premium trade: No resource with sufficient surplus")
-            return
-
-        self.logger.debug(f"[Premium] Checking premium trade for {gpl}")
-
-        # Hole Premium Exchange Daten vom Server
-        url = f"game.php?village={self.village_id}&screen=market&mode=exchange"
-        res = self.wrapper.get_url(url=url)
-        data = Extractor.premium_data(res.text)
-
-        if not data:
-            self.logger.warning("[Premium] Error reading premium data!")
-            return
-
-        if data["merchants"] < 1:
-            self.logger.info("[Premium] Not enough merchants available!")
-            return
-
-        # Initialisiere Premium Exchange
-        try:
-            premium_exchange = PremiumExchange(
-                wrapper=self.wrapper,
-                stock=data["stock"],
-                capacity=data["capacity"],
-                tax=data["tax"],
-                constants=data["constants"],
-                duration=data["duration"],
-                merchants=data["merchants"]
-            )
-
-            cost_per_point = premium_exchange.calculate_rate_for_one_point(gpl)
-        except (ValueError, ZeroDivisionError) as e:
-            self.logger.warning(f"[Premium] Error calculating exchange rate: {e}")
-            return
-
-        if cost_per_point <= 0:
-            self.logger.debug(f"[Premium] Invalid cost per point: {cost_per_point}")
-            return
-
-        # 🔴 BUG-FIX: Berechne ECHTEN Überschuss (nicht prices[gpl]!)
+            return None
         threshold = int(self.storage / self.ratio)
-        current_amount = self.actual.get(gpl, 0)
-        requested_amount = self.in_need_amount(gpl)
-
-        # Verfügbarer Überschuss nach Abzug von Threshold und Reservierungen
-        available_surplus = max(0, current_amount - threshold - requested_amount)
-
-        # Logging für Transparenz
-        storage_percent = (current_amount / self.storage * 100) if self.storage > 0 else 0
-        self.logger.debug(
-            f"[Premium] {gpl}: {current_amount}/{self.storage} ({storage_percent:.1f}%), "
-            f"threshold: {threshold}, requested: {requested_amount}"
-        )
-
-        # 🚀 VORAUSSCHAU-LOGIK: Verkaufe proaktiv wenn Storage bald voll
-        proactive_sell = False
-        if available_surplus <= 0:
-            # Noch kein Überschuss, aber prüfe ob bald voll
-            proactive_threshold = int(threshold * 0.85)
-
-            if current_amount > proactive_threshold:
-                # Berechne geschätzte Produktionsrate (sehr vereinfacht)
-                # In 85-100% Zone → verkaufe proaktiv etwas
-                proactive_surplus = int((current_amount - proactive_threshold) * 0.5)
-
-                if proactive_surplus >= cost_per_point:
-                    available_surplus = proactive_surplus
-                    proactive_sell = True
-                    self.logger.info(
-                        f"[Premium] Proactive sell triggered: {gpl} at {storage_percent:.1f}% "
-                        f"(threshold: {proactive_threshold})"
-                    )
-
-        if available_surplus <= 0:
-            self.logger.debug(
-                f"[Premium] No surplus to sell: {gpl} (available: {available_surplus})"
-            )
-            return
-
-        # Berechne wie viele Premium-Punkte möglich sind
-        max_points = available_surplus // cost_per_point
-
-        self.logger.info(
-            f"[Premium] Available surplus: {available_surplus} {gpl} "
-            f"(~{max_points} PP at {cost_per_point} {gpl}/PP)"
-        )
-
-        # Optimiere Händler-Auslastung
-        gpl_data = PremiumExchange.optimize_n(
-            amount=available_surplus,
-            sell_price=cost_per_point,
-            merchants=data["merchants"],
-            size=1000
-        )
-
-        sell_amount = gpl_data.get("sell_amount", 0)
-        utilization_percent = (1.0 - gpl_data["ratio"]) * 100
-
-        self.logger.debug(
-            f"[Premium] Optimized: {sell_amount} {gpl}, {gpl_data['merchants']} merchant(s), "
-            f"{utilization_percent:.1f}% utilized"
-        )
-
-        # Effizienz-Check: Mindestens 55% Händler-Auslastung (ratio <= 0.45)
-        if gpl_data["ratio"] > 0.45:
-            self.logger.info(
-                f"[Premium] Not efficient enough (ratio {gpl_data['ratio']:.2f} > 0.45, "
-                f"only {utilization_percent:.1f}% utilized). Waiting for more surplus."
-            )
-            return
-
-        if sell_amount < 1:
-            self.logger.debug(f"[Premium] Calculated sell amount too low: {sell_amount}")
-            return
-
-        try:
-            estimated_points = premium_exchange.calculate_cost(gpl, -sell_amount)
-            estimated_pp = abs(estimated_points)
-        except ValueError as exc:
-            self.logger.warning(
-                f"[Premium] Unable to estimate premium points for trade: {exc}"
-            )
-            return
-
-        if estimated_pp < 1:
-            self.logger.info(
-                f"[Premium] Trade would yield < 1 PP (estimate: {estimated_pp:.2f}), skipping"
-            )
-            return
-
-        formatted_estimate = _format_pp(estimated_pp)
-        approx_prefix = "~"
-
-        # 🎯 VERKAUFEN!
-        mode_str = "proactive" if proactive_sell else "normal"
-        self.logger.info(
-            f"[Premium] Selling {sell_amount} {gpl} for {approx_prefix}{formatted_estimate} PP "
-            f"({utilization_percent:.1f}% utilized, {mode_str} mode)"
-        )
-
-        # API Call: exchange_begin
-        result = self.wrapper.get_api_action(
-            self.village_id,
-            action="exchange_begin",
-            params={"screen": "market"},
-            data={f"sell_{gpl}": sell_amount},
-        )
-
-        if not result:
-            self.logger.warning(f"[Premium] Trade failed: exchange_begin error")
-            return
-
-        try:
-            _rate_hash = result["response"][0]["rate_hash"]
-        except (KeyError, IndexError) as e:
-            self.logger.warning(f"[Premium] Trade failed: Missing rate_hash in response ({e})")
-            return
-
-        # API Call: exchange_confirm
-        trade_data = {
-            f"sell_{gpl}": sell_amount,
-            "rate_hash": _rate_hash,
-            "mb": "1"
-        }
-
-        result = self.wrapper.get_api_action(
-            self.village_id,
-            action="exchange_confirm",
-            params={"screen": "market"},
-            data=trade_data,
-        )
-
-        def _extract_premium_from_response(payload):
-            if isinstance(payload, dict):
-                for key, value in payload.items():
-                    if isinstance(key, str) and "premium" in key.lower():
-                        if isinstance(value, (int, float)):
-                            return value
-                        if isinstance(value, str) and value.replace(".", "", 1).isdigit():
-                            try:
-                                return float(value)
-                            except ValueError:
-                                pass
-                    if isinstance(value, (dict, list)):
-                        nested = _extract_premium_from_response(value)
-                        if nested is not None:
-                            return nested
-            elif isinstance(payload, list):
-                for item in payload:
-                    nested = _extract_premium_from_response(item)
-                    if nested is not None:
-                        return nested
+        surplus = {}
+        for resource in ("wood", "stone", "iron"):
+            if self.in_need_of(resource):
+                continue
+            current_amount = self.actual.get(resource, 0)
+            available = current_amount - threshold
+            if available <= 0:
+                # Sell a little early when the storage is almost at the threshold
+                proactive_threshold = int(threshold * 0.85)
+                available = int((current_amount - proactive_threshold) * 0.5) if current_amount > proactive_threshold else 0
+            if available > 0:
+                surplus[resource] = available
+        if not surplus:
+            self.logger.debug("Premium trade: No resource with sufficient surplus")
             return None
-
-        if result:
-            actual_pp = _extract_premium_from_response(result)
-            if actual_pp is not None:
-                actual_display = _format_pp(actual_pp)
-                self.logger.info(
-                    f"[Premium] ✅ Trade successful! Sold {sell_amount} {gpl} for {actual_display} PP"
-                )
-                report_amount = actual_display
-            else:
-                self.logger.info(
-                    f"[Premium] ✅ Trade successful! Sold {sell_amount} {gpl} for "
-                    f"{approx_prefix}{formatted_estimate} PP (server response did not include premium total)"
-                )
-                report_amount = f"{approx_prefix}{formatted_estimate}"
-
-            # Report für Statistik
-            self.wrapper.reporter.report(
-                self.village_id,
-                "TWB_PREMIUM_TRADE",
-                f"Sold {sell_amount} {gpl} for {report_amount} Premium Points ({mode_str})"
-            )
-        else:
-            self.logger.warning(f"[Premium] Trade failed: exchange_confirm error")
+        self.logger.debug(f"[Premium] Surplus offered: {surplus}")
+        return {"village_id": self.village_id, "surplus": surplus}
 
     def check_state(self):
         """
@@ -744,6 +743,26 @@ class ResourceManager:
 
         return "%d:%02d:%02d" % (hour, minutes, seconds)
 
+    def dirty_inputs(self):
+        """
+        The inputs the market depends on, resources are bucketed to 10% of the storage
+        """
+        buckets = {}
+        for res, amount in (self.actual or {}).items():
+            buckets[res] = int(10 * amount / self.storage) if self.storage else amount
+        return {
+            "resources": buckets,
+            "requested": sorted(source for source, values in self.requested.items() if any(values.values())),
+        }
+
+    def next_trade_time(self):
+        """
+        Returns the timestamp at which the market may trade again
+        """
+        if not self.last_trade:
+            return None
+        return self.last_trade + int(3600 * self.trade_max_per_hour)
+
     def manage_market(self, drop_existing=True):
         """
         Manages the market for you
@@ -765,6 +784,7 @@ class ResourceManager:
         if not surplus_resources:
             return
 
+        offers = None
         for plenty in surplus_resources:
             if self.in_need_of(plenty):
                 continue
@@ -773,21 +793,14 @@ class ResourceManager:
             if not need:
                 continue
 
-            # check incoming resources
-            url = f"game.php?village={self.village_id}&screen=market&mode=other_offer"
-            res = self.wrapper.get_url(url=url)
-            p = re.compile(
-                r"Aankomend:\s.+\"icon header (.+?)\".+?<\/span>(.+) ", re.M
-            )
-            incoming = p.findall(res.text)
-            resource_incoming = {}
-            if incoming:
-                resource_incoming[incoming[0][0].strip()] = int(
-                    "".join([s for s in incoming[0][1] if s.isdigit()])
-                )
-                self.logger.info(
-                    f"There are resources incoming! %s", resource_incoming
-                )
+            # The market page is loaded once, incoming resources and offers come from the same page
+            if offers is None:
+                offers = self.market_offers()
+                if offers.incoming:
+                    self.logger.info(
+                        f"There are resources incoming! %s", offers.incoming
+                    )
+            resource_incoming = offers.incoming
 
             item, how_many = need
             how_many = round(how_many, -1)
@@ -800,7 +813,7 @@ class ResourceManager:
                 continue
 
             self.logger.debug("Checking current market offers")
-            if self.check_other_offers(item, how_many, plenty):
+            if self.check_other_offers(item, how_many, plenty, offers=offers):
                 self.logger.debug("Took market offer!")
                 return # Exit after one successful trade
 
@@ -827,23 +840,21 @@ class ResourceManager:
             if self.trade(plenty, biased, item, how_many):
                 return # Exit after one successful trade
 
-    def check_other_offers(self, item, how_many, sell):
+    def market_offers(self):
         """
-        Checks if there are offers that match our needs
+        Loads the offers of other players once and indexes them
         """
         url = f"game.php?village={self.village_id}&screen=market&mode=other_offer"
         res = self.wrapper.get_url(url=url)
-        p = re.compile(
-            r"(?:<!-- insert the offer -->\n+)\s+<tr>(.*?)<\/tr>", re.S | re.M
-        )
-        cur_off_tds = p.findall(res.text)
-        p = re.compile(r"Aankomend:\s.+\"icon header (.+?)\".+?<\/span>(.+) ", re.M)
-        incoming = p.findall(res.text)
-        resource_incoming = {}
-        if incoming:
-            resource_incoming[incoming[0][0].strip()] = int(
-                "".join([s for s in incoming[0][1] if s.isdigit()])
-            )
+        return OfferIndex.from_html(res.text if res else "")
+
+    def check_other_offers(self, item, how_many, sell, offers=None):
+        """
+        Checks if there are offers that match our needs
+        """
+        if offers is None:
+            offers = self.market_offers()
+        resource_incoming = offers.incoming
 
         if item in resource_incoming:
             how_many = how_many - resource_incoming[item]
@@ -853,66 +864,31 @@ class ResourceManager:
 
         willing_to_sell = self.actual[sell] - self.in_need_amount(sell)
         self.logger.debug(
-            f"Found {len(cur_off_tds)} offers on market, willing to sell {willing_to_sell} {sell}"
+            f"Found {len(offers)} offers on market, willing to sell {willing_to_sell} {sell}"
         )
 
-        for tds in cur_off_tds:
-            res_offer = re.findall(
-                r"<span class=\"icon header (.+?)\".+?>(.+?)</td>", tds
-            )
-            off_id = re.findall(
-                r"<input type=\"hidden\" name=\"id\" value=\"(\d+)", tds
-            )
-
-            if len(off_id) < 1:
-                # Not enough resources to trade
-                continue
-
-            offer = self.parse_res_offer(res_offer, off_id[0])
-            if (
-                    offer["offered"] == item
-                    and offer["offer_amount"] >= how_many
-                    and offer["wanted"] == sell
-                    and offer["wanted_amount"] <= willing_to_sell
-            ):
-                self.logger.info(
-                    f"Good offer: {offer['offer_amount']} {offer['offered']} for {offer['wanted_amount']} {offer['wanted']}"
-                )
-                # Take the deal!
-                payload = {
-                    "count": 1,
-                    "id": offer["id"],
-                    "h": self.wrapper.last_h,
-                }
-                post_url = f"game.php?village={self.village_id}&screen=market&mode=other_offer&action=accept_multi&start=0&id={offer['id']}&h={self.wrapper.last_h}"
-                # print(f"Would post: {post_url} {payload}")
-                self.wrapper.post_url(post_url, data=payload)
-                self.last_trade = int(time.time())
-                self.actual[offer["wanted"]] = (
-                        self.actual[offer["wanted"]] - offer["wanted_amount"]
-                )
-                return True
-
-        # No useful offers found
-        return False
-
-    def parse_res_offer(self, res_offer, id):
-        """
-        Parse an offer
-        """
-        off, want, ratio = res_offer
-        res_offer, res_offer_amount = off
-        res_wanted, res_wanted_amount = want
+        offer = offers.match(item, sell, how_many, willing_to_sell)
+        if not offer:
+            # No useful offers found
+            return False
 
-        return {
-            "id": id,
-            "offered": res_offer,
-            "offer_amount": int("".join([s for s in res_offer_amount if s.isdigit()])),
-            "wanted": res_wanted,
-            "wanted_amount": int(
-                "".join([s for s in res_wanted_amount if s.isdigit()])
-            ),
+        self.logger.info(
+            f"Good offer: {offer['offer_amount']} {offer['offered']} for {offer['wanted_amount']} {offer['wanted']}"
+        )
+        # Take the deal!
+        payload = {
+            "count": 1,
+            "id": offer["id"],
+            "h": self.wrapper.last_h,
         }
+        post_url = f"game.php?village={self.village_id}&screen=market&mode=other_offer&action=accept_multi&start=0&id={offer['id']}&h={self.wrapper.last_h}"
+        self.wrapper.post_url(post_url, data=payload)
+        offers.remove(offer)
+        self.last_trade = int(time.time())
+        self.actual[offer["wanted"]] = (
+                self.actual[offer["wanted"]] - offer["wanted_amount"]
+        )
+        return True
 
     def mark_troop_recruited(self):
         """
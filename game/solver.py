@@ -1,7 +1,9 @@
 """
 This module contains the core logic for the optimizing agent, including the
-heuristic evaluation function and the search algorithm.
+heuristic evaluation function and the search algorithms.
 """
+import math
+import time
 
 from game.gamestate import GameState
 from game.actions import RecruitAction
@@ -26,7 +28,6 @@ def evaluate_state(game_state: GameState, marginal_incomes: dict) -> float:
         score += future_income
 
     # Factor in building levels
-    import math
     for building, level in game_state.building_levels.items():
         weight = 20 if building == 'main' else 10
         score += math.log(level + 1) * weight
@@ -48,35 +49,77 @@ def evaluate_state(game_state: GameState, marginal_incomes: dict) -> float:
     return score
 
 
+def state_key(game_state: GameState) -> tuple:
+    """
+    Returns a hashable key describing everything the planner can change.
+    Two states reached by a different order of the same actions share a key.
+    """
+    return (
+        tuple(sorted(game_state.resources.items())),
+        tuple(sorted(game_state.building_levels.items())),
+        tuple(sorted(game_state.troop_counts.items())),
+        tuple(sorted(game_state.research_levels.items())),
+    )
+
+
 class MultiActionPlanner:
     """
     A planner that generates a sequence of actions to take in a single bot cycle.
     """
+    name = "greedy"
+
     def __init__(self, action_generator):
         self.action_generator = action_generator
+        self.last_stats = {}
+        self._evaluations = 0
+
+    def dirty_inputs(self, state: GameState):
+        """
+        The inputs a planner run depends on. Resources only matter through the
+        actions they make affordable, so the raw amounts are left out.
+        """
+        return {
+            "levels": state.building_levels,
+            "troops": state.troop_counts,
+            "research": state.research_levels,
+            "build_queue": len(state.building_queue_times),
+            "recruit_queue": sorted(key for key, remaining in state.troop_queue.items() if remaining),
+            "affordable": sorted(action.name for action in self.action_generator.generate(state)),
+        }
 
     def plan_actions(self, initial_state: GameState, marginal_incomes: dict, max_actions=5):
         """
         Generates a sequence of the best actions to take.
         """
-        import copy
+        started = time.perf_counter()
+        self._evaluations = 0
         plan = []
-        current_state = copy.deepcopy(initial_state)
+        current_state = initial_state.clone()
+        score = evaluate_state(current_state, marginal_incomes)
 
         for _ in range(max_actions):
-            best_action = self._find_best_immediate_action(current_state, marginal_incomes)
+            best_action, best_score = self._find_best_immediate_action(current_state, marginal_incomes)
 
             if best_action:
                 plan.append(best_action)
                 current_state = self._simulate_action(current_state, best_action)
+                score = best_score
             else:
                 break
 
+        self.last_stats = {
+            "planner": self.name,
+            "actions": len(plan),
+            "score": score,
+            "evaluations": self._evaluations,
+            "elapsed": time.perf_counter() - started,
+        }
         return plan
 
     def _find_best_immediate_action(self, state: GameState, marginal_incomes: dict):
         """
         Finds the single best affordable action from the current state.
+        Returns the action and the score of the state it leads to.
         """
         best_action = None
         best_score = -float('inf')
@@ -88,20 +131,20 @@ class MultiActionPlanner:
             if all(state.resources.get(res, 0) >= cost.get(res, 0) for res in cost):
                 next_state = self._simulate_action(state, action)
                 score = evaluate_state(next_state, marginal_incomes)
+                self._evaluations += 1
 
                 if score > best_score:
                     best_score = score
                     best_action = action
 
-        return best_action
+        return best_action, best_score
 
 
     def _simulate_action(self, state: GameState, action) -> GameState:
         """
         Simulates the effect of an action on a game state.
         """
-        import copy
-        new_state = copy.deepcopy(state)
+        new_state = state.clone()
         new_state.last_action = action # Set the action that led to this state
 
         cost = action.cost()
@@ -116,3 +159,104 @@ class MultiActionPlanner:
             new_state.troop_counts[action.unit] = current_amount + action.amount
 
         return new_state
+
+
+class _SearchNode:
+    """A partial plan inside the beam."""
+    __slots__ = ("state", "plan", "bonus", "score")
+
+    def __init__(self, state, plan, bonus, score):
+        self.state = state
+        self.plan = plan
+        self.bonus = bonus
+        self.score = score
+
+
+class BeamSearchPlanner(MultiActionPlanner):
+    """
+    Anytime beam search over action sequences.
+
+    Every depth keeps the `beam_width` best partial plans. States are hashed
+    into a transposition table so equivalent action orders are only scored
+    once, and the best plan found so far is returned when `time_budget`
+    (seconds) runs out.
+    """
+    name = "beam"
+
+    def __init__(self, action_generator, beam_width=4, max_depth=5, time_budget=0.25):
+        super().__init__(action_generator)
+        self.beam_width = beam_width
+        self.max_depth = max_depth
+        self.time_budget = time_budget
+
+    def plan_actions(self, initial_state: GameState, marginal_incomes: dict, max_actions=None):
+        """
+        Generates the best sequence of at most `max_actions` (or `max_depth`) actions.
+        """
+        started = time.perf_counter()
+        deadline = started + self.time_budget if self.time_budget else None
+        depth_limit = max_actions or self.max_depth
+
+        # state key -> [heuristic score without recruit income, best path score]
+        table = {}
+        evaluations = 0
+        table_hits = 0
+        timed_out = False
+
+        root_state = initial_state.clone()
+        root_state.last_action = None
+        root_score = evaluate_state(root_state, {})
+        table[state_key(root_state)] = [root_score, root_score]
+        best = _SearchNode(root_state, (), 0.0, root_score)
+        beam = [best]
+
+        for _ in range(depth_limit):
+            children = []
+            for node in beam:
+                if deadline and time.perf_counter() >= deadline:
+                    timed_out = True
+                    break
+                for action in self.action_generator.generate(node.state):
+                    cost = action.cost()
+                    if not all(node.state.resources.get(res, 0) >= cost.get(res, 0) for res in cost):
+                        continue
+                    child_state = self._simulate_action(node.state, action)
+                    bonus = node.bonus
+                    if isinstance(action, RecruitAction):
+                        bonus += marginal_incomes.get(action.unit, 0) * action.amount
+
+                    key = state_key(child_state)
+                    entry = table.get(key)
+                    if entry is None:
+                        base_score = evaluate_state(child_state, {})
+                        evaluations += 1
+                        entry = table[key] = [base_score, -float('inf')]
+                    else:
+                        table_hits += 1
+
+                    score = entry[0] + bonus
+                    if score <= entry[1]:
+                        # The same state was already reached by a better ordering
+                        continue
+                    entry[1] = score
+                    children.append(_SearchNode(child_state, node.plan + (action,), bonus, score))
+
+            if not children:
+                break
+            children.sort(key=lambda n: n.score, reverse=True)
+            beam = children[:self.beam_width]
+            if beam[0].score >= best.score:
+                best = beam[0]
+            if timed_out:
+                break
+
+        self.last_stats = {
+            "planner": self.name,
+            "actions": len(best.plan),
+            "score": best.score,
+            "evaluations": evaluations,
+            "table_hits": table_hits,
+            "timed_out": timed_out,
+            "elapsed": time.perf_counter() - started,
+        }
+        return list(best.plan)
@@ -0,0 +1,169 @@
+"""
+This module contains a discrete-event simulation that advances a GameState
+through time. Resources accrue analytically between events (capped by the
+storage), builds are limited by the build queue length and recruitment runs
+in a separate queue per building, so actions can be scheduled hours ahead.
+"""
+import heapq
+import itertools
+import math
+
+from game.actions import BuildAction, RecruitAction, ResearchAction
+from game.gamestate import GameState
+from game.troopmanager import TroopManager
+
+RESOURCES = ("wood", "stone", "iron")
+
+
+class ScheduledAction:
+    """An action placed on the timeline, times are seconds from now."""
+    __slots__ = ("action", "start", "finish")
+
+    def __init__(self, action, start, finish):
+        self.action = action
+        self.start = start
+        self.finish = finish
+
+    def __repr__(self):
+        return f"<ScheduledAction {self.action.name} start={self.start:.0f}s finish={self.finish:.0f}s>"
+
+
+class TimelineSimulator:
+    """
+    Event driven simulator, the clock jumps from event to event instead of
+    stepping per second which keeps a 48 hour projection cheap.
+    """
+
+    def __init__(self, max_build_queue=2, horizon=48 * 3600):
+        self.max_build_queue = max_build_queue
+        self.horizon = horizon
+
+    @staticmethod
+    def income_rates(state: GameState):
+        """
+        Converts the hourly resource income to income per second.
+        """
+        return {res: state.resource_income.get(res, 0) / 3600.0 for res in RESOURCES}
+
+    @staticmethod
+    def accrue(state: GameState, rates, seconds):
+        """
+        Adds the income of `seconds` to the state, capped at the storage capacity.
+        """
+        if seconds <= 0:
+            return
+        for res in RESOURCES:
+            amount = state.resources.get(res, 0) + rates[res] * seconds
+            if state.storage_capacity > 0:
+                amount = min(amount, max(state.storage_capacity, state.resources.get(res, 0)))
+            state.resources[res] = amount
+
+    def time_until_affordable(self, state: GameState, cost, rates=None):
+        """
+        Returns the seconds until the cost can be paid, 0 if it can be paid now
+        and math.inf if it never will (storage too small, no income or no farm space).
+        """
+        if rates is None:
+            rates = self.income_rates(state)
+        if cost.get("pop", 0) > state.resources.get("pop", 0):
+            return math.inf
+        wait = 0.0
+        for res in RESOURCES:
+            missing = cost.get(res, 0) - state.resources.get(res, 0)
+            if missing <= 0:
+                continue
+            if rates[res] <= 0 or (state.storage_capacity > 0 and cost.get(res, 0) > state.storage_capacity):
+                return math.inf
+            wait = max(wait, missing / rates[res])
+        return wait
+
+    def project(self, state: GameState, actions, horizon=None):
+        """
+        Schedules the actions in the given order at the earliest possible time.
+        Scheduling stops at the first action that cannot start within the horizon.
+        Returns a list of ScheduledAction entries and the projected state at the horizon.
+        """
+        if horizon is None:
+            horizon = self.horizon
+        sim = state.clone()
+        rates = self.income_rates(sim)
+        clock = 0.0
+        events = []
+        counter = itertools.count()
+
+        build_queue = sorted(t for t in getattr(state, "building_queue_times", []) if t > 0)
+        for finish in build_queue:
+            heapq.heappush(events, (finish, next(counter), "build", None))
+        queue_free = {
+            building: state.troop_queue.get(f"{building}_queue_time", 0)
+            for building in ("barracks", "stable", "garage")
+        }
+        queue_free["smith"] = 0
+
+        def advance(until):
+            nonlocal clock
+            while events and events[0][0] <= until:
+                when, _, kind, payload = heapq.heappop(events)
+                self.accrue(sim, rates, when - clock)
+                clock = when
+                if kind == "build":
+                    build_queue.pop(0)
+                    if payload:
+                        sim.building_levels[payload.building] = max(
+                            sim.building_levels.get(payload.building, 0), payload.level
+                        )
+                elif kind == "recruit":
+                    sim.troop_counts[payload.unit] = sim.troop_counts.get(payload.unit, 0) + payload.amount
+                elif kind == "research":
+                    sim.research_levels[payload.unit] = payload.level
+            self.accrue(sim, rates, until - clock)
+            clock = max(clock, until)
+
+        schedule = []
+        for action in actions:
+            cost = action.cost()
+            start = clock
+            wait = 0
+            while True:
+                advance(start)
+                if isinstance(action, BuildAction) and len(build_queue) >= self.max_build_queue:
+                    start = build_queue[0]
+                    if start > horizon:
+                        break
+                    continue
+                wait = self.time_until_affordable(sim, cost, rates)
+                if wait <= 1e-6 or wait == math.inf:
+                    break
+                start = clock + wait
+                if start > horizon:
+                    break
+            if start > horizon or wait == math.inf:
+                break
+
+            for res in RESOURCES:
+                sim.resources[res] -= cost.get(res, 0)
+            sim.resources["pop"] = sim.resources.get("pop", 0) - cost.get("pop", 0)
+
+            duration = getattr(action, "duration", 0)
+            if isinstance(action, BuildAction):
+                finish = max(start, build_queue[-1] if build_queue else start) + duration
+                build_queue.append(finish)
+                kind = "build"
+            elif isinstance(action, RecruitAction):
+                building = TroopManager.unit_building.get(action.unit, "barracks")
+                finish = max(start, queue_free[building]) + duration
+                queue_free[building] = finish
+                kind = "recruit"
+            elif isinstance(action, ResearchAction):
+                finish = max(start, queue_free["smith"]) + duration
+                queue_free["smith"] = finish
+                kind = "research"
+            else:
+                finish = start
+                kind = None
+            if kind:
+                heapq.heappush(events, (finish, next(counter), kind, action))
+            schedule.append(ScheduledAction(action, start, finish))
+
+        advance(horizon)
+        return schedule, sim
@@ -616,6 +616,23 @@ class TroopManager:
 
         return "%d:%02d:%02d" % (hour, minutes, seconds)
 
+    def dirty_inputs(self):
+        """
+        The inputs troop gathering (farming / scavenging) depends on
+        """
+        return {
+            "troops": self.troops,
+            "can_attack": self.can_attack,
+        }
+
+    def next_due_time(self):
+        """
+        Returns the timestamp at which the first recruitment queue runs empty
+        """
+        now = time.time()
+        pending = [t for t in self.wait_for.get(self.village_id, {}).values() if t and t > now]
+        return min(pending) if pending else None
+
     def get_queue_times(self):
         """
         Calculates remaining time for each building's recruitment queue
@@ -1,12 +1,17 @@
 import json
 import logging
+import math
 import time
 from codecs import decode
 from datetime import datetime
 
 from core.configmanager import ConfigManager
+from core.events import EventLog
 from core.extractors import Extractor
 from core.filemanager import FileManager
+from core.notification import Notification
+from core.profiler import Profiler
+from core.tracing import Tracer
 from core.templates import TemplateManager
 from core.twstats import TwStats
 from game.attack import AttackManager
@@ -18,13 +23,18 @@ from game.resources import ResourceManager
 from game.snobber import SnobManager
 from game.troopmanager import TroopManager
 from game.gamestate import GameState
-from game.solver import MultiActionPlanner
+from game.solver import MultiActionPlanner, BeamSearchPlanner
 from game.action_generator import ActionGenerator
+from game.timeline import TimelineSimulator
+from game.planner_replay import PlannerRecorder
+from core.dirty import DirtyTracker
 from core.exceptions import *
 from game.farm_optimizer import FarmOptimizer
 from game.scavenge_optimizer import ScavengeOptimizer
 from game.resource_allocation import ResourceAllocationSolver
 
+_MISSING = object()
+
 
 class Village:
     village_id = None
@@ -52,6 +62,8 @@ class Village:
     hoard_mode = False
     hoard_for_research = False
     _priority_research_unaffordable = False
+    # Config entries that were already reported missing, shared by all villages
+    missing_config = set()
     # --- PERFORMANCE (POINT 2) ---
     overview_html = None
     # --- END PERFORMANCE ---
@@ -75,33 +87,49 @@ class Village:
         # Initialize the AI components
         self.action_generator = ActionGenerator()
         self.solver = MultiActionPlanner(self.action_generator)
+        self.timeline = TimelineSimulator()
+        self.schedule = []
+        self.planner_recorder = None
+        self.dirty = DirtyTracker()
+        self.stage_spans = []
         self.farm_optimizer = None
         self.scavenge_optimizer = None
         self.resource_solver = None
+        # Premium exchange surplus of the last run, sold for all villages at once by twb
+        self.premium_offer = None
+        # Last cache/managed entry, the resource balancer reads it from memory
+        self.cache_entry = None
 
 
     def get_config(self, section, parameter, default=None):
-        if section not in self.config:
-            self.logger.warning("Configuration section %s does not exist!", section)
+        section_data = self.config.get(section)
+        if section_data is None:
+            self.warn_missing_config(section)
             return default
-        if parameter not in self.config[section]:
-            self.logger.warning(
-                "Configuration parameter %s:%s does not exist!", section, parameter
-            )
+        value = section_data.get(parameter, _MISSING)
+        if value is _MISSING:
+            self.warn_missing_config("%s:%s" % (section, parameter))
             return default
-        return self.config[section][parameter]
+        return value
 
     def get_village_config(self, village_id, parameter, default=None):
-        if village_id not in self.config["villages"]:
+        vdata = self.config["villages"].get(village_id)
+        if vdata is None:
             return default
-        vdata = self.config["villages"][village_id]
-        if parameter not in vdata:
-            self.logger.warning(
-                "Village %s configuration parameter %s does not exist!",
-                village_id, parameter
-            )
+        value = vdata.get(parameter, _MISSING)
+        if value is _MISSING:
+            self.warn_missing_config("villages.%s:%s" % (village_id, parameter))
             return default
-        return vdata[parameter]
+        return value
+
+    def warn_missing_config(self, key):
+        """
+        Logs every missing config entry once instead of on every lookup
+        """
+        if key in Village.missing_config:
+            return
+        Village.missing_config.add(key)
+        self.logger.warning("Configuration parameter %s does not exist!", key)
 
     def village_init(self):
         """
@@ -248,6 +276,10 @@ class Village:
                 "TWB_ATTACK",
                 "Village: %s under attack" % self.game_data["village"]["name"],
                 )
+            # Merged into a single message when several villages get attacked at once
+            Notification.send(
+                "Village %s is under attack!" % self.game_data["village"]["name"], key="under_attack"
+            )
         self.last_attack = self.def_man.under_attack
 
     def run_quest_actions(self, config):
@@ -259,6 +291,13 @@ class Village:
                 )
                 return self.run(config=config)
 
+            quest_inputs = {
+                "new_quest": self.game_data.get("player", {}).get("new_quest"),
+                "levels": self.game_data.get("village", {}).get("buildings"),
+            }
+            if not self.is_dirty("quests", quest_inputs):
+                return
+            self.dirty.done("quests")
             if self.get_quest_rewards():
                 self.wrapper.reporter.report(
                     self.village_id, "TWB_QUEST", "Collected quest reward(s)"
@@ -353,12 +392,6 @@ class Village:
             self.logger.error(f"Building template '{self.build_config}' not found or is empty.")
             return
 
-        # Configure builder based on mode
-        if self.builder.mode == "dynamic":
-            self.builder.target_levels = {line.split(':')[0]: int(line.split(':')[1]) for line in template_lines if ':' in line and not line.startswith('#')}
-        else: # linear
-            self.builder.queue = [line for line in template_lines if ':' in line and not line.startswith('#')]
-
         self.builder.raw_template = template_lines
 
         self.builder.max_lookahead = self.get_config(
@@ -371,6 +404,19 @@ class Village:
         # Pass troop queue status to the builder for dynamic mode
         self.builder.troop_queue_status = self.units.get_queue_times()
 
+        if self.builder.levels and not self.is_dirty(
+                "builder", self.builder.dirty_inputs(self.game_data, self.resman.actual)
+        ):
+            # The template did not change (it is an input), keep what is left of the queue
+            self.builder.update_game_state(self.game_state_model)
+            return
+
+        # Configure builder based on mode
+        if self.builder.mode == "dynamic":
+            self.builder.target_levels = {line.split(':')[0]: int(line.split(':')[1]) for line in template_lines if ':' in line and not line.startswith('#')}
+        else: # linear
+            self.builder.queue = [line for line in template_lines if ':' in line and not line.startswith('#')]
+
         self.builder.start_update(
             overview_game_data=self.game_data,
             overview_html=self.overview_html,
@@ -380,6 +426,11 @@ class Village:
             set_village_name=self.village_set_name,
         )
         self.builder.update_game_state(self.game_state_model)
+        self.dirty.done(
+            "builder",
+            self.builder.dirty_inputs(self.game_data, self.resman.actual),
+            due=self.builder.next_due_time(),
+        )
 
     def run_snob_recruit(self):
         """
@@ -560,6 +611,9 @@ class Village:
         """
         Manages the market
         """
+        self.premium_offer = None
+        if not self.is_dirty("market", self.resman.dirty_inputs()):
+            return
         if self.get_config(
                 section="market", parameter="auto_trade", default=False
         ) and self.builder.get_level("market"):
@@ -592,7 +646,98 @@ class Village:
         ):
             # Set the parameter correctly when the config says so.
             self.resman.do_premium_trade = True
-            self.resman.do_premium_stuff()
+            self.premium_offer = self.resman.premium_offer()
+        self.dirty.done("market", self.resman.dirty_inputs(), due=self.resman.next_trade_time())
+
+    def configure_planner(self):
+        """
+        Selects the planner implementation (greedy or beam search) from the config
+        """
+        planner_type = self.get_config(section="planner", parameter="type", default="greedy")
+        if planner_type == "beam":
+            if not isinstance(self.solver, BeamSearchPlanner):
+                self.solver = BeamSearchPlanner(self.action_generator)
+            self.solver.beam_width = self.get_config(section="planner", parameter="beam_width", default=4)
+            self.solver.max_depth = self.get_config(section="planner", parameter="max_depth", default=5)
+            self.solver.time_budget = self.get_config(section="planner", parameter="time_budget", default=0.25)
+        elif isinstance(self.solver, BeamSearchPlanner):
+            self.solver = MultiActionPlanner(self.action_generator)
+
+    def schedule_actions(self, planned_actions):
+        """
+        Projects the planned actions and the not yet affordable template actions onto the timeline
+        """
+        self.timeline.max_build_queue = self.get_config(
+            section="building", parameter="max_queued_items", default=2
+        )
+        self.timeline.horizon = self.get_config(
+            section="planner", parameter="schedule_hours", default=48
+        ) * 3600
+        planned_actions = list(planned_actions or [])
+        # The affordable actions are in the plan already, project every action once
+        planned = {action.name for action in planned_actions}
+        upcoming = [
+            action for action in self.action_generator.generate(self.game_state_model, affordable_only=False)
+            if action.name not in planned
+        ]
+        schedule, _ = self.timeline.project(self.game_state_model, planned_actions + upcoming)
+        now = int(time.time())
+        self.schedule = [
+            {"action": entry.action.name, "start": now + int(entry.start), "finish": now + int(entry.finish)}
+            for entry in schedule
+        ]
+
+    def set_stage(self, stage, status=None):
+        """
+        Marks the start of a run stage, used for the status line, the profiler and the timing spans
+        """
+        if status:
+            self.status = status
+        Profiler.set_stage("village.%s" % stage)
+        if self.stage_spans:
+            self.stage_spans[-1].end()
+        self.stage_spans.append(Tracer.start_span("village.%s" % stage, village_id=self.village_id))
+
+    def stage_timings(self):
+        """
+        Returns duration, request count and bytes of every stage of the current run
+        """
+        return Tracer.summary(self.stage_spans, prefix="village.")
+
+    def is_dirty(self, stage, inputs):
+        """
+        Checks whether a stage has to run this cycle
+        Stages are skipped (including their requests) when their inputs did not change and no timer expired
+        """
+        if not self.get_config(section="bot", parameter="skip_unchanged", default=True):
+            return True
+        self.dirty.max_age = self.get_config(section="bot", parameter="skip_unchanged_max_age", default=3600)
+        if self.dirty.is_dirty(stage, inputs):
+            return True
+        self.logger.debug("Skipping %s, nothing changed since the last run", stage)
+        return False
+
+    def next_due_times(self):
+        """
+        Returns the timestamps at which this village has something to do again
+        Used by the main loop to only wake up villages when needed
+        """
+        now = time.time()
+        due = {}
+        if self.builder:
+            due["build_queue"] = self.builder.next_due_time()
+        if self.units:
+            due["recruit_queue"] = self.units.next_due_time()
+        upcoming = [entry["start"] for entry in self.schedule if entry["start"] > now]
+        if upcoming:
+            due["affordable"] = min(upcoming)
+        if self.attack and self.config and self.get_config(section="farms", parameter="farm", default=False):
+            due["farm"] = self.attack.next_farm_time()
+        if self.def_man:
+            due["defence"] = self.def_man.next_due_time()
+        if self.resman and self.config and self.get_config(section="market", parameter="auto_trade", default=False):
+            due["market"] = self.resman.next_trade_time()
+        return due
 
     def run(self, config=None, first_run=False):
         # setup and check if village still exists / is accessible
@@ -601,7 +746,10 @@ class Village:
             section="bot", parameter="delay_factor", default=1.0
         )
 
-        self.status = "Reading game state..."
+        for span in self.stage_spans:
+            span.end()
+        self.stage_spans = []
+        self.set_stage("init", "Reading game state...")
         data = self.village_init()
 
         if not self.game_data:
@@ -627,32 +775,36 @@ class Village:
         if not self.game_data:
             raise InvalidGameStateException
 
-        self.status = "Updating resources and reports..."
+        self.set_stage("reports", "Updating resources and reports...")
         self.update_pre_run()
         self.resman.calculate_income(self.game_data)
 
-        self.status = "Checking for incoming attacks..."
+        self.set_stage("defence", "Checking for incoming attacks...")
         self.setup_defence_manager(data=data)
         if self.def_man.under_attack:
             self.status = "Under Attack!"
         else:
             self.status = "Idle"
 
+        self.set_stage("quests")
         self.run_quest_actions(config=config)
 
         # The TroopManager needs to be initialized to get troop queue times
+        self.set_stage("units")
         self.units_get_template()
 
         # The BuildingManager needs to be run to populate building levels
-        self.status = "Managing building queue..."
+        self.set_stage("builder", "Managing building queue...")
         self.run_builder()
 
         # Update total troop counts before making recruitment decisions
+        self.set_stage("units")
         self.units.update_totals(self.game_data, self.overview_html)
         self.units.update_game_state(self.game_state_model)
 
 
         # --- New Optimizing Agent Logic ---
+        self.set_stage("targets")
         if not self.area:
             self.area = Map(wrapper=self.wrapper, village_id=self.village_id)
         self.area.get_map()
@@ -673,10 +825,8 @@ class Village:
             self.resource_solver = ResourceAllocationSolver(self.farm_optimizer, self.scavenge_optimizer)
 
         farm_targets = self.attack.get_targets()
-        scavenge_options = Extractor.village_data(self.wrapper.get_url(f"game.php?village={self.village_id}&screen=place&mode=scavenge"))
-
-        marginal_incomes = self.resource_solver.calculate_unified_marginal_income(self.units.troops, farm_targets, scavenge_options)
 
+        self.set_stage("planner")
         self.action_generator.update_data(
             building_templates=self.build_template_full,
             troop_templates=self.unit_template_full,
@@ -684,70 +834,39 @@ class Village:
             recruit_costs=self.units.recruit_data,
             research_costs=self.units._smith_data,
         )
-        planned_actions = self.solver.plan_actions(self.game_state_model, marginal_incomes)
-
-        if planned_actions:
-            self.logger.info(f"Optimal plan: {[a.name for a in planned_actions]}")
-            for action in planned_actions:
-                cost = action.cost()
-                if all(self.resman.actual.get(res, 0) >= cost.get(res, 0) for res in cost):
-                    self.logger.info(f"Executing planned action: {action.name}")
-                    if self.execute_action(action):
-                        for res, amount in cost.items():
-                            self.resman.actual[res] -= amount
-                    else:
-                        self.logger.warning(f"Failed to execute planned action: {action.name}. Stopping.")
-                        break
-                else:
-                    self.logger.warning(f"Could not afford action '{action.name}'. Stopping.")
-                    break
-        else:
-            self.logger.info("No optimal actions could be determined in this cycle.")
+        self.configure_planner()
 
         # --- Resource Gathering ---
         prioritize_gathering = self.get_village_config(
             self.village_id, parameter="prioritize_gathering", default=False
         )
+        gathering_inputs = dict(
+            self.units.dirty_inputs(),
+            forced_peace=self.forced_peace,
+            prioritize_gathering=prioritize_gathering,
+            targets=[village["id"] for village, _ in farm_targets[:self.attack.max_farms]],
+        )
+        run_planner = self.is_dirty("planner", self.solver.dirty_inputs(self.game_state_model))
+        run_gathering = self.is_dirty("gathering", gathering_inputs)
 
-        if not self.forced_peace and self.units.can_attack:
-            if prioritize_gathering:
-                self.logger.info("Prioritizing gathering: executing scavenging-only plan.")
-                plan = self.scavenge_optimizer.create_optimal_plan(
-                    self.units.troops, scavenge_options
-                )
-                if plan:
-                    self.logger.info(
-                        f"Executing optimal scavenging plan with {len(plan)} squads."
-                    )
-                    for scavenge_cmd in plan:
-                        self._execute_scavenge_squad(
-                            scavenge_cmd["option_id"], scavenge_cmd["troops"]
-                        )
-            else:
-                strategy, plan = self.resource_solver.determine_best_strategy(
-                    self.units.troops, farm_targets, scavenge_options
-                )
-                if strategy == "farming":
-                    self.logger.info(
-                        f"Executing optimal farming plan with {len(plan)} attacks."
-                    )
-                    for attack_cmd in plan:
-                        self.attack.attack(
-                            attack_cmd["target_id"], troops=attack_cmd["troops"]
-                        )
-                elif strategy == "scavenging":
-                    self.logger.info(
-                        f"Executing optimal scavenging plan with {len(plan)} squads."
-                    )
-                    for scavenge_cmd in plan:
-                        self._execute_scavenge_squad(
-                            scavenge_cmd["option_id"], scavenge_cmd["troops"]
-                        )
+        scavenge_options = {}
+        marginal_incomes = {}
+        if run_planner or run_gathering:
+            scavenge_options = Extractor.village_data(self.wrapper.get_url(f"game.php?village={self.village_id}&screen=place&mode=scavenge"))
+            marginal_incomes = self.resource_solver.calculate_unified_marginal_income(self.units.troops, farm_targets, scavenge_options)
+
+        if run_planner:
+            self.run_planner(marginal_incomes)
 
-        self.status = "Managing market..."
+        if run_gathering:
+            self.set_stage("gathering")
+            self.run_gathering(farm_targets, scavenge_options, prioritize_gathering)
+            self.dirty.done("gathering", due=self.attack.next_farm_time())
+
+        self.set_stage("market", "Managing market...")
         self.go_manage_market()
 
-        self.status = "Idle"
+        self.set_stage("finish", "Idle")
         self.set_cache_vars()
         self.logger.info("Village cycle done, returning to overview")
         self.wrapper.reporter.report(
@@ -772,6 +891,94 @@ class Village:
             self.village_id, data_type="village.config", data=json.dumps(vdata)
         )
 
+    def run_planner(self, marginal_incomes):
+        """
+        Plans the next build / recruit / research actions and executes the affordable ones
+        """
+        if self.get_config(section="planner", parameter="record", default=False):
+            if not self.planner_recorder:
+                self.planner_recorder = PlannerRecorder(
+                    FileManager.get_path(f"cache/planner/{self.village_id}.twbr")
+                )
+            self.planner_recorder.record(
+                self.game_state_model,
+                building_templates=self.build_template_full,
+                troop_templates=self.unit_template_full,
+                building_costs=self.builder.costs,
+                recruit_costs=self.units.recruit_data,
+                research_costs=self.units._smith_data,
+                marginal_incomes=marginal_incomes,
+            )
+        planned_actions = self.solver.plan_actions(self.game_state_model, marginal_incomes)
+        self.logger.debug("Planner stats: %s", self.solver.last_stats)
+        self.schedule_actions(planned_actions)
+
+        executed = False
+        if planned_actions:
+            self.logger.info(f"Optimal plan: {[a.name for a in planned_actions]}")
+            for action in planned_actions:
+                cost = action.cost()
+                if all(self.resman.actual.get(res, 0) >= cost.get(res, 0) for res in cost):
+                    self.logger.info(f"Executing planned action: {action.name}")
+                    if self.execute_action(action):
+                        executed = True
+                        for res, amount in cost.items():
+                            self.resman.actual[res] -= amount
+                    else:
+                        self.logger.warning(f"Failed to execute planned action: {action.name}. Stopping.")
+                        break
+                else:
+                    self.logger.warning(f"Could not afford action '{action.name}'. Stopping.")
+                    break
+        else:
+            self.logger.info("No optimal actions could be determined in this cycle.")
+
+        # Executed actions change the state, the next cycle re-reads it before planning again
+        upcoming = [entry["start"] for entry in self.schedule if entry["start"] > time.time()]
+        self.dirty.done("planner", due=min(upcoming) if upcoming else None)
+        if executed:
+            self.dirty.invalidate("planner")
+
+    def run_gathering(self, farm_targets, scavenge_options, prioritize_gathering):
+        """
+        Sends the troops at home farming or scavenging, whichever pays more
+        """
+        if self.forced_peace or not self.units.can_attack:
+            return
+        if prioritize_gathering:
+            self.logger.info("Prioritizing gathering: executing scavenging-only plan.")
+            plan = self.scavenge_optimizer.create_optimal_plan(
+                self.units.troops, scavenge_options
+            )
+            if plan:
+                self.logger.info(
+                    f"Executing optimal scavenging plan with {len(plan)} squads."
+                )
+                for scavenge_cmd in plan:
+                    self._execute_scavenge_squad(
+                        scavenge_cmd["option_id"], scavenge_cmd["troops"]
+                    )
+            return
+        strategy, plan = self.resource_solver.determine_best_strategy(
+            self.units.troops, farm_targets, scavenge_options
+        )
+        if strategy == "farming":
+            self.logger.info(
+                f"Executing optimal farming plan with {len(plan)} attacks."
+            )
+            for attack_cmd in plan:
+                self.attack.attack(
+                    attack_cmd["target_id"], troops=attack_cmd["troops"]
+                )
+        elif strategy == "scavenging":
+            self.logger.info(
+                f"Executing optimal scavenging plan with {len(plan)} squads."
+            )
+            for scavenge_cmd in plan:
+                self._execute_scavenge_squad(
+                    scavenge_cmd["option_id"], scavenge_cmd["troops"]
+                )
+
     def execute_action(self, action):
         """
         Executes a given action.
@@ -849,6 +1056,11 @@ class Village:
                         forecast['clay'] += cost.get('stone', 0) * amount
                         forecast['iron'] += cost.get('iron', 0) * amount
 
+        wait = self.timeline.time_until_affordable(
+            self.game_state_model,
+            {'wood': forecast['wood'], 'stone': forecast['clay'], 'iron': forecast['iron']},
+        )
+        forecast['affordable_in'] = None if wait == math.inf else int(wait)
         return forecast
 
     def get_quests(self):
@@ -917,6 +1129,8 @@ class Village:
             "planned_actions": (self.builder.get_planned_actions() or []) + (self.units.get_planned_actions(self.disabled_units) or []) if self.builder and self.units else [],
             "income": self.resman.income if self.resman else {},
             "forecast": self.calculate_resource_forecast(),
+            "schedule": self.schedule,
+            "timings": self.stage_timings(),
         }
         if self.attack and self.attack.last_farm_bag_state:
             current = self.attack.last_farm_bag_state.get("current")
@@ -933,6 +1147,8 @@ class Village:
         else:
             village_entry["farm_bag"] = None
         FileManager.save_json_file(village_entry, f"cache/managed/{self.village_id}.json")
+        self.cache_entry = village_entry
+        EventLog.publish_village(self.village_id, village_entry)
 
     def _check_and_handle_template_switch(self):
         """
@@ -2,22 +2,19 @@
 
 from __future__ import annotations
 
+import heapq
 import logging
+import math
 import re
+import sys
 import time
 from dataclasses import dataclass, field
 from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-try:  # optional dependency
-    import requests  # type: ignore
-    RequestsError = requests.RequestException  # type: ignore[attr-defined]
-except (ImportError, AttributeError):  # pragma: no cover - defensive guard
-    requests = None  # type: ignore
-    RequestsError = Exception
-
-from core.extractors import Extractor
 from core.exceptions import InvalidJSONException
 from core.filemanager import FileManager
+from game.min_cost_flow import MinCostFlow
+from pages.overview import OverviewSnapshot
 
 
 RESOURCE_TYPES = ("wood", "stone", "iron")
@@ -43,6 +40,7 @@ def _parse_coords(text: Optional[str]) -> Tuple[int, int]:
     return int(match.group(1)), int(match.group(2))
 
 
+
 @dataclass
 class RequestEntry:
     resource: str
@@ -98,14 +96,28 @@ class ResourceCoordinator:
         "transfer_cooldown_min": 10,
         "block_when_under_attack": True,
         "dry_run": True,
+        "planner": "flow",
+        "compare_planners": False,
     }
+    SUPPORTED_PLANNERS = {"flow", "greedy"}
 
     MERCHANT_CAPACITY = 1000
     MAX_LEDGER_ENTRIES = 200
+    # Sources connected to every destination by the flow planner, nearest first
+    FLOW_CANDIDATES = 16
 
-    def __init__(self, wrapper, config: Dict[str, Any]):
+    def __init__(
+        self,
+        wrapper,
+        config: Dict[str, Any],
+        overview: Optional[OverviewSnapshot] = None,
+        village_entries: Optional[Dict[str, Dict[str, Any]]] = None,
+    ):
         self.wrapper = wrapper
         self.config = config or {}
+        # Overviews of this cycle and the cache entries of the villages that ran, both from TWB.run
+        self.overview = overview
+        self.village_entries = village_entries or {}
         self.logger = logging.getLogger("ResourceCoordinator")
         self.settings = self._load_settings()
         self.ledger_path = "cache/transfer_ledger.json"
@@ -113,6 +125,7 @@ class ResourceCoordinator:
         self.current_time = time.time()
         self.primary_village_id = self._detect_primary_village()
         self._chunk_warning_emitted = False
+        self.last_plan: Dict[str, Any] = {}
 
     # ------------------------------------------------------------------
     # Public API
@@ -175,6 +188,12 @@ class ResourceCoordinator:
         merged["transfer_cooldown_min"] = max(0, _parse_int(merged.get("transfer_cooldown_min")))
         merged["block_when_under_attack"] = bool(merged.get("block_when_under_attack", True))
         merged["dry_run"] = bool(merged.get("dry_run", True))
+        planner = str(merged.get("planner", "flow"))
+        if planner not in self.SUPPORTED_PLANNERS:
+            self.logger.warning("Unknown balancer planner '%s'; falling back to 'flow'", planner)
+            planner = "flow"
+        merged["planner"] = planner
+        merged["compare_planners"] = bool(merged.get("compare_planners", False))
         return merged
 
     def _detect_primary_village(self) -> Optional[str]:
@@ -190,23 +209,29 @@ class ResourceCoordinator:
         try:
             managed_files = FileManager.list_directory("cache/managed", ends_with=".json")
         except FileNotFoundError:
-            return {}
+            managed_files = []
 
         config_villages = self.config.get("villages") or {}
         states: Dict[str, VillageState] = {}
 
-        for filename in managed_files:
-            if not filename.endswith(".json"):
-                continue
-            village_id = filename[:-5]
+        # Villages that ran in this process are taken from memory, only the others are read from disk
+        village_ids = list(self.village_entries)
+        village_ids += [
+            filename[:-5] for filename in managed_files
+            if filename.endswith(".json") and filename[:-5] not in self.village_entries
+        ]
+
+        for village_id in village_ids:
             if config_villages and village_id not in config_villages:
                 continue
 
-            cache_entry = FileManager.load_json_file(f"cache/managed/{filename}")
+            cache_entry = self.village_entries.get(village_id)
+            if cache_entry is None:
+                cache_entry = FileManager.load_json_file(f"cache/managed/{village_id}.json")
             if cache_entry is None:
                 continue
             if not isinstance(cache_entry, dict):
-                self.logger.warning("Cache entry %s is not a JSON object; skipping", filename)
+                self.logger.warning("Cache entry %s is not a JSON object; skipping", village_id)
                 continue
 
             resources = {
@@ -270,40 +295,36 @@ class ResourceCoordinator:
         return states
 
     def _augment_with_overviews(self, states: Dict[str, VillageState]) -> None:
-        production = self._fetch_overview("overview_villages&mode=prod")
-        if production:
-            for entry in Extractor.overview_production_data(production):
-                vid = str(entry.get("id"))
-                if vid not in states:
-                    continue
-                state = states[vid]
-                state.storage = _parse_int(entry.get("storage"))
-                coord = (entry.get("x", 0), entry.get("y", 0))
-                if coord != (0, 0):
-                    state.coords = (int(coord[0]), int(coord[1]))
-
-        trader_own = self._fetch_overview("overview_villages&mode=trader&type=own")
-        if trader_own:
-            own_data = Extractor.overview_trader_data(trader_own, overview_type="own")
-            for vid, entry in own_data.items():
-                if vid not in states:
-                    continue
-                state = states[vid]
-                state.merchants_avail = _parse_int(entry.get("merchants_avail"))
-                state.merchants_total = _parse_int(entry.get("merchants_total"))
-
-        trader_inc = self._fetch_overview("overview_villages&mode=trader&type=inc")
-        if trader_inc:
-            inc_data = Extractor.overview_trader_data(trader_inc, overview_type="inc")
-            for vid, entry in inc_data.items():
-                if vid not in states:
-                    continue
-                state = states[vid]
-                state.incoming = {
-                    "wood": _parse_int(entry.get("incoming_wood")),
-                    "stone": _parse_int(entry.get("incoming_stone")),
-                    "iron": _parse_int(entry.get("incoming_iron")),
-                }
+        overview = self.overview or OverviewSnapshot(self.wrapper)
+        if not overview.village_id:
+            overview.village_id = self.primary_village_id
+
+        for entry in overview.production():
+            vid = str(entry.get("id"))
+            if vid not in states:
+                continue
+            state = states[vid]
+            state.storage = _parse_int(entry.get("storage"))
+            coord = (entry.get("x", 0), entry.get("y", 0))
+            if coord != (0, 0):
+                state.coords = (int(coord[0]), int(coord[1]))
+
+        for vid, entry in overview.trader("own").items():
+            if vid not in states:
+                continue
+            state = states[vid]
+            state.merchants_avail = _parse_int(entry.get("merchants_avail"))
+            state.merchants_total = _parse_int(entry.get("merchants_total"))
+
+        for vid, entry in overview.trader("inc").items():
+            if vid not in states:
+                continue
+            state = states[vid]
+            state.incoming = {
+                "wood": _parse_int(entry.get("incoming_wood")),
+                "stone": _parse_int(entry.get("incoming_stone")),
+                "iron": _parse_int(entry.get("incoming_iron")),
+            }
 
     def _prepare_runtime_fields(self, states: Dict[str, VillageState]) -> None:
         for state in states.values():
@@ -315,24 +336,51 @@ class ResourceCoordinator:
             state.pending_needs = _zero_resources()
             state.merchant_capacity = max(0, state.merchants_avail * self.MERCHANT_CAPACITY)
 
-    def _fetch_overview(self, path: str) -> Optional[str]:
-        if not self.wrapper:
-            return None
-        try:
-            url = f"game.php?village={self.primary_village_id}&screen={path}"
-            response = self.wrapper.get_url(url)
-            return response.text if response else None
-        except RequestsError as exc:
-            self.logger.warning("Failed to fetch %s due to network error: %s", path, exc)
-            return None
-        except Exception:  # pragma: no cover - defensive guard
-            self.logger.exception("Unexpected failure fetching %s", path)
-            return None
-
     # ------------------------------------------------------------------
     # Planning
     # ------------------------------------------------------------------
     def _plan_shipments(self, states: Dict[str, VillageState]) -> List[Shipment]:
+        self.last_plan = {}
+        if self.settings["planner"] == "greedy" or self.settings["compare_planners"]:
+            started = time.perf_counter()
+            greedy = self._plan_greedy(states)
+            self.last_plan["greedy"] = self._plan_stats(greedy)
+            self.last_plan["greedy"]["seconds"] = round(time.perf_counter() - started, 4)
+            if self.settings["planner"] == "greedy":
+                return greedy
+            # The greedy plan is only kept for the comparison
+            self._prepare_runtime_fields(states)
+
+        started = time.perf_counter()
+        shipments = self._plan_flow(states)
+        flow = self.last_plan["flow"] = self._plan_stats(shipments)
+        flow["seconds"] = round(time.perf_counter() - started, 4)
+        greedy = self.last_plan.get("greedy")
+        if greedy and (flow["shipments"] or greedy["shipments"]):
+            self.logger.info(
+                "Planned %d shipments: %d resources for %d merchant-fields (greedy: %d resources for %d)",
+                flow["shipments"], flow["delivered"], flow["cost"], greedy["delivered"], greedy["cost"],
+            )
+        elif flow["shipments"]:
+            self.logger.info(
+                "Planned %d shipments: %d resources for %d merchant-fields",
+                flow["shipments"], flow["delivered"], flow["cost"],
+            )
+        return shipments
+
+    def _plan_stats(self, shipments: List[Shipment]) -> Dict[str, Any]:
+        """Delivered resources, merchants and merchant travel (merchants x fields) of a plan."""
+        delivered = merchants = 0
+        cost = 0.0
+        for shipment in shipments:
+            total = sum(shipment.resources.get(res, 0) for res in RESOURCE_TYPES)
+            used = math.ceil(total / self.MERCHANT_CAPACITY)
+            delivered += total
+            merchants += used
+            cost += used * self._distance(shipment.source.coords, shipment.destination.coords)
+        return {"shipments": len(shipments), "delivered": delivered, "merchants": merchants, "cost": round(cost)}
+
+    def _plan_greedy(self, states: Dict[str, VillageState]) -> List[Shipment]:
         shipments: Dict[Tuple[str, str], Shipment] = {}
 
         request_needs = self._build_request_needs(states)
@@ -344,6 +392,48 @@ class ResourceCoordinator:
 
         return [shipment for shipment in shipments.values() if not shipment.is_empty()]
 
+    def _plan_flow(self, states: Dict[str, VillageState]) -> List[Shipment]:
+        """
+        Min-cost flow over supply (per source and resource, capped by the merchants of the source)
+        and demand nodes (per destination and resource) with the travel distance as cost.
+        Needs are solved in priority order, later priorities never lower the total an earlier priority
+        receives. Within a priority the resources can be moved between its needs when that is cheaper.
+        """
+        request_needs = self._build_request_needs(states)
+        # Villages short of a resource do not export it
+        network = _ShipmentNetwork(self, states)
+        requested = {state.village_id: dict(state.pending_needs) for state in states.values()}
+        network.solve(request_needs)
+
+        if self.settings["mode"] == "balance_even":
+            # Balance needs are built on what the requests already receive
+            for (village_id, res), units in network.delivered().items():
+                state = states[village_id]
+                state.planned_incoming[res] += units * network.unit
+                state.pending_needs[res] = max(0, state.pending_needs[res] - units * network.unit)
+            balance_needs = self._build_balance_needs(states)
+            for state in states.values():
+                state.planned_incoming = _zero_resources()
+                state.pending_needs = dict(requested[state.village_id])
+            network.solve(balance_needs)
+
+        shipments = network.shipments()
+        max_shipments = self.settings["max_shipments_per_run"]
+        if max_shipments and len(shipments) > max_shipments:
+            self.logger.debug("Shipment cap reached (%d of %d)", max_shipments, len(shipments))
+            shipments = shipments[:max_shipments]
+
+        for shipment in shipments:
+            source, destination = shipment.source, shipment.destination
+            for res in RESOURCE_TYPES:
+                amount = shipment.resources[res]
+                source.remaining_resources[res] -= amount
+                source.planned_outgoing[res] += amount
+                source.merchant_capacity = max(0, source.merchant_capacity - amount)
+                destination.planned_incoming[res] += amount
+                destination.pending_needs[res] = max(0, destination.pending_needs[res] - amount)
+        return shipments
+
     def _build_request_needs(self, states: Dict[str, VillageState]) -> List[Tuple[int, VillageState, str, int]]:
         needs: List[Tuple[int, VillageState, str, int]] = []
         for state in states.values():
@@ -535,6 +625,10 @@ class ResourceCoordinator:
             return max(0, amount)
         return max(0, (amount // chunk) * chunk)
 
+    @staticmethod
+    def _distance(a: Tuple[int, int], b: Tuple[int, int]) -> float:
+        return math.hypot(a[0] - b[0], a[1] - b[1])
+
     @staticmethod
     def _distance_squared(a: Tuple[int, int], b: Tuple[int, int]) -> int:
         ax, ay = a
@@ -668,6 +762,9 @@ class ResourceCoordinator:
 
         if not dry_run and successful:
             self._record_routes(successful)
+            if self.overview:
+                self.overview.invalidate(OverviewSnapshot.TRADER_OWN)
+                self.overview.invalidate(OverviewSnapshot.TRADER_INCOMING)
 
     # ------------------------------------------------------------------
     # Misc helpers
@@ -683,4 +780,141 @@ class ResourceCoordinator:
         return 5
 
 
+class _ShipmentNetwork:
+    """Flow network of a balancer run, amounts are in units of min_chunk."""
+
+    def __init__(self, coordinator: ResourceCoordinator, states: Dict[str, VillageState]):
+        self.coordinator = coordinator
+        self.states = states
+        self.unit = coordinator.settings["min_chunk"] or 1
+        self.flow = MinCostFlow()
+        self.source = self.flow.add_node()
+        # (village, resource) -> supply node
+        self.supply: Dict[Tuple[str, str], int] = {}
+        # resource -> supply villages of it
+        self.suppliers: Dict[str, List[VillageState]] = {res: [] for res in RESOURCE_TYPES}
+        # (village, resource) -> demand node
+        self.demand: Dict[Tuple[str, str], int] = {}
+        # (source village, destination village, resource, edge)
+        self.routes: List[Tuple[str, str, str, int]] = []
+        # (priority, village, resource, edge)
+        self.sinks: List[Tuple[int, str, str, int]] = []
+        self._costs: Dict[Tuple[str, str], int] = {}
+        self._add_supply()
+
+    def _add_supply(self) -> None:
+        coordinator = self.coordinator
+        settings = coordinator.settings
+        for state in self.states.values():
+            if not state.enabled or state.market_level <= 0:
+                continue
+            if settings["block_when_under_attack"] and state.under_attack:
+                continue
+            merchants = state.merchant_capacity // self.unit
+            if merchants <= 0 or state.merchant_capacity < settings["min_chunk"]:
+                continue
+            village_node = None
+            for res in RESOURCE_TYPES:
+                if state.pending_needs.get(res, 0) > 0:
+                    continue
+                units = coordinator._exportable_amount(state, res) // self.unit
+                if units <= 0:
+                    continue
+                if village_node is None:
+                    village_node = self.flow.add_node()
+                    self.flow.add_edge(self.source, village_node, merchants, 0)
+                node = self.flow.add_node()
+                self.flow.add_edge(village_node, node, units, 0)
+                self.supply[(state.village_id, res)] = node
+                self.suppliers[res].append(state)
+
+    def _cost(self, source: VillageState, destination: VillageState) -> int:
+        key = (source.village_id, destination.village_id)
+        if key not in self._costs:
+            # The capital feeds new villages first, as in the greedy planner
+            if source.village_id == self.coordinator.primary_village_id:
+                self._costs[key] = 0
+            else:
+                self._costs[key] = round(self.coordinator._distance(source.coords, destination.coords))
+        return self._costs[key]
+
+    def _demand_node(self, destination: VillageState, res: str) -> Optional[int]:
+        key = (destination.village_id, res)
+        if key in self.demand:
+            return self.demand[key]
+        candidates = []
+        for source in self.suppliers[res]:
+            if source.village_id == destination.village_id:
+                continue
+            if self.coordinator._route_on_cooldown((source.village_id, destination.village_id)):
+                continue
+            candidates.append((self._cost(source, destination), source))
+        candidates = heapq.nsmallest(self.coordinator.FLOW_CANDIDATES, candidates, key=lambda item: item[0])
+        arcs = [(self.supply[(source.village_id, res)], cost) for cost, source in candidates]
+        node = self.flow.add_node(self.flow.entry_potential(arcs)) if arcs else None
+        for cost, source in candidates:
+            edge = self.flow.add_edge(self.supply[(source.village_id, res)], node, sys.maxsize, cost)
+            self.routes.append((source.village_id, destination.village_id, res, edge))
+        self.demand[key] = node
+        return node
+
+    def solve(self, needs: Iterable[Tuple[int, VillageState, str, int]]) -> None:
+        """
+        Every priority gets its own sink. Paths of a later priority can pass through an earlier sink,
+        which moves units between the needs of that priority but keeps its total.
+        """
+        tiers: Dict[int, List[Tuple[int, int]]] = {}
+        for priority, destination, res, amount in needs:
+            units = amount // self.unit
+            node = self._demand_node(destination, res) if units > 0 else None
+            if node is None:
+                continue
+            tiers.setdefault(priority, []).append((destination.village_id, res, node, units))
+        for priority in sorted(tiers):
+            entries = tiers[priority]
+            sink = self.flow.add_node(self.flow.entry_potential([(node, 0) for _, _, node, _ in entries]))
+            for village_id, res, node, units in entries:
+                edge = self.flow.add_edge(node, sink, units, 0)
+                self.sinks.append((priority, village_id, res, edge))
+            self.flow.run(self.source, sink)
+
+    def delivered(self) -> Dict[Tuple[str, str], int]:
+        totals: Dict[Tuple[str, str], int] = {}
+        for _, village_id, res, edge in self.sinks:
+            units = self.flow.flow(edge)
+            if units:
+                totals[(village_id, res)] = totals.get((village_id, res), 0) + units
+        return totals
+
+    def shipments(self) -> List[Shipment]:
+        """Shipments of the flow, the ones serving the most urgent needs first."""
+        priorities: Dict[Tuple[str, str], int] = {}
+        for priority, village_id, res, edge in self.sinks:
+            if self.flow.flow(edge):
+                key = (village_id, res)
+                priorities[key] = min(priority, priorities.get(key, priority))
+        shipments: Dict[Tuple[str, str], Shipment] = {}
+        urgency: Dict[Tuple[str, str], int] = {}
+        for source_id, destination_id, res, edge in self.routes:
+            units = self.flow.flow(edge)
+            if not units:
+                continue
+            key = (source_id, destination_id)
+            if key not in shipments:
+                shipments[key] = Shipment(
+                    source=self.states[source_id],
+                    destination=self.states[destination_id],
+                    resources=_zero_resources(),
+                )
+            shipments[key].resources[res] += units * self.unit
+            urgency[key] = min(priorities.get((destination_id, res), 50), urgency.get(key, 50))
+        return sorted(
+            shipments.values(),
+            key=lambda shipment: (
+                urgency[(shipment.source.village_id, shipment.destination.village_id)],
+                -sum(shipment.resources.values()),
+            ),
+        )
+
+
 __all__ = ["ResourceCoordinator"]
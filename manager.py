@@ -79,8 +79,10 @@ class VillageManager:
                 os.remove(os.path.abspath(oldest_file))
 
     @staticmethod
-    def resource_balancer(wrapper, config):
-        coordinator = ResourceCoordinator(wrapper=wrapper, config=config)
+    def resource_balancer(wrapper, config, overview=None, village_entries=None):
+        coordinator = ResourceCoordinator(
+            wrapper=wrapper, config=config, overview=overview, village_entries=village_entries
+        )
         try:
             coordinator.run()
         except Exception as exc:  # pragma: no cover - defensive guard
@@ -1,13 +1,15 @@
 import dataclasses
 import logging
 import re
-from typing import Dict, Optional, Tuple
-
-from bs4 import BeautifulSoup
-from requests import Response
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
+from core.extractors import Extractor
 from core.request import WebWrapper
 
+if TYPE_CHECKING:
+    from requests import Response
+
 
 logger = logging.getLogger("OverviewPage")
 
@@ -222,7 +224,7 @@ class OverviewPage:
         """
         self.wrapper: WebWrapper = wrapper
         self.world_settings: WorldSettings = WorldSettings()
-        self.result_get: Response = self._get_overview_villages_data()
+        self.result_get: "Response" = self._get_overview_villages_data()
         self.received_screen = self._detect_screen_type()
 
         # Log warning if we received the wrong screen
@@ -232,6 +234,8 @@ class OverviewPage:
                 "This may cause issues with village detection. Using fallback methods."
             )
 
+        from bs4 import BeautifulSoup
+
         self.soup = BeautifulSoup(self.result_get.text, "html.parser")
         self.header_info = self.soup.find("table", id="header_info")
         self.production_table = self.soup.find("table", id="production_table")
@@ -241,7 +245,8 @@ class OverviewPage:
 
     def _get_overview_villages_data(self):
         """Get the overview villages data using the wrapper object."""
-        return self.wrapper.get_url("game.php?screen=overview_villages")
+        # The game remembers the last mode, ask for the production table explicitly
+        return self.wrapper.get_url("game.php?screen=overview_villages&mode=prod")
 
     def _detect_screen_type(self) -> str:
         """
@@ -312,3 +317,80 @@ class OverviewPage:
             continent = match.group(4)
             return name, coordinates, continent
         return None
+
+
+class OverviewSnapshot:
+    """
+    Overview pages of the current cycle
+
+    TWB.run stores the production overview it loads anyway, the premium trader and the resource
+    balancer read the overviews from here after the villages ran, so every page is requested at
+    most once per cycle (or once per `max_age` seconds when that is set).
+    """
+
+    PRODUCTION = "overview_villages&mode=prod"
+    TRADER_OWN = "overview_villages&mode=trader&type=own"
+    TRADER_INCOMING = "overview_villages&mode=trader&type=inc"
+
+    def __init__(self, wrapper, village_id: Optional[str] = None, max_age: Optional[float] = None):
+        self.wrapper = wrapper
+        self.village_id = village_id
+        self.max_age = max_age
+        # path -> (time loaded, html)
+        self.pages: Dict[str, Tuple[float, str]] = {}
+        self.parsed: Dict[str, Any] = {}
+        self.requests = 0
+
+    def new_cycle(self, overview_page: Optional[OverviewPage] = None, village_id: Optional[str] = None) -> None:
+        """Forgets the pages of the last cycle, keeps the production page of this one."""
+        self.pages = {}
+        self.parsed = {}
+        if village_id:
+            self.village_id = village_id
+        if overview_page is not None and overview_page.production_table is not None:
+            self.store(self.PRODUCTION, overview_page.result_get.text)
+
+    def store(self, path: str, text: str) -> None:
+        self.pages[path] = (time.time(), text)
+        self.parsed.pop(path, None)
+
+    def invalidate(self, path: str) -> None:
+        """Marks a page as stale, e.g. the merchants after sending some."""
+        self.pages.pop(path, None)
+        self.parsed.pop(path, None)
+
+    def page(self, path: str) -> Optional[str]:
+        cached = self.pages.get(path)
+        if cached and (self.max_age is None or time.time() - cached[0] <= self.max_age):
+            return cached[1]
+        if not self.wrapper:
+            return None
+        village = f"village={self.village_id}&" if self.village_id else ""
+        try:
+            self.requests += 1
+            response = self.wrapper.get_url(f"game.php?{village}screen={path}")
+        except Exception as exc:
+            logger.warning("Failed to fetch %s: %s", path, exc)
+            return None
+        if not response:
+            return None
+        self.store(path, response.text)
+        return response.text
+
+    def _parse(self, path: str, parser):
+        # A page that is loaded again drops its parsed data (store)
+        text = self.page(path)
+        if text is None:
+            return None
+        if path not in self.parsed:
+            self.parsed[path] = parser(text)
+        return self.parsed[path]
+
+    def production(self) -> List[Dict[str, Any]]:
+        """Rows of the production overview (Extractor.overview_production_data)."""
+        return self._parse(self.PRODUCTION, Extractor.overview_production_data) or []
+
+    def trader(self, overview_type: str = "own") -> Dict[str, Dict[str, int]]:
+        """Merchants ("own") or incoming resources ("inc") per village."""
+        path = self.TRADER_OWN if overview_type == "own" else self.TRADER_INCOMING
+        return self._parse(path, lambda text: Extractor.overview_trader_data(text, overview_type=overview_type)) or {}
@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from game.action_generator import ActionGenerator
 from game.gamestate import GameState
 
@@ -41,5 +41,75 @@ class TestActionGenerator(unittest.TestCase):
         self.assertEqual(actions[0].building, 'main')
         self.assertEqual(actions[1].building, 'farm')
 
+    def test_build_costs_are_compiled_without_non_resource_keys(self):
+        building_costs = {
+            'main': {'wood': '100', 'stone': 100, 'iron': 100, 'pop': 2, 'build_time': 600,
+                     'can_build': True, 'build_link': 'game.php?x'},
+        }
+        building_templates = {"template_data": ["main:2", "main:3"]}
+        self.action_generator.update_data(building_templates, {}, building_costs, {}, {})
+
+        actions = self.action_generator.generate(self.game_state)
+
+        # Both template lines point to the same next level, only one action is generated
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(actions[0].cost(), {'wood': 100, 'stone': 100, 'iron': 100, 'pop': 2})
+        self.assertEqual(actions[0].duration, 600)
+        self.assertEqual(actions[0].level, 2)
+
+    def test_update_data_only_recompiles_changed_sources(self):
+        building_templates = {"template_data": ["main:5"]}
+        self.action_generator.update_data(building_templates, {}, self.action_generator.building_costs, {}, {})
+
+        with patch.object(self.action_generator, '_compile_build_template') as compile_template:
+            self.action_generator.update_data(
+                {"template_data": ["main:5"]}, {}, dict(self.action_generator.building_costs), {}, {}
+            )
+            compile_template.assert_not_called()
+
+            self.action_generator.update_data(
+                {"template_data": ["main:6"]}, {}, self.action_generator.building_costs, {}, {}
+            )
+            compile_template.assert_called_once()
+
+    def test_generate_reuses_compiled_actions(self):
+        building_templates = {"template_data": ["main:5"]}
+        self.action_generator.update_data(building_templates, {}, self.action_generator.building_costs, {}, {})
+
+        first = self.action_generator.generate(self.game_state)
+        second = self.action_generator.generate(self.game_state)
+
+        self.assertIs(first[0], second[0])
+
+    def test_recruit_and_research_actions(self):
+        troop_templates = {"template_data": [
+            {"building": "barracks", "level": 1, "build": {"barracks": {"spear": 100}}, "upgrades": {"spear": 1}},
+            {"building": "barracks", "level": 5, "build": {"barracks": {"spear": 500, "axe": 100}}},
+        ]}
+        recruit_costs = {
+            'spear': {'wood': 50, 'stone': 30, 'iron': 10, 'pop': 1, 'build_time': 20},
+            'axe': {'wood': 60, 'stone': 30, 'iron': 40, 'pop': 1, 'build_time': 30},
+        }
+        research_costs = {'available': {
+            'spear': {'wood': 100, 'stone': 100, 'iron': 100, 'level': 0, 'requirements': {'smith': 1}},
+        }}
+        self.game_state.building_levels = {'barracks': 1, 'smith': 1}
+        self.action_generator.update_data({}, troop_templates, {}, recruit_costs, research_costs)
+
+        actions = self.action_generator.generate(self.game_state)
+
+        self.assertEqual([a.name for a in actions],
+                         ["Recruit 10 of spear", "Recruit 10 of axe", "Research spear to level 1"])
+        self.assertEqual(actions[0].duration, 200)
+        self.assertEqual(actions[2].cost(), {'wood': 100, 'stone': 100, 'iron': 100})
+
+    def test_generate_can_include_unaffordable_actions(self):
+        self.game_state.resources = {'wood': 0, 'stone': 0, 'iron': 0}
+        building_templates = {"template_data": ["main:5"]}
+        self.action_generator.update_data(building_templates, {}, self.action_generator.building_costs, {}, {})
+
+        self.assertEqual(self.action_generator.generate(self.game_state), [])
+        self.assertEqual(len(self.action_generator.generate(self.game_state, affordable_only=False)), 1)
+
 if __name__ == '__main__':
     unittest.main()
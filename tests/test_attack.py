@@ -0,0 +1,30 @@
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from game.attack import AttackManager
+
+
+class TestNextFarmTime(unittest.TestCase):
+
+    def setUp(self):
+        self.attack = AttackManager(village_id='1', troopmanager=MagicMock(can_attack=True))
+        self.attack.targets = [[{"id": "10"}, 3.0], [{"id": "11"}, 4.0]]
+
+    @patch('game.attack.AttackCache.get_cache', return_value=None)
+    def test_new_targets_are_due_when_troops_are_home(self, _):
+        self.attack.troopmanager.troops = {'spear': '20', 'spy': '2'}
+        self.assertAlmostEqual(self.attack.next_farm_time(), time.time(), delta=2)
+
+    @patch('game.attack.AttackCache.get_cache', return_value=None)
+    def test_no_farm_due_without_troops_at_home(self, _):
+        # Only scouts at home, nothing that can carry loot
+        self.attack.troopmanager.troops = {'spear': '0', 'spy': '5'}
+        self.assertIsNone(self.attack.next_farm_time())
+        self.attack.troopmanager.troops = {'light': '10'}
+        self.attack.troopmanager.can_attack = False
+        self.assertIsNone(self.attack.next_farm_time())
+
+
+if __name__ == '__main__':
+    unittest.main()
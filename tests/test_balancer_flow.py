@@ -0,0 +1,238 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from game.min_cost_flow import MinCostFlow
+from pages.overview import OverviewSnapshot
+from game.warehouse_balancer import (
+    ResourceCoordinator, RequestEntry, VillageState, _ShipmentNetwork, _zero_resources,
+)
+
+
+def village(village_id, coords, resources, merchants=10, requests=(), storage=100000):
+    totals = _zero_resources()
+    entries = []
+    for res, amount, source in requests:
+        entries.append(RequestEntry(res, amount, ResourceCoordinator._source_priority(source), source))
+        totals[res] += amount
+    return VillageState(
+        village_id=village_id, name="Village", coords=coords, storage=storage, resources=dict(resources),
+        incoming=_zero_resources(), requests=sorted(entries, key=lambda r: (r.priority, -r.amount)),
+        request_totals=totals, under_attack=False, market_level=10, merchants_avail=merchants,
+        merchants_total=merchants, enabled=True,
+    )
+
+
+def coordinator(mode="requests_only", **settings):
+    settings.update({"enabled": True, "mode": mode, "transfer_cooldown_min": 0})
+    result = ResourceCoordinator(None, {"balancer": settings})
+    result.primary_village_id = None
+    return result
+
+
+def random_villages(amount, seed=1):
+    rnd = random.Random(seed)
+    states = {}
+    for i in range(amount):
+        resources = {res: rnd.randint(5000, 95000) for res in ("wood", "stone", "iron")}
+        requests = []
+        if rnd.random() < 0.3:
+            for res in ("wood", "stone", "iron"):
+                if rnd.random() < 0.5:
+                    source = rnd.choice(["building", "snob", "recruitment_barracks"])
+                    requests.append((res, resources[res] + rnd.randint(2000, 30000), source))
+        vid = str(1000 + i)
+        states[vid] = village(vid, (rnd.randint(400, 600), rnd.randint(400, 600)), resources,
+                              merchants=rnd.randint(5, 60), requests=requests)
+    return states
+
+
+class TestMinCostFlow(unittest.TestCase):
+    def test_transport_problem_matches_brute_force(self):
+        supply = [3, 2]
+        demand = [2, 3]
+        costs = [[4, 1], [2, 5]]
+        flow = MinCostFlow()
+        s, t = flow.add_node(), flow.add_node()
+        sources = [flow.add_node() for _ in supply]
+        sinks = [flow.add_node() for _ in demand]
+        for i, amount in enumerate(supply):
+            flow.add_edge(s, sources[i], amount, 0)
+            for j in range(len(demand)):
+                flow.add_edge(sources[i], sinks[j], 10, costs[i][j])
+        for j, amount in enumerate(demand):
+            flow.add_edge(sinks[j], t, amount, 0)
+
+        sent, cost = flow.run(s, t)
+
+        # a units from source 0 to sink 0 decide the rest of the plan
+        best = min(
+            a * costs[0][0] + (3 - a) * costs[0][1] + (2 - a) * costs[1][0] + a * costs[1][1]
+            for a in range(3)
+        )
+        self.assertEqual(sent, 5)
+        self.assertEqual(cost, best)
+
+    def test_sinks_added_later_keep_earlier_flow(self):
+        flow = MinCostFlow()
+        s, a, b = flow.add_node(), flow.add_node(), flow.add_node()
+        flow.add_edge(s, a, 5, 0)
+        first = flow.add_node(flow.entry_potential([(a, 1)]))
+        flow.add_edge(a, first, 5, 1)
+        flow.add_edge(s, b, 5, 0)
+        t1 = flow.add_node(flow.entry_potential([(first, 0)]))
+        flow.add_edge(first, t1, 4, 0)
+        self.assertEqual(flow.run(s, t1), (4, 4))
+
+        second = flow.add_node(flow.entry_potential([(a, 3), (b, 7)]))
+        flow.add_edge(a, second, 5, 3)
+        flow.add_edge(b, second, 5, 7)
+        t2 = flow.add_node(flow.entry_potential([(second, 0)]))
+        flow.add_edge(second, t2, 3, 0)
+        # One unit is left at a, the rest comes from b
+        self.assertEqual(flow.run(s, t2), (3, 3 + 2 * 7))
+
+
+class TestFlowPlanner(unittest.TestCase):
+    def test_respects_merchants_and_reserves(self):
+        states = {
+            "1": village("1", (500, 500), {"wood": 50000, "stone": 50000, "iron": 50000}, merchants=4),
+            "2": village("2", (510, 500), {"wood": 1000, "stone": 1000, "iron": 1000}, merchants=0,
+                         requests=[("wood", 6000, "building"), ("stone", 3000, "building")]),
+        }
+        balancer = coordinator()
+        balancer._prepare_runtime_fields(states)
+
+        shipments = balancer._plan_shipments(states)
+
+        self.assertEqual(len(shipments), 1)
+        self.assertEqual(sum(shipments[0].resources.values()), 4000)
+        self.assertEqual(states["1"].merchant_capacity, 0)
+        self.assertEqual(states["2"].planned_incoming["wood"] + states["2"].planned_incoming["stone"], 4000)
+
+    def test_urgent_needs_first_and_nearest_source(self):
+        states = {
+            "near": village("near", (500, 500), {"wood": 40000, "stone": 0, "iron": 0}, merchants=5),
+            "far": village("far", (600, 600), {"wood": 40000, "stone": 0, "iron": 0}, merchants=0),
+            "builder": village("builder", (540, 540), {"wood": 0, "stone": 0, "iron": 0},
+                               requests=[("wood", 5000, "building")]),
+            "barracks": village("barracks", (499, 500), {"wood": 0, "stone": 0, "iron": 0},
+                                requests=[("wood", 5000, "recruitment_barracks")]),
+        }
+        balancer = coordinator()
+        balancer._prepare_runtime_fields(states)
+
+        shipments = balancer._plan_shipments(states)
+
+        # Only one load can be sent, the building need gets it even though barracks is closer
+        routes = {(s.source.village_id, s.destination.village_id): s.resources["wood"] for s in shipments}
+        self.assertEqual(routes, {("near", "builder"): 5000})
+
+        states["far"].merchants_avail = 5
+        balancer._prepare_runtime_fields(states)
+        shipments = balancer._plan_shipments(states)
+
+        routes = {(s.source.village_id, s.destination.village_id): s.resources["wood"] for s in shipments}
+        self.assertEqual(routes, {("near", "barracks"): 5000, ("far", "builder"): 5000})
+        self.assertEqual(shipments[0].destination.village_id, "builder")
+
+    def test_not_worse_than_greedy(self):
+        for mode in ("requests_only", "balance_even"):
+            states = random_villages(60, seed=3)
+            balancer = coordinator(mode, max_shipments_per_run=0, compare_planners=True)
+            balancer._prepare_runtime_fields(states)
+            balancer._plan_shipments(states)
+            flow, greedy = balancer.last_plan["flow"], balancer.last_plan["greedy"]
+            self.assertGreaterEqual(flow["delivered"], greedy["delivered"])
+            self.assertLessEqual(flow["cost"], greedy["cost"])
+            for state in states.values():
+                self.assertGreaterEqual(state.merchant_capacity, 0)
+                for res in ("wood", "stone", "iron"):
+                    self.assertGreaterEqual(state.remaining_resources[res], 0)
+
+    def test_300_villages_in_under_a_second(self):
+        states = random_villages(300)
+        balancer = coordinator("requests_first", max_shipments_per_run=0)
+        balancer._prepare_runtime_fields(states)
+        balancer._plan_shipments(states)
+        self.assertGreater(balancer.last_plan["flow"]["shipments"], 50)
+        self.assertLess(balancer.last_plan["flow"]["seconds"], 1.0)
+
+    def test_greedy_plan_only_for_comparison(self):
+        states = random_villages(20)
+        balancer = coordinator()
+        balancer._prepare_runtime_fields(states)
+        with patch.object(balancer, "_plan_greedy") as plan_greedy:
+            balancer._plan_shipments(states)
+        plan_greedy.assert_not_called()
+        self.assertNotIn("greedy", balancer.last_plan)
+
+    def test_later_priorities_keep_the_total_of_earlier_ones(self):
+        states = random_villages(80, seed=5)
+        balancer = coordinator(max_shipments_per_run=0)
+        balancer._prepare_runtime_fields(states)
+        needs = balancer._build_request_needs(states)
+        network = _ShipmentNetwork(balancer, states)
+        totals = []
+        run = network.flow.run
+
+        def record(s, t):
+            result = run(s, t)
+            tier = {}
+            for priority, _, _, edge in network.sinks:
+                tier[priority] = tier.get(priority, 0) + network.flow.flow(edge)
+            totals.append(tier)
+            return result
+
+        with patch.object(network.flow, "run", side_effect=record):
+            network.solve(needs)
+
+        self.assertGreater(len(totals), 1)
+        for before, after in zip(totals, totals[1:]):
+            for priority, units in before.items():
+                self.assertEqual(after[priority], units)
+
+    def test_greedy_planner_setting(self):
+        states = random_villages(20)
+        balancer = coordinator(planner="greedy")
+        balancer._prepare_runtime_fields(states)
+        balancer._plan_shipments(states)
+        self.assertNotIn("flow", balancer.last_plan)
+
+
+class TestCycleOverview(unittest.TestCase):
+    def test_uses_village_entries_and_snapshot(self):
+        entries = {
+            "1": {"name": "A (500|500) K55", "resources": {"wood": 20000, "stone": 100, "iron": 100},
+                  "building_levels": {"market": 10}},
+            "2": {"name": "B (510|500) K55", "resources": {"wood": 0, "stone": 0, "iron": 0},
+                  "building_levels": {"market": 10}, "required_resources": {"building": {"wood": 3000}}},
+        }
+        overview = OverviewSnapshot(MagicMock(), village_id="1")
+        overview.parsed = {
+            OverviewSnapshot.PRODUCTION: [{"id": "1", "storage": 30000}, {"id": "2", "storage": 30000}],
+            OverviewSnapshot.TRADER_OWN: {"1": {"merchants_avail": 5, "merchants_total": 5}},
+            OverviewSnapshot.TRADER_INCOMING: {},
+        }
+        overview.pages = {path: (0, "") for path in overview.parsed}
+        settings = {"enabled": True, "mode": "requests_only", "transfer_cooldown_min": 0}
+
+        with tempfile.TemporaryDirectory() as home, patch.dict(os.environ, {"TWB_HOME": home}):
+            balancer = ResourceCoordinator(MagicMock(), {"balancer": settings}, overview=overview,
+                                           village_entries=entries)
+            balancer.primary_village_id = "1"
+            states = balancer._load_village_states()
+            balancer._augment_with_overviews(states)
+
+        self.assertEqual(set(states), {"1", "2"})
+        self.assertEqual(states["1"].merchants_avail, 5)
+        self.assertEqual(states["2"].storage, 30000)
+        self.assertEqual(states["2"].request_totals["wood"], 3000)
+        self.assertEqual(overview.requests, 0)
+        overview.wrapper.get_url.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
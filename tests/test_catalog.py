@@ -0,0 +1,80 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from webmanager.catalog import Template, TemplateCatalog, level_rows
+
+
+class TestTemplateCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        for category in ("builder", "troops", "offensive"):
+            os.makedirs(os.path.join(self.tmpdir.name, category))
+        self.write("builder/basic.txt", "# start\nwood:1\nstone:1\nwood:3\n")
+        self.write("builder/rush.json", json.dumps({"mode": "linear", "template_data": ["main:2", "main:5"],
+                                                    "next_template": {"template_name": "basic"}}))
+        self.write("troops/basic.txt", json.dumps([{"building": "barracks", "level": 1, "build": {}}]))
+        self.write("offensive/clear.txt", json.dumps({"village": "any", "groups": []}))
+        self.catalog = TemplateCatalog(self.tmpdir.name, min_interval=0)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, path, text, mtime=None):
+        path = os.path.join(self.tmpdir.name, path)
+        with open(path, "w") as f:
+            f.write(text)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def test_indexes_txt_and_json_templates(self):
+        self.assertEqual(self.catalog.names("builder"), ["basic", "rush"])
+        self.assertEqual(self.catalog.names("troops"), ["basic"])
+        self.assertEqual(self.catalog.names("offensive"), ["clear"])
+
+        rows = self.catalog.building_rows()
+        self.assertEqual(rows["basic.txt"][2], {"building": "wood", "from": 1, "to": 3})
+        self.assertEqual(rows["rush.json"], [{"building": "main", "from": 0, "to": 2},
+                                             {"building": "main", "from": 2, "to": 5}])
+        self.assertEqual(self.catalog.get("builder")["rush.json"].next_template, "basic")
+        self.assertTrue(all(template.valid for template in self.catalog.get("builder").values()))
+
+    def test_validation_errors(self):
+        self.write("builder/broken.txt", "wood:1\ncastle:2\nstone:x\n")
+        self.write("troops/broken.json", '[{"building": "barracks"}')
+        self.write("offensive/broken.txt", "[]")
+        self.assertEqual(self.catalog.get("builder")["broken.txt"].errors,
+                         ["Line 2: unknown building castle", "Line 3: invalid level x"])
+        self.assertTrue(self.catalog.get("troops")["broken.json"].errors[0].startswith("Invalid JSON"))
+        self.assertEqual(self.catalog.get("offensive")["broken.txt"].errors, ["Expected an object with a groups list"])
+
+    def test_only_changed_files_are_parsed(self):
+        self.catalog.get("builder")
+        with patch("webmanager.catalog.Template", wraps=Template) as parse:
+            self.assertEqual(self.catalog.refresh("builder"), set())
+            self.write("builder/basic.txt", "wood:2\n", mtime=1000)
+            os.remove(os.path.join(self.tmpdir.name, "builder", "rush.json"))
+            self.assertEqual(self.catalog.refresh("builder"), {"basic.txt", "rush.json"})
+            self.assertEqual(parse.call_count, 1)
+        self.assertEqual(self.catalog.names("builder"), ["basic"])
+
+    def test_refresh_is_rate_limited(self):
+        catalog = TemplateCatalog(self.tmpdir.name, min_interval=60)
+        self.assertEqual(catalog.names("builder"), ["basic", "rush"])
+        self.write("builder/new.txt", "wood:1\n")
+        with patch("webmanager.catalog.os.scandir") as scandir:
+            for _ in range(50):
+                catalog.names("builder")
+            scandir.assert_not_called()
+        catalog.refresh("builder", force=True)
+        self.assertIn("new", catalog.names("builder"))
+
+    def test_level_rows_skip_comments(self):
+        self.assertEqual(level_rows(["# comment", "", "farm:2"]), [{"building": "farm", "from": 0, "to": 2}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from core.connectivity import ConnectivityMonitor, CLOSED, OPEN
+from core.request import WebWrapper
+
+
+class TestConnectivityMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = ConnectivityMonitor(failure_threshold=3, min_backoff=5, max_backoff=40)
+
+    def test_opens_after_consecutive_failures(self):
+        self.monitor.record_failure("timeout", now=0)
+        self.monitor.record_failure("timeout", now=1)
+        self.monitor.record_success(now=2)
+        self.monitor.record_failure("timeout", now=3)
+        self.monitor.record_failure("timeout", now=4)
+        self.assertTrue(self.monitor.online)
+
+        self.monitor.record_failure("timeout", now=5)
+        self.assertEqual(self.monitor.state, OPEN)
+        self.assertFalse(self.monitor.allow_request())
+        self.assertEqual(self.monitor.seconds_until_probe(now=6), 4)
+
+    def test_probes_with_exponential_backoff_until_back(self):
+        self.monitor.trip("down")
+        outcomes = iter([False, False, False, False, True])
+        sleeps = []
+
+        with patch("core.connectivity.time.time", side_effect=lambda: self.monitor.next_probe - 1):
+            self.monitor.wait_until_online(lambda: next(outcomes), sleep=sleeps.append)
+
+        self.assertEqual(self.monitor.state, CLOSED)
+        self.assertEqual(self.monitor.outages, 1)
+        self.assertEqual(len(sleeps), 5)
+        self.assertEqual(self.monitor.backoff, 0)
+
+    def test_backoff_is_capped(self):
+        self.monitor.trip("down", now=0)
+        with patch.object(self.monitor, "seconds_until_probe", return_value=0):
+            outcomes = iter([False] * 6 + [True])
+            backoffs = []
+
+            def probe():
+                result = next(outcomes)
+                backoffs.append(self.monitor.backoff)
+                return result
+
+            self.monitor.wait_until_online(probe, sleep=lambda _: None)
+        self.assertEqual(backoffs, [5, 10, 20, 40, 40, 40, 40])
+
+
+class TestWebWrapperConnectivity(unittest.TestCase):
+
+    def setUp(self):
+        self.wrapper = WebWrapper("https://nl1.tribalwars.nl/", endpoint="https://nl1.tribalwars.nl/game.php")
+        self.wrapper.priority_mode = True
+        self.wrapper.web = MagicMock()
+
+    def test_transport_errors_open_the_circuit_and_fail_fast(self):
+        self.wrapper.web.get.side_effect = requests.ConnectionError("refused")
+        for _ in range(3):
+            self.assertIsNone(self.wrapper.get_url("game.php?screen=overview"))
+        self.assertFalse(self.wrapper.connectivity.online)
+
+        self.wrapper.web.get.reset_mock()
+        self.assertIsNone(self.wrapper.get_url("game.php?screen=overview"))
+        self.assertIsNone(self.wrapper.post_url("game.php?screen=main", data={"a": 1}))
+        self.wrapper.web.get.assert_not_called()
+        self.wrapper.web.post.assert_not_called()
+
+    def test_parse_errors_do_not_count(self):
+        self.wrapper.web.get.side_effect = ValueError("broken page")
+        for _ in range(5):
+            self.wrapper.get_url("game.php?screen=overview")
+        self.assertTrue(self.wrapper.connectivity.online)
+
+    def test_server_errors_count_and_probe_resumes(self):
+        self.wrapper.web.get.return_value = MagicMock(status_code=502, text="", content=b"")
+        for _ in range(3):
+            self.wrapper.get_url("game.php?screen=overview")
+        self.assertFalse(self.wrapper.connectivity.online)
+
+        self.wrapper.web.get.return_value = MagicMock(status_code=200, text="", content=b"")
+        with patch("core.connectivity.time.sleep"):
+            self.wrapper.wait_for_connection()
+        self.assertTrue(self.wrapper.connectivity.online)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from core.dirty import DirtyTracker
+from game.buildingmanager import BuildingManager
+from game.village import Village
+
+
+class TestDirtyTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = DirtyTracker(max_age=3600)
+
+    def test_first_run_is_dirty(self):
+        self.assertTrue(self.tracker.is_dirty('builder', {'levels': {'main': 1}}, now=0))
+
+    def test_unchanged_inputs_are_skipped(self):
+        self.tracker.is_dirty('builder', {'levels': {'main': 1}}, now=0)
+        self.tracker.done('builder', now=0)
+
+        self.assertFalse(self.tracker.is_dirty('builder', {'levels': {'main': 1}}, now=100))
+        self.assertTrue(self.tracker.is_dirty('builder', {'levels': {'main': 2}}, now=100))
+        self.assertEqual(self.tracker.skipped, {'builder': 1})
+
+    def test_expired_timer_makes_stage_dirty(self):
+        self.tracker.is_dirty('builder', {'queue': 1}, now=0)
+        self.tracker.done('builder', due=500, now=0)
+
+        self.assertFalse(self.tracker.is_dirty('builder', {'queue': 1}, now=499))
+        self.assertTrue(self.tracker.is_dirty('builder', {'queue': 1}, now=500))
+
+    def test_max_age(self):
+        self.tracker.is_dirty('market', {'resources': {'wood': 5}}, now=0)
+        self.tracker.done('market', now=0)
+
+        self.assertTrue(self.tracker.is_dirty('market', {'resources': {'wood': 5}}, now=3600))
+
+    def test_done_with_inputs_stores_state_after_run(self):
+        self.tracker.is_dirty('builder', {'queue': 0}, now=0)
+        self.tracker.done('builder', {'queue': 1}, now=0)
+
+        self.assertFalse(self.tracker.is_dirty('builder', {'queue': 1}, now=10))
+
+    def test_not_done_stays_dirty(self):
+        self.tracker.is_dirty('planner', {'affordable': ['a']}, now=0)
+        self.assertTrue(self.tracker.is_dirty('planner', {'affordable': ['a']}, now=10))
+
+    def test_invalidate(self):
+        self.tracker.is_dirty('planner', {}, now=0)
+        self.tracker.done('planner', now=0)
+        self.tracker.invalidate('planner')
+        self.assertTrue(self.tracker.is_dirty('planner', {}, now=10))
+
+
+class TestVillageSkipsUnchangedBuilder(unittest.TestCase):
+
+    @patch('game.village.TemplateManager.get_template')
+    def test_builder_runs_once_for_unchanged_inputs(self, mock_get_template):
+        mock_get_template.return_value = {"template_data": ["main:2", "main:3"], "mode": "linear"}
+        village = Village(village_id='123', wrapper=MagicMock())
+        village.logger = MagicMock()
+        village.config = {
+            "bot": {"skip_unchanged": True, "skip_unchanged_max_age": 3600},
+            "building": {"default": "basic", "max_lookahead": 2, "max_queued_items": 2, "manage_buildings": True},
+            "villages": {"123": {"building": "basic"}},
+        }
+        village.game_data = {"village": {"buildings": {"main": "1"}, "pop": 10, "pop_max": 100}}
+        village.units = MagicMock()
+        village.resman = MagicMock()
+        village.resman.actual = {"wood": 50, "stone": 50, "iron": 50}
+        village.builder = BuildingManager(wrapper=MagicMock(), village_id='123')
+        village.builder.waits = []
+        village.builder.costs = {"main": {"wood": 100, "stone": 100, "iron": 100}}
+
+        def start_update(**kwargs):
+            village.builder.levels = {"main": 1}
+            # Entries that are built already are taken off the queue
+            village.builder.queue = village.builder.queue[1:]
+
+        village.builder.start_update = MagicMock(side_effect=start_update)
+
+        village.run_builder()
+        village.run_builder()
+        self.assertEqual(village.builder.start_update.call_count, 1)
+        # A skipped run keeps the remaining queue instead of the whole template
+        self.assertEqual(village.builder.queue, ["main:3"])
+
+        # Main became affordable, the builder has something to do again
+        village.resman.actual = {"wood": 100, "stone": 100, "iron": 100}
+        village.run_builder()
+        self.assertEqual(village.builder.start_update.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from core.events import _EventLog, diff
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmpdir.name, "cache"))
+        self.env = patch.dict("os.environ", {"TWB_HOME": self.tmpdir.name})
+        self.env.start()
+        self.log = _EventLog()
+        self.path = os.path.join(self.tmpdir.name, "cache", "events.jsonl")
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    def read(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_diff_only_contains_changed_keys(self):
+        previous = {"status": "Idle", "resources": {"wood": 10, "clay": 5, "iron": 1}, "farm_bag": None}
+        current = {"status": "Idle", "resources": {"wood": 20, "clay": 5}, "farm_bag": None}
+        self.assertEqual(diff(previous, current), {"resources": {"wood": 20, "iron": None}})
+        self.assertEqual(diff(None, {"status": "Idle"}), {"status": "Idle"})
+
+    def test_publishes_deltas(self):
+        entry = {"status": "Idle", "resources": {"wood": 10}, "under_attack": False, "last_run": 1,
+                 "troops": {"spear": 5}}
+        first = self.log.publish_village("1", entry)
+        self.assertEqual(first["changes"]["status"], "Idle")
+        self.assertNotIn("troops", first["changes"])
+
+        # Only the run time changed
+        self.assertIsNone(self.log.publish_village("1", dict(entry, last_run=2)))
+
+        second = self.log.publish_village("1", dict(entry, under_attack=True, last_run=3))
+        self.assertEqual(second["changes"], {"under_attack": True, "last_run": 3})
+        self.assertGreater(second["id"], first["id"])
+        self.assertEqual([event["id"] for event in self.read()], [first["id"], second["id"]])
+
+    def test_log_is_rotated(self):
+        self.log.max_size = 2000
+        self.log.keep_lines = 5
+        for index in range(50):
+            self.log.publish_village(str(index), {"status": "Idle"})
+        events = self.read()
+        self.assertLess(len(events), 50)
+        self.assertLessEqual(os.path.getsize(self.path), self.log.max_size)
+        self.assertEqual(events[-1]["village"], "49")
+
+
+if __name__ == '__main__':
+    unittest.main()
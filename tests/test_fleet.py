@@ -0,0 +1,164 @@
+import http.server
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+from werkzeug.serving import make_server
+
+from webmanager import server
+from webmanager.fleet import Fleet, summarize
+from webmanager.state import StateCache
+
+
+class FakeNodeHandler(http.server.BaseHTTPRequestHandler):
+    summary = {"node": "en130", "running": True, "cycle": {"duration": 60, "requests_per_minute": 12.0},
+               "totals": {"villages": 1, "under_attack": 1, "wood": 10, "stone": 20, "iron": 30},
+               "villages": {"7": {"name": "Far", "status": "Under Attack!", "under_attack": True,
+                                  "resources": {"wood": 10, "stone": 20, "iron": 30}, "farm_bag": None}}}
+    requests = []
+
+    def do_GET(self):
+        FakeNodeHandler.requests.append(self.headers)
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        payload = json.dumps(self.summary).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestFleet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root = self.tmpdir.name
+        os.makedirs(os.path.join(root, "cache", "managed"))
+        with open(os.path.join(root, "cache", "managed", "1.json"), "w") as f:
+            json.dump({"name": "Home", "status": "Idle", "under_attack": False, "last_run": 1,
+                       "resources": {"wood": 100, "stone": 200, "iron": 300}, "farm_bag": {"pct": 0.5}}, f)
+        with open(os.path.join(root, "cache", "worker.json"), "w") as f:
+            json.dump({"last_cycle": 1, "last_cycle_duration": 30.0, "requests": 45}, f)
+        with open(os.path.join(root, "config.json"), "w") as f:
+            json.dump({"server": {"server": "nl01"}, "fleet": {"token": "secret"}}, f)
+        self.patchers = [
+            patch.object(server, "state", StateCache(root, min_interval=0)),
+            patch.object(server.bm, "is_running", return_value=True),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+        # A real web manager and a fake one on their own ports
+        self.web = make_server("127.0.0.1", 0, server.app, threaded=True)
+        self.fake = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeNodeHandler)
+        for node in (self.web, self.fake):
+            threading.Thread(target=node.serve_forever, args=(0.05,), daemon=True).start()
+        FakeNodeHandler.requests = []
+
+    def tearDown(self):
+        for node in (self.web, self.fake):
+            node.shutdown()
+            node.server_close()
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmpdir.cleanup()
+
+    def test_summary(self):
+        summary = summarize("nl01", server.sync(), server.sync()["worker"], True)
+        self.assertEqual(summary["totals"], {"villages": 1, "under_attack": 0, "wood": 100, "stone": 200, "iron": 300})
+        self.assertEqual(summary["cycle"]["requests_per_minute"], 90.0)
+        self.assertEqual(summary["villages"]["1"]["farm_bag"], 0.5)
+
+        client = server.app.test_client()
+        self.assertEqual(client.get("/api/summary").status_code, 403)
+        response = client.get("/api/summary", headers={"X-TWB-Token": "secret"})
+        self.assertEqual(response.get_json()["node"], "nl01")
+        self.assertEqual(client.get("/api/summary", headers={
+            "X-TWB-Token": "secret", "If-None-Match": response.headers["ETag"]}).status_code, 304)
+
+    def test_polls_nodes_on_different_ports(self):
+        fleet = Fleet(timeout=2)
+        fleet.configure([
+            "http://127.0.0.1:%d" % self.web.server_port,
+            "http://127.0.0.1:%d/" % self.fake.server_port,
+            "http://127.0.0.1:%d" % free_port(),
+        ], token="secret")
+        self.assertTrue(fleet.poll())
+        view = fleet.view()
+
+        health = {node["name"]: node["health"] for node in view["nodes"]}
+        self.assertEqual(sorted(health.values()), ["down", "ok", "ok"])
+        self.assertEqual(health["nl01"], "ok")
+        self.assertEqual(health["en130"], "ok")
+        self.assertEqual(view["totals"]["villages"], 2)
+        self.assertEqual(view["totals"]["wood"], 110)
+        # Villages under attack come first
+        self.assertEqual([village["name"] for village in view["villages"]], ["Far", "Home"])
+        self.assertEqual(FakeNodeHandler.requests[0].get("X-TWB-Token"), "secret")
+
+        # Nothing changed, the nodes answer 304 and the merged view is reused
+        self.assertFalse(fleet.poll())
+        self.assertEqual(FakeNodeHandler.requests[-1].get("If-None-Match"), '"v1"')
+        self.assertEqual(fleet.view()["version"], view["version"])
+
+    def test_pushed_summaries(self):
+        client = server.app.test_client()
+        summary = dict(FakeNodeHandler.summary, node="de200")
+        with patch.object(server, "fleet", Fleet()):
+            self.assertEqual(client.post("/api/fleet/push", json=summary).status_code, 403)
+            self.assertEqual(client.post("/api/fleet/push", json={"running": True},
+                                         headers={"X-TWB-Token": "secret"}).status_code, 400)
+            self.assertEqual(client.post("/api/fleet/push", json=summary,
+                                         headers={"X-TWB-Token": "secret"}).status_code, 200)
+            view = client.get("/api/fleet").get_json()
+            self.assertEqual([(node["name"], node["health"]) for node in view["nodes"]], [("de200", "ok")])
+            self.assertIn(b"de200", client.get("/fleet").data)
+
+    def test_changes_need_token_when_not_local(self):
+        client = server.app.test_client()
+        with patch.object(server.bm, "start"), patch.object(server.bm, "stop"):
+            self.assertEqual(client.get("/bot/start").status_code, 200)
+            with patch.dict(server.app.config, {"TWB_HOST": "0.0.0.0"}):
+                self.assertEqual(client.get("/bot/start").status_code, 403)
+                self.assertEqual(client.get("/bot/stop", headers={"X-TWB-Token": "wrong"}).status_code, 403)
+                self.assertEqual(client.get("/bot/stop", headers={"X-TWB-Token": "secret"}).status_code, 200)
+                # Pages and data need the token as well, the fleet API checks it itself
+                self.assertEqual(client.get("/api/get").status_code, 403)
+                self.assertEqual(client.get("/villages").status_code, 403)
+                self.assertEqual(client.get("/api/summary", headers={"X-TWB-Token": "secret"}).status_code, 200)
+                # The browser passes the token once, the cookie covers the next requests
+                self.assertEqual(client.get("/config?token=secret").status_code, 200)
+                self.assertEqual(client.get("/bot/start").status_code, 200)
+                self.assertEqual(client.get("/api/get").status_code, 200)
+
+    def test_secrets_are_not_sent(self):
+        client = server.app.test_client()
+        for response in (client.get("/api/get"), client.get("/config")):
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn(b'"secret"', response.data)
+        self.assertEqual(client.get("/api/get").get_json()["config"]["fleet"]["token"], server.SECRET_PLACEHOLDER)
+        # Saving the placeholder from the config page keeps the token
+        with patch.object(server.DataReader, "config_set") as config_set:
+            client.get("/app/config/set?parameter=fleet.token&value=" + server.SECRET_PLACEHOLDER)
+        config_set.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import copy
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from core.filemanager import FileManager
+from core.frozenconfig import FrozenDict, freeze, thaw
+from twb import TWB
+
+
+class TestFrozenConfig(unittest.TestCase):
+
+    def test_freeze_is_read_only_and_json_compatible(self):
+        config = freeze({"bot": {"active_hours": "6-23"}, "farms": {"forced_peace_times": [{"start": "x"}]}})
+
+        self.assertIsInstance(config["bot"], FrozenDict)
+        self.assertIsInstance(config["farms"]["forced_peace_times"], tuple)
+        with self.assertRaises(TypeError):
+            config["bot"]["active_hours"] = "0-24"
+        with self.assertRaises(TypeError):
+            config["farms"].update({"farm": False})
+        self.assertEqual(
+            json.loads(json.dumps(config)),
+            {"bot": {"active_hours": "6-23"}, "farms": {"forced_peace_times": [{"start": "x"}]}}
+        )
+        self.assertIs(copy.deepcopy(config), config)
+
+    def test_thaw_returns_mutable_copy(self):
+        config = freeze({"villages": {"1": {"units": ["spear"]}}})
+        mutable = thaw(config)
+        mutable["villages"]["1"]["units"].append("sword")
+
+        self.assertEqual(config["villages"]["1"]["units"], ("spear",))
+        self.assertEqual(mutable["villages"]["1"]["units"], ["spear", "sword"])
+
+
+class TestTWBConfigSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.env = patch.dict('os.environ', {'TWB_HOME': self.tmpdir})
+        self.env.start()
+        shutil.copy(FileManager.get_install_path("config.example.json"), os.path.join(self.tmpdir, "config.json"))
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_snapshot_is_shared_until_file_changes(self):
+        twb = TWB()
+        first = twb.config()
+        self.assertIs(twb.config(), first)
+        self.assertIsInstance(first, FrozenDict)
+
+        path = os.path.join(self.tmpdir, "config.json")
+        os.utime(path, (os.path.getmtime(path) + 10, os.path.getmtime(path) + 10))
+        self.assertIsNot(twb.config(), first)
+
+
+if __name__ == '__main__':
+    unittest.main()
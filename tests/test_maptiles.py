@@ -0,0 +1,57 @@
+import json
+import unittest
+
+from webmanager.maptiles import MapTiles
+
+
+def village(village_id, x, y, owner="0"):
+    return {"id": village_id, "name": "Village %s" % village_id, "location": [x, y], "points": 100,
+            "owner": owner, "tribe": "0", "bonus": None}
+
+
+class TestMapTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tiles = MapTiles(tile_size=20)
+        self.villages = {"1": village("1", 501, 502), "2": village("2", 519, 505), "3": village("3", 530, 560)}
+        self.tiles.sync(self.villages)
+
+    def test_villages_are_indexed_by_tile(self):
+        index = self.tiles.index()
+        self.assertEqual(sorted(index["tiles"]), ["25:25", "26:28"])
+
+        version, payload = self.tiles.tile(25, 25)
+        tile = json.loads(payload)
+        self.assertEqual([row[:3] for row in tile["villages"]], [[501, 502, "1"], [519, 505, "2"]])
+        self.assertEqual(tile["villages"][0][index["columns"].index("name")], "Village 1")
+        self.assertEqual(json.loads(self.tiles.tile(0, 0)[1])["villages"], [])
+
+    def test_only_changed_tiles_are_invalidated(self):
+        first = self.tiles.tile(25, 25)
+        other = self.tiles.tile(26, 28)
+
+        # The state cache replaces changed entries and keeps the others
+        villages = dict(self.villages)
+        villages["3"] = village("3", 530, 560, owner="42")
+        self.assertEqual(self.tiles.sync(villages), {(26, 28)})
+        self.assertIs(self.tiles.tile(25, 25), first)
+        self.assertNotEqual(self.tiles.tile(26, 28), other)
+
+    def test_moved_and_removed_villages(self):
+        villages = dict(self.villages)
+        villages["2"] = village("2", 531, 561)
+        del villages["1"]
+        self.assertEqual(self.tiles.sync(villages), {(25, 25), (26, 28)})
+        self.assertEqual(sorted(self.tiles.index()["tiles"]), ["26:28"])
+        self.assertEqual(len(json.loads(self.tiles.tile(26, 28)[1])["villages"]), 2)
+        self.assertEqual(self.tiles.sync(villages), set())
+
+    def test_versions_differ_between_instances(self):
+        other = MapTiles(tile_size=20, instance="other")
+        other.sync(self.villages)
+        self.assertNotEqual(other.index()["tiles"]["25:25"], self.tiles.index()["tiles"]["25:25"])
+        self.assertEqual(other.tile(25, 25)[0], other.index()["tiles"]["25:25"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import io
+import os
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import MagicMock
+
+from game.market import OfferIndex, main, run_benchmark
+from game.resources import ResourceManager
+
+PAGE = os.path.join(os.path.dirname(__file__), "mock_data", "market_other_offer.html")
+
+
+class TestOfferIndex(unittest.TestCase):
+    def setUp(self):
+        with open(PAGE, "r", encoding="utf-8") as f:
+            self.html = f.read()
+        self.index = OfferIndex.from_html(self.html)
+
+    def test_parses_recorded_page(self):
+        # 24 offers, 3 of them can not be accepted
+        self.assertEqual(len(self.index), 21)
+        self.assertEqual(self.index.incoming, {"iron": 1500})
+        offer = self.index.offers[("wood", "stone")][0]
+        self.assertEqual((offer["offer_amount"], offer["wanted_amount"], offer["duration"]), (5000, 6000, 724))
+
+    def test_match_prefers_ratio_then_distance(self):
+        offer = self.index.match("wood", "iron", 1000, 5000)
+        self.assertEqual((offer["offer_amount"], offer["wanted_amount"]), (2000, 1600))
+        offer = self.index.match("wood", "iron", 1000, 1500)
+        self.assertEqual((offer["offer_amount"], offer["wanted_amount"]), (1000, 1200))
+        self.assertIsNone(self.index.match("stone", "iron", 5000, 10000))
+
+    def test_check_other_offers_uses_one_page(self):
+        wrapper = MagicMock()
+        wrapper.get_url.return_value.text = self.html
+        resman = ResourceManager(wrapper, 55555)
+        resman.logger = MagicMock()
+        resman.actual = {"wood": 5000, "stone": 1000, "iron": 1000}
+        offers = resman.market_offers()
+
+        self.assertTrue(resman.check_other_offers("stone", 2000, "wood", offers=offers))
+        self.assertTrue(resman.check_other_offers("stone", 2000, "wood", offers=offers))
+        self.assertFalse(resman.check_other_offers("stone", 2000, "wood", offers=offers))
+
+        self.assertEqual(wrapper.get_url.call_count, 1)
+        self.assertEqual(wrapper.post_url.call_count, 2)
+        # Best ratio first, accepted offers are gone from the index
+        self.assertEqual(resman.actual["wood"], 5000 - 1600 - 3000)
+        self.assertEqual([offer["offer_amount"] for offer in offers.offers[("stone", "wood")]], [500])
+
+    def test_benchmark(self):
+        result = run_benchmark([self.html], repeat=2)
+        self.assertEqual(result["offers"], 21)
+        self.assertEqual(result["page_loads"], {"per_check": 36, "indexed": 2})
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = main([PAGE, "--repeat", "1", "--json"])
+        self.assertEqual(code, 0)
+        self.assertIn('"offers": 21', output.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import asyncio
+import http.server
+import json
+import threading
+import time
+import unittest
+
+from core.notification import _Notification
+
+
+class FakeBot:
+    def __init__(self, failures=0, delay=0.0):
+        self.messages = []
+        self.failures = failures
+        self.delay = delay
+        self.attempts = 0
+
+    async def send_message(self, chat_id, text):
+        self.attempts += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("telegram unreachable")
+        self.messages.append(text)
+
+
+class TestNotification(unittest.TestCase):
+
+    def make(self, bot, **settings):
+        notification = _Notification(bot=bot)
+        notification.min_interval = 0
+        notification.retry_delay = 0.01
+        for key, value in settings.items():
+            setattr(notification, key, value)
+        self.addCleanup(notification.close)
+        return notification
+
+    @staticmethod
+    def wait_for(condition, timeout=3):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_send_does_not_block_on_telegram(self):
+        bot = FakeBot(delay=0.5)
+        notification = self.make(bot)
+
+        started = time.time()
+        notification.send("TWB is starting up")
+        self.assertLess(time.time() - started, 0.2)
+        self.assertTrue(self.wait_for(lambda: bot.messages == ["TWB is starting up"]))
+
+    def test_messages_with_the_same_key_are_merged(self):
+        bot = FakeBot()
+        notification = self.make(bot, coalesce_seconds=0.2)
+
+        notification.send("Village A is under attack!", key="under_attack")
+        notification.send("Village B is under attack!", key="under_attack")
+        notification.send("Village A is under attack!", key="under_attack")
+        notification.send("Bot protection hit!")
+
+        self.assertTrue(self.wait_for(lambda: len(bot.messages) == 2))
+        self.assertEqual(bot.messages[0], "Bot protection hit!")
+        self.assertEqual(bot.messages[1], "Village A is under attack!\nVillage B is under attack!")
+
+    def test_failed_sends_are_retried(self):
+        bot = FakeBot(failures=2)
+        notification = self.make(bot)
+
+        notification.send("TWB crashed")
+
+        self.assertTrue(self.wait_for(lambda: bot.messages == ["TWB crashed"]))
+        self.assertEqual(bot.attempts, 3)
+        self.assertEqual(notification.failed, 0)
+
+    def test_rate_limit_spaces_messages(self):
+        bot = FakeBot()
+        sent_at = []
+        original = bot.send_message
+
+        async def timed(chat_id, text):
+            sent_at.append(time.monotonic())
+            await original(chat_id, text)
+
+        bot.send_message = timed
+        notification = self.make(bot, min_interval=0.1)
+        for index in range(3):
+            notification.send("message %d" % index)
+
+        self.assertTrue(self.wait_for(lambda: len(bot.messages) == 3))
+        self.assertGreaterEqual(sent_at[2] - sent_at[0], 0.19)
+
+    def test_queue_is_bounded(self):
+        bot = FakeBot(delay=0.2)
+        notification = self.make(bot, max_queue=3)
+        for index in range(10):
+            notification.send("message %d" % index)
+
+        notification.close()
+        self.assertGreater(notification.dropped, 0)
+        self.assertIn("message 9", bot.messages)
+        self.assertLessEqual(len(bot.messages), 4)
+
+    def test_close_flushes_coalesced_messages(self):
+        bot = FakeBot()
+        notification = self.make(bot, coalesce_seconds=60)
+        notification.send("TWB has crashed 3 times, exiting", key="crash")
+
+        notification.close()
+        self.assertEqual(bot.messages, ["TWB has crashed 3 times, exiting"])
+
+
+class FakeTelegramHandler(http.server.BaseHTTPRequestHandler):
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        FakeTelegramHandler.received.append((self.path, body))
+        result = {
+            "message_id": len(FakeTelegramHandler.received),
+            "date": int(time.time()),
+            "chat": {"id": 1, "type": "private"},
+            "text": "ok",
+        }
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestNotificationFakeEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            import telegram
+        except ImportError:
+            self.skipTest("python-telegram-bot is not installed")
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegramHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        FakeTelegramHandler.received = []
+        base_url = "http://127.0.0.1:%d/bot" % self.server.server_address[1]
+        self.notification = _Notification(bot=telegram.Bot(token="123:abc", base_url=base_url))
+        self.notification.channel_id = 1
+
+    def tearDown(self):
+        self.notification.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sends_to_bot_api(self):
+        self.notification.send("TWB is starting up")
+        self.notification.close()
+
+        self.assertEqual(self.notification.sent, 1)
+        path, body = FakeTelegramHandler.received[0]
+        self.assertTrue(path.endswith("/sendMessage"))
+        self.assertIn(b"text=TWB+is+starting+up", body)
+
+
+if __name__ == '__main__':
+    unittest.main()
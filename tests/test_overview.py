@@ -6,7 +6,9 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from pages.overview import OverviewPage, Point
+from unittest.mock import patch
+
+from pages.overview import OverviewPage, OverviewSnapshot, Point
 
 
 class FakeResponse:
@@ -17,8 +19,10 @@ class FakeResponse:
 class FakeWrapper:
     def __init__(self, text: str):
         self._text = text
+        self.urls = []
 
     def get_url(self, url: str):
+        self.urls.append(url)
         return FakeResponse(self._text)
 
 
@@ -83,5 +87,39 @@ class OverviewPageParsingTests(unittest.TestCase):
         self.assertEqual(village.storage.capacity, 10000)
 
 
+class OverviewSnapshotTests(unittest.TestCase):
+    def test_reuses_production_page_and_fetches_trader_pages_once(self):
+        wrapper = FakeWrapper("trader")
+        snapshot = OverviewSnapshot(wrapper)
+        page = OverviewPage(FakeWrapper(
+            '<table id="production_table"><tr><td><span class="quickedit"></span><span data-id="1">'
+            'A (500|500) K55</span></td><td>1</td><td>1 2 3</td><td>400</td><td>1/2</td></tr></table>'
+        ))
+        snapshot.new_cycle(page, village_id="1")
+
+        with patch("pages.overview.Extractor.overview_trader_data", return_value={"1": {"merchants_avail": 3}}), \
+                patch("pages.overview.Extractor.overview_production_data", return_value=[{"id": "1"}]) as production:
+            self.assertEqual(snapshot.production(), [{"id": "1"}])
+            self.assertIn("production_table", production.call_args[0][0])
+            snapshot.trader("own")
+            snapshot.trader("own")
+            snapshot.trader("inc")
+        self.assertEqual(wrapper.urls, [
+            "game.php?village=1&screen=overview_villages&mode=trader&type=own",
+            "game.php?village=1&screen=overview_villages&mode=trader&type=inc",
+        ])
+
+    def test_invalidated_and_new_cycle_pages_are_fetched_again(self):
+        wrapper = FakeWrapper("trader")
+        snapshot = OverviewSnapshot(wrapper)
+        with patch("pages.overview.Extractor.overview_trader_data", return_value={}):
+            snapshot.trader("own")
+            snapshot.invalidate(OverviewSnapshot.TRADER_OWN)
+            snapshot.trader("own")
+            snapshot.new_cycle()
+            snapshot.trader("own")
+        self.assertEqual(snapshot.requests, 3)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,104 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from game.gamestate import GameState
+from game.planner_replay import (
+    PlannerRecorder, read_snapshots, run_benchmark, percentile, state_from_dict, state_to_dict, main
+)
+from game.solver import MultiActionPlanner, BeamSearchPlanner
+
+
+class TestPlannerReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "planner", "123.twbr")
+        self.state = GameState(village_id='123')
+        self.state.resources = {'wood': 500, 'stone': 500, 'iron': 500, 'pop': 100}
+        self.state.building_levels = {'main': 1, 'barracks': 1}
+        self.state.storage_capacity = 1000
+        self.building_templates = {"template_data": ["main:3", "barracks:2"]}
+        self.building_costs = {
+            'main': {'wood': 100, 'stone': 100, 'iron': 100, 'pop': 1, 'build_time': 60},
+            'barracks': {'wood': 150, 'stone': 100, 'iron': 50, 'pop': 1, 'build_time': 90},
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _record(self, amount):
+        recorder = PlannerRecorder(self.path)
+        for _ in range(amount):
+            recorder.record(self.state, self.building_templates, {}, self.building_costs, {}, {}, {'spear': 0.5})
+
+    def test_state_round_trip(self):
+        restored = state_from_dict(state_to_dict(self.state))
+        self.assertEqual(restored.resources, self.state.resources)
+        self.assertEqual(restored.building_levels, self.state.building_levels)
+        self.assertIsNone(restored.last_action)
+
+    def test_recorder_appends_frames(self):
+        self._record(3)
+
+        snapshots = list(read_snapshots(self.path))
+
+        self.assertEqual(len(snapshots), 3)
+        self.assertEqual(snapshots[0]["state"]["building_levels"], {'main': 1, 'barracks': 1})
+        self.assertEqual(snapshots[0]["marginal_incomes"], {'spear': 0.5})
+
+    def test_truncated_frame_is_ignored(self):
+        self._record(2)
+        with open(self.path, "ab") as recording:
+            recording.write(b"\x10\x00\x00\x00abc")
+
+        self.assertEqual(len(list(read_snapshots(self.path))), 2)
+
+    def test_benchmark_reports_latency_and_score(self):
+        self._record(5)
+        snapshots = list(read_snapshots(self.path))
+
+        greedy = run_benchmark(snapshots, MultiActionPlanner)
+        beam = run_benchmark(
+            snapshots, lambda generator: BeamSearchPlanner(generator, time_budget=None), measure_allocations=False
+        )
+
+        self.assertEqual(greedy["snapshots"], 5)
+        self.assertGreater(greedy["latency_ms"]["max"], 0)
+        self.assertGreater(greedy["peak_alloc_kb"]["max"], 0)
+        self.assertGreater(greedy["mean_plan_length"], 0)
+        self.assertGreaterEqual(beam["score"]["mean"], greedy["score"]["mean"])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_cli(self):
+        self._record(2)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = main([self.path, "--planner", "beam", "--json", "--no-alloc"])
+
+        self.assertEqual(code, 0)
+        self.assertIn('"snapshots": 2', output.getvalue())
+
+    def test_cli_max_depth_limits_beam_plans(self):
+        self._record(2)
+        lengths = {}
+        for flags in (["--max-depth", "1"], ["--max-depth", "1", "--max-actions", "3"]):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                main([self.path, "--planner", "beam", "--json", "--no-alloc"] + flags)
+            lengths[len(flags)] = json.loads(output.getvalue())["mean_plan_length"]
+
+        self.assertEqual(lengths[2], 1)
+        self.assertGreater(lengths[4], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import unittest
+from unittest.mock import MagicMock
+
+from game.resources import PremiumExchange, PremiumSellPlanner, PremiumTrader, ResourceManager
+
+
+def exchange_data(stock=None, merchants=10):
+    return {
+        "stock": stock or {"wood": 1000, "stone": 1000, "iron": 1000},
+        "capacity": {"wood": 50000, "stone": 50000, "iron": 50000},
+        "tax": {"buy": 0.05, "sell": 0.05},
+        "constants": {
+            "resource_base_price": 0.02,
+            "resource_price_elasticity": 0.01,
+            "stock_size_modifier": 10000,
+        },
+        "duration": 3600,
+        "merchants": merchants,
+    }
+
+
+def binary_search_rate(exchange, item):
+    # The search the closed form replaced
+    low, high = 1, int(exchange.capacity[item] - exchange.stock[item])
+    result = high
+    while low <= high:
+        mid = (low + high) // 2
+        if abs(exchange.calculate_cost(item, -mid)) >= 1.0:
+            result = mid
+            high = mid - 1
+        else:
+            low = mid + 1
+    return result
+
+
+class TestPremiumExchange(unittest.TestCase):
+    def setUp(self):
+        self.exchange = PremiumExchange.from_data(None, exchange_data({"wood": 1000, "stone": 20000, "iron": 45000}))
+
+    def test_points_match_calculate_cost(self):
+        for item in ("wood", "stone", "iron"):
+            for amount in (1, 250, 1000, 4000):
+                self.assertAlmostEqual(
+                    self.exchange.points_for(item, amount), -self.exchange.calculate_cost(item, -amount)
+                )
+
+    def test_rate_for_one_point_matches_binary_search(self):
+        for item in ("wood", "stone", "iron"):
+            self.assertEqual(
+                self.exchange.calculate_rate_for_one_point(item), binary_search_rate(self.exchange, item)
+            )
+
+    def test_amount_for_points_inverts_points_for(self):
+        amount = self.exchange.amount_for_points("wood", 20)
+        self.assertAlmostEqual(self.exchange.points_for("wood", amount), 20)
+        self.assertIsNone(self.exchange.amount_for_points("wood", 10 ** 6))
+
+
+class TestPremiumSellPlanner(unittest.TestCase):
+    def test_sells_best_price_first_and_moves_the_price(self):
+        # Wood is scarce on the exchange and pays the most, until enough wood was sold
+        exchange = PremiumExchange.from_data(None, exchange_data({"wood": 0, "stone": 8000, "iron": 8000}))
+        offers = [
+            {"village_id": 1, "surplus": {"wood": 20000, "stone": 20000}, "merchants": 12},
+            {"village_id": 2, "surplus": {"iron": 5000}, "merchants": 3},
+        ]
+        sales = PremiumSellPlanner(exchange).plan(offers)
+        self.assertEqual(sales[0]["resource"], "wood")
+        self.assertEqual({sale["resource"] for sale in sales}, {"wood", "stone", "iron"})
+        self.assertLessEqual(sum(sale["amount"] for sale in sales if sale["village_id"] == 1), 12 * 1000)
+        self.assertLessEqual(sum(sale["amount"] for sale in sales if sale["village_id"] == 2), 3 * 1000)
+        # Selling wood first lowers its price below what the first load got
+        wood = [sale for sale in sales if sale["resource"] == "wood"][0]
+        self.assertLess(
+            exchange.marginal_sell_price("wood", wood["amount"]), exchange.marginal_sell_price("wood", 0)
+        )
+
+    def test_respects_capacity_merchants_and_min_load(self):
+        exchange = PremiumExchange.from_data(None, exchange_data({"wood": 49500, "stone": 1000, "iron": 1000}))
+        offers = [
+            {"village_id": 1, "surplus": {"wood": 5000, "stone": 400}, "merchants": 5},
+            {"village_id": 2, "surplus": {"iron": 5000}, "merchants": 0},
+        ]
+        sales = PremiumSellPlanner(exchange).plan(offers)
+        # Wood has 500 room left and stone only fills 40% of a merchant, iron has no merchant
+        self.assertEqual(sales, [])
+
+    def test_max_points(self):
+        exchange = PremiumExchange.from_data(None, exchange_data())
+        offers = [{"village_id": 1, "surplus": {"wood": 50000}, "merchants": 50}]
+        sales = PremiumSellPlanner(exchange, max_points=30).plan(offers)
+        self.assertLess(sum(sale["points"] for sale in sales), 31)
+        self.assertGreaterEqual(sum(sale["points"] for sale in sales), 29)
+
+
+class TestPremiumTrader(unittest.TestCase):
+    def test_fetches_the_exchange_once_for_all_villages(self):
+        wrapper = MagicMock()
+        pages = {"mode=exchange": "exchange", "mode=trader": "overview"}
+        wrapper.get_url.side_effect = lambda url: MagicMock(text=[v for k, v in pages.items() if k in url][0])
+        wrapper.get_api_action.return_value = {"response": [{"rate_hash": "abc"}]}
+        trader = PremiumTrader(wrapper)
+        with unittest.mock.patch(
+                "game.resources.Extractor.premium_data", return_value=exchange_data({"wood": 0, "stone": 0, "iron": 0})
+        ), unittest.mock.patch(
+            "game.resources.Extractor.overview_trader_data",
+            return_value={"1": {"merchants_avail": 2}, "2": {"merchants_avail": 2}, "3": {"merchants_avail": 0}},
+        ):
+            sold = trader.run([
+                {"village_id": "1", "surplus": {"wood": 3000}},
+                {"village_id": "2", "surplus": {"stone": 3000}},
+                {"village_id": "3", "surplus": {"iron": 3000}},
+                None,
+            ])
+        self.assertEqual(wrapper.get_url.call_count, 2)
+        self.assertEqual({sale["village_id"] for sale in sold}, {"1", "2"})
+        self.assertEqual(sum(sale["amount"] for sale in sold), 4000)
+        # exchange_begin and exchange_confirm for every sale
+        self.assertEqual(wrapper.get_api_action.call_count, 2 * len(sold))
+
+    def test_without_trader_overview_every_village_reads_its_exchange_page(self):
+        wrapper = MagicMock()
+        wrapper.get_url.side_effect = lambda url: MagicMock(text=url)
+        wrapper.get_api_action.return_value = {"response": [{"rate_hash": "abc"}]}
+        with unittest.mock.patch(
+                "game.resources.Extractor.premium_data",
+                return_value=exchange_data({"wood": 0, "stone": 0, "iron": 0}, merchants=2)
+        ), unittest.mock.patch("game.resources.Extractor.overview_trader_data", return_value={}):
+            sold = PremiumTrader(wrapper).run([
+                {"village_id": "1", "surplus": {"wood": 3000}},
+                {"village_id": "2", "surplus": {"stone": 3000}},
+            ])
+        urls = [call.args[0] for call in wrapper.get_url.call_args_list]
+        self.assertEqual(len([url for url in urls if "mode=exchange" in url]), 2)
+        self.assertEqual({sale["village_id"] for sale in sold}, {"1", "2"})
+        self.assertEqual(sum(sale["amount"] for sale in sold), 4000)
+
+    def test_max_points_limits_the_sales(self):
+        wrapper = MagicMock()
+        wrapper.get_url.side_effect = lambda url: MagicMock(text=url)
+        wrapper.get_api_action.return_value = {"response": [{"rate_hash": "abc"}]}
+        with unittest.mock.patch(
+                "game.resources.Extractor.premium_data", return_value=exchange_data(merchants=50)
+        ), unittest.mock.patch("game.resources.Extractor.overview_trader_data", return_value={}):
+            sold = PremiumTrader(wrapper, max_points=30).run([{"village_id": "1", "surplus": {"wood": 50000}}])
+        self.assertLess(sum(sale["points"] for sale in sold), 31)
+        self.assertGreaterEqual(sum(sale["points"] for sale in sold), 29)
+
+
+class TestPremiumOffer(unittest.TestCase):
+    def setUp(self):
+        self.resman = ResourceManager(MagicMock(), 1)
+        self.resman.logger = MagicMock()
+        self.resman.storage = 10000
+        self.resman.do_premium_trade = True
+
+    def test_offer_skips_needed_resources(self):
+        self.resman.actual = {"wood": 8000, "stone": 4500, "iron": 9000}
+        self.resman.request("building", "iron", 500)
+        offer = self.resman.premium_offer()
+        # 5000 is the threshold, stone is close enough to sell a little early
+        self.assertEqual(offer, {"village_id": 1, "surplus": {"wood": 3000, "stone": 125}})
+
+    def test_state_is_not_shared_between_villages(self):
+        other = ResourceManager(MagicMock(), 2)
+        self.resman.actual["wood"] = 1
+        self.resman.request("building", "wood", 5)
+        self.assertEqual(other.actual, {})
+        self.assertEqual(other.requested, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
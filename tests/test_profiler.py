@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from core.profiler import _Profiler, flamegraph_svg
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += 1
+    return total
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.env = patch.dict('os.environ', {'TWB_HOME': self.tmpdir.name})
+        self.env.start()
+        self.profiler = _Profiler()
+        self.profiler.enable(interval=0.001, keep=2)
+
+    def tearDown(self):
+        self.profiler.disable()
+        self.env.stop()
+        self.tmpdir.cleanup()
+
+    def _cycle(self):
+        self.profiler.start_cycle()
+        self.profiler.set_stage("village.builder")
+        with self.profiler.activity("sleep"):
+            time.sleep(0.15)
+        self.profiler.set_stage("village.planner")
+        busy(0.15)
+        return self.profiler.end_cycle()
+
+    def test_cycle_separates_categories_and_stages(self):
+        summary = self._cycle()
+
+        self.assertGreater(summary["samples"], 0)
+        self.assertGreater(summary["categories"]["sleep"], 0.05)
+        self.assertGreater(summary["categories"]["logic"], 0.05)
+        self.assertIn("village.builder", summary["stages"])
+        self.assertIn("village.planner", summary["stages"])
+        functions = [entry[0] for entry in summary["top"]]
+        self.assertIn("[sleep]", functions)
+        self.assertTrue(any(function.endswith(":busy") for function in functions))
+
+    def test_cycle_writes_folded_stacks_and_flamegraph(self):
+        summary = self._cycle()
+        logs = os.path.join(self.tmpdir.name, "cache", "logs")
+
+        svg = os.path.join(logs, summary["flamegraph"])
+        self.assertTrue(os.path.exists(svg))
+        with open(svg.replace(".svg", ".folded")) as folded:
+            lines = folded.read().splitlines()
+        self.assertTrue(any(line.startswith("village.builder;sleep;") for line in lines))
+
+    def test_only_the_last_profiles_are_kept(self):
+        for _ in range(3):
+            self._cycle()
+        logs = os.path.join(self.tmpdir.name, "cache", "logs")
+
+        self.assertEqual(len([name for name in os.listdir(logs) if name.endswith(".svg")]), 2)
+
+    def test_disabled_profiler_does_nothing(self):
+        profiler = _Profiler()
+        profiler.start_cycle()
+        with profiler.activity("sleep"):
+            pass
+        self.assertIsNone(profiler.end_cycle())
+
+    def test_flamegraph_svg(self):
+        svg = flamegraph_svg({"main;logic;a;b": 3, "main;sleep;a;[sleep]": 1}, title="test")
+        self.assertTrue(svg.startswith("<svg"))
+        self.assertIn("[sleep]", svg)
+        self.assertIn("75.0%", svg)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from core.reporter import BatchWriter, MySQLReporter, ReportDatabase, ReporterObject
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, args=None):
+        if query.startswith("ALTER TABLE") and self.connection.alter_error:
+            raise self.connection.alter_error
+        self.connection.statements.append((query, args))
+
+    def executemany(self, query, rows):
+        if self.connection.fail:
+            raise ConnectionError("server has gone away")
+        self.connection.statements.append((query, list(rows)))
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+        self.fail = False
+        self.open = True
+        self.alter_error = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        self.open = False
+
+
+class TestBatchWriter(unittest.TestCase):
+
+    def test_flushes_on_size_and_close(self):
+        batches = []
+        writer = BatchWriter(batches.append, max_batch=3, max_delay=60)
+        for index in range(4):
+            writer.put("log", index)
+        deadline = time.time() + 2
+        while not batches and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(batches, [[("log", 0), ("log", 1), ("log", 2)]])
+
+        writer.close()
+        self.assertEqual(batches[-1], [("log", 3)])
+        self.assertEqual(writer.written, 4)
+
+    def test_flushes_after_delay(self):
+        flushed = threading.Event()
+        writer = BatchWriter(lambda batch: flushed.set(), max_batch=100, max_delay=0.1)
+        writer.put("log", 1)
+        self.assertTrue(flushed.wait(2))
+        writer.close()
+
+    def test_failed_batch_is_retried(self):
+        attempts = []
+
+        def flush(batch):
+            attempts.append(list(batch))
+            if len(attempts) == 1:
+                raise ConnectionError("down")
+
+        writer = BatchWriter(flush, max_batch=100, max_delay=60)
+        writer.put("log", 1)
+        writer.request_flush()
+        deadline = time.time() + 2
+        while not attempts and time.time() < deadline:
+            time.sleep(0.01)
+        writer.close()
+        self.assertEqual(attempts, [[("log", 1)], [("log", 1)]])
+        self.assertEqual(writer.dropped, 0)
+
+    def test_backoff_and_max_queue_while_flush_fails(self):
+        attempts = []
+
+        def flush(batch):
+            attempts.append(len(batch))
+            raise ConnectionError("down")
+
+        writer = BatchWriter(flush, max_batch=5, max_delay=0.2, max_queue=50)
+        started = time.time()
+        for index in range(300):
+            writer.put("log", index)
+            time.sleep(0.005)
+        elapsed = time.time() - started
+        # One try for the first full batch, then 0.2s, 0.4s, 0.8s, ... between the retries
+        self.assertLessEqual(len(attempts), 2 + elapsed / 0.2)
+        self.assertLessEqual(max(attempts), 50)
+        self.assertEqual(writer.dropped, 250)
+        writer.close()
+        self.assertEqual(writer.dropped, 300)
+        self.assertEqual(writer.written, 0)
+
+
+class TestMySQLReporter(unittest.TestCase):
+
+    def setUp(self):
+        self.connections = []
+
+        def connect(_):
+            connection = FakeConnection()
+            self.connections.append(connection)
+            return connection
+
+        self.patcher = patch.object(MySQLReporter, "connection_from_object", side_effect=connect)
+        self.patcher.start()
+        self.reporter = MySQLReporter(max_batch=1000, max_delay=60)
+        self.assertTrue(self.reporter.setup({"host": "localhost"}))
+
+    def tearDown(self):
+        self.reporter.close()
+        self.patcher.stop()
+
+    def test_batches_logs_and_upserts_latest_data(self):
+        self.reporter.report(None, "1", "TWB_START", "start")
+        self.reporter.report(None, "2", "TWB_START", "start")
+        self.reporter.add_data(None, "1", "village.resources", '{"wood": 1}')
+        self.reporter.add_data(None, "1", "village.resources", '{"wood": 2}')
+        self.reporter.add_data(None, "1", "village.troops", '{}')
+        self.reporter.writer.close()
+
+        connection = self.connections[0]
+        logs = [rows for query, rows in connection.statements if query.startswith("INSERT INTO twb_logs")]
+        upserts = [rows for query, rows in connection.statements if "ON DUPLICATE KEY UPDATE" in query]
+        self.assertEqual(len(logs), 1)
+        self.assertEqual([row[:3] for row in logs[0]], [("1", "TWB_START", "start"), ("2", "TWB_START", "start")])
+        self.assertEqual(len(upserts), 1)
+        self.assertEqual(
+            sorted(row[:3] for row in upserts[0]),
+            [("1", "village.resources", '{"wood": 2}'), ("1", "village.troops", '{}')]
+        )
+        self.assertEqual(len(self.connections), 1)
+
+    def test_reconnects_after_failure(self):
+        self.connections[0].fail = True
+        self.reporter.report(None, "1", "TWB_START", "start")
+        self.reporter.writer.request_flush()
+        deadline = time.time() + 2
+        while self.connections[0].open and time.time() < deadline:
+            time.sleep(0.01)
+        self.reporter.writer.close()
+
+        self.assertEqual(len(self.connections), 2)
+        self.assertTrue(any(
+            query.startswith("INSERT INTO twb_logs") for query, _ in self.connections[1].statements
+        ))
+
+    def test_only_an_existing_key_is_ignored(self):
+        def connect(error):
+            connection = FakeConnection()
+            connection.alter_error = error
+            return connection
+
+        for error, logged in ((Exception(1061, "Duplicate key name 'village_data'"), False),
+                              (Exception(1062, "Duplicate entry '1-village.troops'"), True)):
+            reporter = MySQLReporter()
+            with patch.object(MySQLReporter, "connection_from_object", side_effect=lambda _: connect(error)), \
+                    patch.object(reporter.logger, "error") as log_error:
+                self.assertTrue(reporter.setup({"host": "localhost"}))
+                reporter.close()
+            self.assertEqual(log_error.called, logged)
+
+
+class TestSQLiteReporter(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "reports.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_reporter_buffers_and_stores_series(self):
+        reporter = ReporterObject(enabled=True, connection_string="sqlite://" + self.path)
+        reporter.report("1", "TWB_START", "Starting run")
+        reporter.add_data("1", "village.resources", json.dumps({"wood": 100, "stone": "50", "iron": 25}))
+        reporter.add_data("1", "village.farm_bag", json.dumps({"current": 10, "max": 20, "pct": 0.5}))
+        reporter.add_data("1", "village.config", json.dumps({"managed": True}))
+        reporter.close()
+
+        database = ReportDatabase(self.path)
+        self.assertEqual(database.logs(village_id="1")[0]["action"], "TWB_START")
+        self.assertEqual(database.latest("1")["1"]["village.config"], {"managed": True})
+        resources = database.series("1", "village.resources")
+        self.assertEqual(sorted(resources), ["iron", "stone", "wood"])
+        self.assertEqual(resources["stone"][0][1], 50.0)
+        self.assertEqual(database.series("1", "village.farm_bag", keys=["pct"])["pct"][0][1], 0.5)
+        self.assertEqual(database.series("1", "village.config"), {})
+        database.close()
+
+    def test_downsampling_averages_old_values(self):
+        database = ReportDatabase(self.path)
+        now = 100 * 86400
+        snapshots = []
+        # One value every 10 minutes for the last 40 days
+        for ts in range(now - 40 * 86400, now, 600):
+            snapshots.append((ts, "1", "village.resources", json.dumps({"wood": ts % 3600})))
+        database.write(snapshots=snapshots)
+
+        database.downsample(now=now)
+
+        wood = database.series("1", "village.resources")["wood"]
+        rows = dict(database.con.execute("SELECT resolution, COUNT(*) FROM series GROUP BY resolution").fetchall())
+        self.assertEqual(set(rows), {0, 3600, 86400})
+        self.assertLessEqual(rows[0], 2 * 86400 // 600 + 6)
+        self.assertEqual(rows[86400], 10)
+        # Buckets hold the average of the raw values
+        hourly = [value for ts, value in wood if now - 30 * 86400 <= ts < now - 3 * 86400]
+        self.assertTrue(all(value == 1500 for value in hourly))
+        self.assertEqual(wood, sorted(wood))
+        database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
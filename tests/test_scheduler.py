@@ -0,0 +1,63 @@
+import unittest
+
+from core.scheduler import VillageScheduler
+
+
+class TestVillageScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = VillageScheduler(min_interval=60)
+
+    def test_pop_due_returns_only_expired_tasks(self):
+        self.scheduler.set_due('1', 'start', 0)
+        self.scheduler.set_due('2', 'build_queue', 500)
+
+        self.assertEqual(self.scheduler.pop_due(now=100), {'1': ['start']})
+        self.assertEqual(self.scheduler.pop_due(now=100), {})
+        self.assertEqual(self.scheduler.pop_due(now=500), {'2': ['build_queue']})
+
+    def test_update_replaces_old_tasks(self):
+        self.scheduler.update('1', {'build_queue': 300, 'farm': 200}, fallback=1000, now=0)
+        self.scheduler.update('1', {'build_queue': 400}, fallback=1000, now=0)
+
+        self.assertEqual(self.scheduler.pending('1'), {'build_queue': 400, 'idle': 1000})
+        self.assertEqual(self.scheduler.next_due(), 400)
+
+    def test_update_skips_empty_tasks_and_clamps_to_min_interval(self):
+        self.scheduler.update('1', {'build_queue': 10, 'market': None}, fallback=1000, now=0)
+
+        self.assertEqual(self.scheduler.pending('1'), {'build_queue': 60, 'idle': 1000})
+
+    def test_multiple_tasks_of_a_village_are_grouped(self):
+        self.scheduler.update('1', {'build_queue': 100, 'recruit_queue': 120}, fallback=1000, now=0)
+
+        self.assertEqual(self.scheduler.pop_due(now=200), {'1': ['build_queue', 'recruit_queue']})
+        self.assertEqual(self.scheduler.pending('1'), {'idle': 1000})
+
+    def test_seconds_until_next(self):
+        self.assertIsNone(self.scheduler.seconds_until_next(now=0))
+        self.scheduler.update('1', {}, fallback=300, now=0)
+        self.assertEqual(self.scheduler.seconds_until_next(now=100), 200)
+        self.assertEqual(self.scheduler.seconds_until_next(now=400), 0)
+
+    def test_requeue_villages_that_did_not_run(self):
+        for village_id in ('1', '2', '3'):
+            self.scheduler.update(village_id, {'build_queue': 100}, fallback=1000, now=0)
+        due = self.scheduler.pop_due(now=100)
+        # Village 1 ran, then the connection was lost
+        self.scheduler.update('1', {'build_queue': 500}, fallback=1000, now=100)
+        self.scheduler.requeue(due, now=100, skip={'1'})
+
+        self.assertEqual(self.scheduler.pop_due(now=100), {'2': ['build_queue'], '3': ['build_queue']})
+        self.assertEqual(self.scheduler.pending('1'), {'build_queue': 500, 'idle': 1000})
+
+    def test_remove(self):
+        self.scheduler.update('1', {'farm': 100}, fallback=300, now=0)
+        self.scheduler.remove('1')
+
+        self.assertIsNone(self.scheduler.next_due())
+        self.assertEqual(self.scheduler.pop_due(now=1000), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
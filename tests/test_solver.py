@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
 from game.gamestate import GameState
-from game.solver import MultiActionPlanner
+from game.solver import MultiActionPlanner, BeamSearchPlanner
 from game.actions import BuildAction
 
 class TestSolver(unittest.TestCase):
@@ -56,5 +56,57 @@ class TestSolver(unittest.TestCase):
         self.assertEqual(plan[0], action_best) # First action should be the one leading to the best score
         self.assertEqual(plan[1], action_next) # Second action is the only one possible after the first
 
+    def _permutation_generator(self):
+        """Two independent builds which can be done in either order."""
+        action_generator = MagicMock()
+        build_main = BuildAction('main', 2, {'wood': 30, 'stone': 30, 'iron': 30})
+        build_barracks = BuildAction('barracks', 1, {'wood': 30, 'stone': 30, 'iron': 30})
+
+        def generate_side_effect(state):
+            actions = []
+            if state.building_levels.get('main', 0) < 2:
+                actions.append(build_main)
+            if state.building_levels.get('barracks', 0) < 1:
+                actions.append(build_barracks)
+            return actions
+
+        action_generator.generate.side_effect = generate_side_effect
+        return action_generator
+
+    def test_beam_search_planner_finds_full_plan(self):
+        planner = BeamSearchPlanner(self._permutation_generator(), beam_width=2, max_depth=5, time_budget=None)
+
+        plan = planner.plan_actions(self.game_state, marginal_incomes={})
+
+        self.assertEqual(len(plan), 2)
+        self.assertEqual({a.building for a in plan}, {'main', 'barracks'})
+        self.assertFalse(planner.last_stats['timed_out'])
+
+    def test_beam_search_planner_uses_transposition_table(self):
+        planner = BeamSearchPlanner(self._permutation_generator(), beam_width=4, max_depth=5, time_budget=None)
+
+        planner.plan_actions(self.game_state, marginal_incomes={})
+
+        # main->barracks and barracks->main end in the same state, which is only evaluated once
+        self.assertEqual(planner.last_stats['evaluations'], 3)
+        self.assertEqual(planner.last_stats['table_hits'], 1)
+
+    def test_beam_search_planner_returns_best_plan_when_budget_expires(self):
+        planner = BeamSearchPlanner(self._permutation_generator(), beam_width=4, max_depth=5, time_budget=1e-9)
+
+        plan = planner.plan_actions(self.game_state, marginal_incomes={})
+
+        self.assertTrue(planner.last_stats['timed_out'])
+        self.assertLessEqual(len(plan), 2)
+
+    def test_beam_search_does_not_mutate_initial_state(self):
+        planner = BeamSearchPlanner(self._permutation_generator(), time_budget=None)
+
+        planner.plan_actions(self.game_state, marginal_incomes={})
+
+        self.assertEqual(self.game_state.resources['wood'], 100)
+        self.assertEqual(self.game_state.building_levels, {'main': 1, 'barracks': 0})
+
+
 if __name__ == '__main__':
     unittest.main()
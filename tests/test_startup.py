@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Only needed once the bot actually talks to the game, Telegram or the console
+LAZY_MODULES = ("telegram", "bs4", "pyquery", "coloredlogs", "requests")
+
+# Generous on purpose, it catches a heavy import sneaking back in rather than small regressions
+IMPORT_BUDGET = 1.0
+
+
+def import_times(module, args=None):
+    """
+    Imports a module (or runs a script with `args`) in a fresh interpreter,
+    returns {module: cumulative seconds} from -X importtime
+    """
+    command = [module] + list(args) if args is not None else ["-c", "import %s" % module]
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime"] + command,
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_twb_import_is_lazy(self):
+        times = import_times("twb")
+
+        loaded = [name for name in times if name.split(".")[0] in LAZY_MODULES]
+        self.assertEqual(loaded, [], "imported at startup: %s" % ", ".join(loaded))
+        self.assertLess(times["twb"], IMPORT_BUDGET)
+
+    def test_integrity_check_is_lazy(self):
+        with tempfile.TemporaryDirectory() as home:
+            times = import_times("twb.py", ["-i", "--home", home])
+
+        loaded = [name for name in times if name.split(".")[0] in LAZY_MODULES]
+        self.assertEqual(loaded, [], "imported by -i: %s" % ", ".join(loaded))
+
+    def test_notification_does_not_read_config_on_import(self):
+        from core.notification import _Notification
+
+        notification = _Notification()
+        self.assertFalse(notification.configured)
+        self.assertIsNone(notification.loop)
+
+
+if __name__ == '__main__':
+    unittest.main()
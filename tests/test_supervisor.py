@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from core.supervisor import Supervisor, Worker
+
+
+class FakeProcess:
+    def __init__(self, pid):
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def exit(self, code):
+        self.returncode = code
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.processes = []
+
+        def spawn(worker):
+            process = FakeProcess(1000 + len(self.processes))
+            self.processes.append(process)
+            return process
+
+        self.home = os.path.join(self.tmpdir.name, "nl01")
+        self.supervisor = Supervisor([self.home], min_backoff=5, max_backoff=40, stable_after=300, spawn=spawn)
+        self.worker = self.supervisor.workers[0]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_worker_command_uses_own_home(self):
+        worker = Worker(self.home)
+        self.assertEqual(worker.name, "nl01")
+        self.assertEqual(worker.command()[-2:], ["--home", os.path.abspath(self.home)])
+
+    def test_starts_worker_once(self):
+        self.supervisor.check_worker(self.worker, now=0)
+        self.supervisor.check_worker(self.worker, now=1)
+
+        self.assertEqual(len(self.processes), 1)
+        self.assertTrue(os.path.isdir(self.home))
+
+    def test_crashing_worker_restarts_with_growing_backoff(self):
+        self.supervisor.check_worker(self.worker, now=0)
+        delays = []
+        now = 0
+        for _ in range(5):
+            self.processes[-1].exit(1)
+            self.supervisor.check_worker(self.worker, now=now)
+            delays.append(self.worker.restart_at - now)
+            # Not restarted before the backoff expired
+            self.supervisor.check_worker(self.worker, now=self.worker.restart_at - 1)
+            now = self.worker.restart_at
+            self.supervisor.check_worker(self.worker, now=now)
+
+        self.assertEqual(delays, [5, 10, 20, 40, 40])
+        self.assertEqual(self.worker.restarts, 5)
+        self.assertEqual(self.worker.last_exit_code, 1)
+
+    def test_backoff_resets_after_stable_run(self):
+        self.worker.backoff = 40
+        self.supervisor.check_worker(self.worker, now=0)
+        self.processes[-1].exit(1)
+
+        self.supervisor.check_worker(self.worker, now=1000)
+
+        self.assertEqual(self.worker.restart_at, 1005)
+
+    def test_stats_include_cycle_stats(self):
+        self.supervisor.check_worker(self.worker, now=0)
+        os.makedirs(os.path.join(self.home, "cache"))
+        with open(os.path.join(self.home, "cache", "worker.json"), "w") as stats_file:
+            stats_file.write('{"runs": 3, "last_cycle_duration": 1.5}')
+        self.worker.process_stats = MagicMock(return_value={"cpu_percent": 1.0, "memory_rss": 1024})
+
+        stats = self.supervisor.stats()["nl01"]
+
+        self.assertTrue(stats["running"])
+        self.assertEqual(stats["pid"], 1000)
+        self.assertEqual(stats["cycle"]["runs"], 3)
+        self.assertEqual(stats["process"]["memory_rss"], 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import unittest
 from unittest.mock import MagicMock, patch
 from core.templates import TemplateManager
 from core.exceptions import InvalidJSONException
+from core.filemanager import FileManager
 
 class TestTemplateManager(unittest.TestCase):
     @patch('core.filemanager.FileManager.path_exists')
@@ -22,8 +23,18 @@ class TestTemplateManager(unittest.TestCase):
 
         # Assert
         self.assertEqual(result, "main:20")
-        mock_load_json.assert_called_once_with("templates/builder/legacy_template.txt")
-        mock_read_file.assert_called_once_with("templates/builder/legacy_template.txt")
+        expected_path = FileManager.get_install_path("templates/builder/legacy_template.txt")
+        mock_load_json.assert_called_once_with(expected_path)
+        mock_read_file.assert_called_once_with(expected_path)
+
+    @patch.dict('os.environ', {'TWB_HOME': '/tmp/twb-world'})
+    def test_templates_are_read_from_install_dir(self):
+        """
+        Tests that templates are shared between worlds while the data root moves to TWB_HOME.
+        """
+        self.assertEqual(FileManager.get_path("config.json"), "/tmp/twb-world/config.json")
+        result = TemplateManager.get_template("builder", "purple_predator")
+        self.assertTrue(result)
 
 if __name__ == '__main__':
     unittest.main()
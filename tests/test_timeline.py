@@ -0,0 +1,84 @@
+import math
+import time
+import unittest
+
+from game.actions import BuildAction, RecruitAction
+from game.gamestate import GameState
+from game.timeline import TimelineSimulator
+
+
+class TestTimelineSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = TimelineSimulator(max_build_queue=2)
+        self.state = GameState(village_id='123')
+        self.state.resources = {'wood': 100, 'stone': 100, 'iron': 100, 'pop': 100}
+        self.state.storage_capacity = 1000
+        # 360 per hour = 0.1 per second
+        self.state.resource_income = {'wood': 360, 'stone': 360, 'iron': 360}
+
+    def test_time_until_affordable(self):
+        cost = {'wood': 200, 'stone': 100, 'iron': 50}
+        self.assertAlmostEqual(self.simulator.time_until_affordable(self.state, cost), 1000)
+        self.assertEqual(self.simulator.time_until_affordable(self.state, {'wood': 50}), 0)
+
+    def test_time_until_affordable_is_infinite_when_storage_too_small(self):
+        self.assertEqual(self.simulator.time_until_affordable(self.state, {'wood': 1001}), math.inf)
+
+    def test_time_until_affordable_is_infinite_without_farm_space(self):
+        self.assertEqual(self.simulator.time_until_affordable(self.state, {'wood': 1, 'pop': 101}), math.inf)
+
+    def test_project_schedules_actions_when_affordable(self):
+        first = BuildAction('main', 2, {'wood': 100, 'stone': 100, 'iron': 100}, duration=600)
+        second = BuildAction('barracks', 1, {'wood': 200, 'stone': 200, 'iron': 200}, duration=600)
+
+        schedule, projected = self.simulator.project(self.state, [first, second], horizon=3600)
+
+        self.assertEqual(len(schedule), 2)
+        self.assertEqual(schedule[0].start, 0)
+        self.assertEqual(schedule[0].finish, 600)
+        # Everything was spent on the first build, 200 more takes 2000 seconds
+        self.assertAlmostEqual(schedule[1].start, 2000)
+        self.assertEqual(projected.building_levels, {'main': 2, 'barracks': 1})
+
+    def test_project_respects_build_queue_length(self):
+        self.state.resources = {'wood': 1000, 'stone': 1000, 'iron': 1000, 'pop': 100}
+        actions = [BuildAction('main', level, {'wood': 10}, duration=100) for level in (2, 3, 4)]
+
+        schedule, _ = self.simulator.project(self.state, actions)
+
+        self.assertEqual([entry.start for entry in schedule], [0, 0, 100])
+        self.assertEqual([entry.finish for entry in schedule], [100, 200, 300])
+
+    def test_project_caps_resources_at_storage(self):
+        _, projected = self.simulator.project(self.state, [], horizon=48 * 3600)
+        self.assertEqual(projected.resources['wood'], 1000)
+
+    def test_project_stops_at_horizon(self):
+        expensive = BuildAction('main', 2, {'wood': 900}, duration=60)
+        schedule, _ = self.simulator.project(self.state, [expensive], horizon=3600)
+        self.assertEqual(schedule, [])
+
+    def test_recruitment_uses_separate_queue(self):
+        self.state.troop_queue = {'barracks_queue_time': 300, 'stable_queue_time': 0, 'garage_queue_time': 0}
+        recruit = RecruitAction('spear', 10, {'wood': 5, 'stone': 3, 'iron': 1, 'pop': 1}, duration=100)
+        build = BuildAction('main', 2, {'wood': 10}, duration=50)
+
+        schedule, projected = self.simulator.project(self.state, [recruit, build], horizon=3600)
+
+        self.assertEqual(schedule[0].finish, 400)
+        self.assertEqual(schedule[1].start, 0)
+        self.assertEqual(projected.troop_counts['spear'], 10)
+        self.assertEqual(projected.resources['pop'], 90)
+
+    def test_projection_for_many_villages_is_fast(self):
+        actions = [BuildAction('main', level, {'wood': 50 * level, 'stone': 50 * level, 'iron': 50 * level},
+                               duration=600 * level) for level in range(2, 30)]
+        started = time.perf_counter()
+        for _ in range(100):
+            self.simulator.project(self.state, actions, horizon=48 * 3600)
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
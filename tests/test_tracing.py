@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from core.tracing import _Tracer
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = _Tracer(buffer_size=5)
+
+    def test_nested_spans_roll_up_requests_and_bytes(self):
+        with self.tracer.span("village.run", village_id="1") as run:
+            with self.tracer.span("village.builder") as stage:
+                with self.tracer.span("http.get", requests=1) as request:
+                    request.set(bytes=100)
+                with self.tracer.span("http.post", requests=1, bytes=50):
+                    pass
+
+        self.assertEqual(stage.parent, run)
+        self.assertEqual(request.trace_id, run.trace_id)
+        self.assertEqual(stage.attributes["requests"], 2)
+        self.assertEqual(stage.attributes["bytes"], 150)
+        self.assertEqual(run.attributes["requests"], 2)
+        self.assertIsNone(self.tracer.current())
+
+    def test_decorator_creates_span_per_call(self):
+        @self.tracer.trace("work")
+        def work(value):
+            return value * 2
+
+        self.assertEqual(work(2), 4)
+        self.assertEqual(work(3), 6)
+        spans = self.tracer.recent("work")
+        self.assertEqual(len(spans), 2)
+        self.assertNotEqual(spans[0].span_id, spans[1].span_id)
+
+    def test_exception_marks_span_and_closes_children(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.span("village.run"):
+                self.tracer.start_span("village.market")
+                raise ValueError("boom")
+
+        market, run = self.tracer.recent()
+        self.assertTrue(market.ended)
+        self.assertIn("boom", run.error)
+        self.assertIsNone(self.tracer.current())
+
+    def test_ring_buffer_keeps_last_spans(self):
+        for index in range(10):
+            with self.tracer.span("step", index=index):
+                pass
+        spans = self.tracer.recent()
+        self.assertEqual(len(spans), 5)
+        self.assertEqual(spans[-1].attributes["index"], 9)
+
+    def test_summary_groups_stages(self):
+        spans = []
+        for stage in ("units", "builder", "units"):
+            span = self.tracer.start_span("village.%s" % stage, requests=1)
+            span.end()
+            spans.append(span)
+        spans.append(self.tracer.start_span("village.finish"))
+
+        summary = self.tracer.summary(spans, prefix="village.")
+
+        self.assertEqual(set(summary), {"units", "builder"})
+        self.assertEqual(summary["units"]["count"], 2)
+        self.assertEqual(summary["units"]["requests"], 2)
+
+    def test_export_writes_otlp_json_lines(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict('os.environ', {'TWB_HOME': tmpdir}):
+            self.tracer.configure(export=True)
+            with self.tracer.span("twb.cycle", cycle=1):
+                with self.tracer.span("http.get", requests=1, url="game.php"):
+                    pass
+            self.assertEqual(self.tracer.export(), 2)
+            self.assertEqual(self.tracer.export(), 0)
+
+            with open(os.path.join(tmpdir, "cache", "logs", "traces.jsonl")) as trace_file:
+                lines = trace_file.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        request, cycle = spans
+        self.assertEqual(request["parentSpanId"], cycle["spanId"])
+        self.assertEqual(len(cycle["traceId"]), 32)
+        self.assertIn({"key": "requests", "value": {"intValue": "1"}}, cycle["attributes"])
+        self.assertIn({"key": "url", "value": {"stringValue": "game.php"}}, request["attributes"])
+
+
+if __name__ == '__main__':
+    unittest.main()
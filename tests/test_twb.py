@@ -6,6 +6,7 @@ import os
 # Ensure the root directory is in the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from core.tracing import Tracer
 from twb import TWB
 
 class TestTWB(unittest.TestCase):
@@ -67,6 +68,24 @@ class TestTWB(unittest.TestCase):
 
         # 5. Check that the config was updated
         self.assertIn('12345', updated_config['villages'])
+    @patch('twb.ConfigManager')
+    @patch('twb.Notification')
+    @patch('twb.WebWrapper')
+    def test_failed_cycle_closes_its_span(self, mock_wrapper_class, mock_notification, mock_config_manager):
+        config = {
+            "server": {"endpoint": "https://nl.example/game.php", "server": "nl01"},
+            "reporting": {"enabled": False, "connection_string": ""},
+            "bot": {"user_agent": "test"},
+            "villages": {},
+        }
+        mock_wrapper_class.return_value.connectivity.online = True
+        with patch.object(TWB, 'config', return_value=config), \
+                patch.object(TWB, 'get_overview', side_effect=RuntimeError("page changed")):
+            with self.assertRaises(RuntimeError):
+                self.twb.run()
+        # main() restarts the loop after an error, the next cycle must not nest under this one
+        self.assertIsNone(Tracer.current())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -4,6 +4,7 @@ import os
 from unittest.mock import patch, MagicMock
 from datetime import datetime
 
+from game.actions import BuildAction
 from game.village import Village
 from game.attack import AttackManager
 from game.buildingmanager import BuildingManager
@@ -37,6 +38,19 @@ class TestVillage(unittest.TestCase):
         self.village.attack = MagicMock(spec=AttackManager)
 
 
+    def test_missing_config_is_reported_once(self):
+        Village.missing_config = set()
+        other = Village(village_id='456', wrapper=self.wrapper)
+        other.logger = MagicMock()
+        other.config = self.village.config
+
+        self.assertEqual(self.village.get_config("bot", "missing", default=3), 3)
+        self.assertEqual(other.get_config("bot", "missing", default=3), 3)
+        self.assertEqual(self.village.get_config("bot", "missing"), None)
+
+        self.assertEqual(self.village.logger.warning.call_count, 1)
+        other.logger.warning.assert_not_called()
+
     @patch('game.village.datetime')
     def test_check_forced_peace_today(self, mock_datetime):
         # Arrange
@@ -165,5 +179,42 @@ class TestVillage(unittest.TestCase):
             '123', 'units', 'noble_rush_final_units'
         )
 
+    def test_schedule_projects_planned_actions_once(self):
+        state = self.village.game_state_model
+        state.resources = {'wood': 1000, 'stone': 1000, 'iron': 1000, 'pop': 100}
+        state.storage_capacity = 10000
+        state.resource_income = {'wood': 360, 'stone': 360, 'iron': 360}
+        main = BuildAction('main', 2, {'wood': 100}, duration=600)
+        barracks = BuildAction('barracks', 1, {'wood': 2000}, duration=600)
+        # Without affordable_only the generator returns the planned build again
+        self.village.action_generator = MagicMock()
+        self.village.action_generator.generate.return_value = [
+            BuildAction('main', 2, {'wood': 100}, duration=600), barracks
+        ]
+
+        self.village.schedule_actions([main])
+
+        names = [entry["action"] for entry in self.village.schedule]
+        self.assertEqual(names, [main.name, barracks.name])
+
+    @patch('game.village.Notification')
+    def test_attack_notification_sent_once_per_attack(self, mock_notification):
+        self.village.game_data = {"village": {"name": "Home"}}
+        self.village.def_man = MagicMock()
+        self.village.def_man.under_attack = True
+
+        self.village.setup_defence_manager(data=None)
+        self.village.setup_defence_manager(data=None)
+
+        mock_notification.send.assert_called_once_with("Village Home is under attack!", key="under_attack")
+
+        self.village.def_man.under_attack = False
+        self.village.setup_defence_manager(data=None)
+        self.village.def_man.under_attack = True
+        self.village.setup_defence_manager(data=None)
+
+        self.assertEqual(mock_notification.send.call_count, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,11 +2,14 @@ import unittest
 import sys
 import os
 import json
+import tempfile
 from unittest.mock import patch
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from core.reporter import ReportDatabase
 from webmanager.server import app
+from webmanager.utils import DataReader
 
 class TestWebManager(unittest.TestCase):
 
@@ -50,5 +53,55 @@ class TestWebManager(unittest.TestCase):
         self.assertIn("Recruit 100 Light Cavalry (Target: 2500)", response_text)
         self.assertIn("Test Village", response_text)
 
+    @patch('webmanager.server.DataReader.profile_grab')
+    def test_profile_page_lists_top_functions(self, mock_profile_grab):
+        mock_profile_grab.return_value = [{
+            "cycle": 3, "started": 1700000000, "duration": 12.5, "samples": 900,
+            "categories": {"sleep": 9.0, "network": 2.5, "parsing": 0.5, "logic": 0.5},
+            "stages": {"village.builder": 6.0},
+            "top": [["[sleep]", 9.0, 72.0], ["core/extractors.py:Extractor.game_state", 0.4, 3.2]],
+            "flamegraph": "profile-1700000000-3.svg",
+        }]
+
+        response = self.client.get('/profile')
+
+        self.assertEqual(response.status_code, 200)
+        response_text = response.get_data(as_text=True)
+        self.assertIn("core/extractors.py:Extractor.game_state", response_text)
+        self.assertIn("/profile/flamegraph/profile-1700000000-3.svg", response_text)
+
+    @patch('webmanager.server.DataReader.series_grab')
+    def test_series_api_returns_chart_data(self, mock_series_grab):
+        mock_series_grab.return_value = {"wood": [[1700000000, 100.0]]}
+
+        response = self.client.get('/api/series?village=12345&type=village.resources')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {"wood": [[1700000000, 100.0]]})
+        mock_series_grab.assert_called_once_with(village_id="12345", data_type="village.resources", since=None)
+
+    @patch('webmanager.server.DataReader.series_grab', return_value=None)
+    def test_series_api_without_database(self, _):
+        self.assertEqual(self.client.get('/api/series?village=12345').status_code, 404)
+
+    def test_report_database_is_opened_once_and_read_only(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "reports.db")
+            writer = ReportDatabase(path)
+            writer.write(snapshots=[(1700000000, "1", "village.resources", json.dumps({"wood": 100}))])
+            config = {"reporting": {"enabled": True, "connection_string": "sqlite://" + path}}
+            with patch.object(DataReader, "config_grab", return_value=config), \
+                    patch.dict("webmanager.utils._report_databases", clear=True), \
+                    patch.object(ReportDatabase, "create_tables") as create_tables:
+                self.assertEqual(DataReader.series_grab("1", "village.resources"), {"wood": [[1700000000, 100.0]]})
+                database = DataReader.report_database()
+                self.assertIs(DataReader.report_database(), database)
+                create_tables.assert_not_called()
+                with self.assertRaises(Exception):
+                    database.write(logs=[(1700000000, "1", "TWB_START", "")])
+            database.close()
+            writer.close()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,223 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from webmanager import server
+from webmanager.state import CacheDirectory, EventFeed, StateCache
+
+
+class TestStateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        for name in ("reports", "villages", "attacks", "managed"):
+            os.makedirs(os.path.join(self.root, "cache", name))
+        self.write("config.json", {"bot": {"server": "nl1"}})
+        self.state = StateCache(self.root, min_interval=0, report_window=3)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, path, data, mtime=None):
+        path = os.path.join(self.root, path)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def test_only_changed_files_are_parsed(self):
+        self.write("cache/villages/1.json", {"id": "1"}, mtime=1000)
+        self.write("cache/villages/2.json", {"id": "2"}, mtime=1000)
+        self.assertEqual(self.state.snapshot()["villages"], {"1": {"id": "1"}, "2": {"id": "2"}})
+        version = self.state.version
+
+        with patch("webmanager.state.json.load", wraps=json.load) as load:
+            self.assertEqual(self.state.refresh(), {})
+            load.assert_not_called()
+            self.assertEqual(self.state.version, version)
+
+            self.write("cache/villages/2.json", {"id": "2", "name": "B"}, mtime=2000)
+            os.remove(os.path.join(self.root, "cache", "villages", "1.json"))
+            self.assertEqual(self.state.refresh(), {"villages": {"1", "2"}})
+            self.assertEqual(load.call_count, 1)
+
+        self.assertEqual(self.state.snapshot()["villages"], {"2": {"id": "2", "name": "B"}})
+        self.assertNotEqual(self.state.version, version)
+
+    def test_reports_window_keeps_lowest_keys(self):
+        for report_id in (5, 40, 100, 7, 12):
+            self.write("cache/reports/%d.json" % report_id, {"id": report_id})
+
+        with patch("webmanager.state.json.load", wraps=json.load) as load:
+            reports = self.state.snapshot()["reports"]
+            # Three reports and config.json
+            self.assertEqual(load.call_count, 4)
+        self.assertEqual(list(reports), ["5", "7", "12"])
+
+    def test_broken_file_is_kept_and_retried(self):
+        path = os.path.join(self.root, "cache", "attacks", "1.json")
+        with open(path, "w") as f:
+            f.write('{"half": ')
+        self.assertEqual(self.state.snapshot()["attacks"], {})
+        self.assertTrue(os.path.exists(path))
+
+        self.write("cache/attacks/1.json", {"half": False}, mtime=3000)
+        self.assertEqual(self.state.snapshot()["attacks"], {"1": {"half": False}})
+
+    def test_refresh_is_rate_limited(self):
+        state = StateCache(self.root, min_interval=60)
+        self.assertEqual(state.snapshot()["config"], {"bot": {"server": "nl1"}})
+        self.write("config.json", {"bot": {"server": "nl2"}}, mtime=5000)
+        self.assertEqual(state.snapshot()["config"], {"bot": {"server": "nl1"}})
+        state.refresh(force=True)
+        self.assertEqual(state.snapshot()["config"], {"bot": {"server": "nl2"}})
+
+    def test_missing_directory_is_created(self):
+        directory = CacheDirectory(os.path.join(self.root, "cache", "new"))
+        self.assertEqual(directory.refresh(), set())
+        self.assertTrue(os.path.isdir(directory.path))
+
+
+class TestCollectionApi(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        for name in ("reports", "villages", "attacks", "managed"):
+            os.makedirs(os.path.join(self.root, "cache", name))
+        for report_id in range(1, 8):
+            report = {"type": "attack" if report_id % 2 else "scout", "origin": "1", "dest": str(100 + report_id),
+                      "losses": {}, "extra": {"padding": "x" * 300}}
+            self.write("reports", report_id, report)
+        self.write("managed", 1, {"status": "Idle", "resources": {"wood": 5}, "last_run": 1000})
+        self.write("managed", 2, {"status": "Under Attack!", "resources": {"wood": 9}, "last_run": 3000})
+        server.app.testing = True
+        self.client = server.app.test_client()
+        self.patcher = patch.object(server, "state", StateCache(self.root, min_interval=0, report_window=3))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.tmpdir.cleanup()
+
+    def write(self, collection, key, data):
+        with open(os.path.join(self.root, "cache", collection, "%s.json" % key), "w") as f:
+            json.dump(data, f)
+
+    def test_reports_are_paginated_newest_first(self):
+        ids = []
+        cursor = None
+        while True:
+            url = "/api/reports?limit=3" + ("&cursor=%s" % cursor if cursor else "")
+            page = self.client.get(url).get_json()
+            ids.extend(item["id"] for item in page["items"])
+            cursor = page["next"]
+            if not cursor:
+                break
+        self.assertEqual(ids, ["7", "6", "5", "4", "3", "2", "1"])
+
+    def test_filters_and_fields(self):
+        page = self.client.get("/api/reports?type=scout&village=104&fields=type,dest").get_json()
+        self.assertEqual(page["items"], [{"type": "scout", "dest": "104", "id": "4"}])
+
+        page = self.client.get("/api/managed?since=2000&fields=status").get_json()
+        self.assertEqual(page["items"], [{"status": "Under Attack!", "id": "2"}])
+
+    def test_etag_changes_with_the_data(self):
+        first = self.client.get("/api/managed")
+        etag = first.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertEqual(self.client.get("/api/managed", headers={"If-None-Match": etag}).status_code, 304)
+
+        self.write("managed", 3, {"status": "Idle", "last_run": 4000})
+        changed = self.client.get("/api/managed", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.get_json()["items"]), 3)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_map_tiles(self):
+        for village_id, location in (("1", [501, 502]), ("2", [560, 560])):
+            self.write("villages", village_id, {"id": village_id, "name": "V", "location": location, "points": 1,
+                                                "owner": "0", "tribe": "0", "bonus": None})
+        with patch.object(server, "map_tiles", server.MapTiles()):
+            index = self.client.get("/api/map").get_json()
+            self.assertEqual(sorted(index["tiles"]), ["25:25", "28:28"])
+
+            version = index["tiles"]["25:25"]
+            tile = self.client.get("/api/map/tile/25/25?v=%s" % version)
+            self.assertEqual(tile.get_json()["villages"][0][2], "1")
+            self.assertIn("immutable", tile.headers["Cache-Control"])
+            self.assertEqual(
+                self.client.get("/api/map/tile/25/25", headers={"If-None-Match": tile.headers["ETag"]}).status_code,
+                304
+            )
+
+        # After a restart the same tile counter gets another URL, browsers do not reuse the cached tile
+        with patch.object(server, "map_tiles", server.MapTiles(instance="restarted")):
+            self.assertNotEqual(self.client.get("/api/map").get_json()["tiles"]["25:25"], version)
+            old = self.client.get("/api/map/tile/25/25?v=%s" % version)
+            self.assertNotIn("immutable", old.headers["Cache-Control"])
+
+    def test_large_responses_are_compressed(self):
+        response = self.client.get("/api/reports", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))["items"]), 7)
+        self.assertEqual(
+            self.client.get("/api/reports", headers={"If-None-Match": response.headers["ETag"]}).status_code, 304
+        )
+        self.assertNotIn("Content-Encoding", self.client.get("/api/reports").headers)
+
+
+class TestEventFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "events.jsonl")
+        self.feed = EventFeed(self.path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def append(self, text):
+        with open(self.path, "a") as f:
+            f.write(text)
+
+    def test_reads_complete_lines_only(self):
+        self.assertEqual(self.feed.poll(), [])
+        self.append('{"id": 1, "village": "1", "changes": {}}\n{"id": 2, "vil')
+        self.assertEqual([event["id"] for event in self.feed.poll()], [1])
+        self.append('lage": "1", "changes": {}}\n')
+        self.assertEqual([event["id"] for event in self.feed.poll()], [2])
+        self.assertEqual([event["id"] for event in self.feed.since(1)], [2])
+
+    def test_rotation_does_not_repeat_events(self):
+        self.append("".join('{"id": %d}\n' % index for index in range(1, 6)))
+        self.feed.poll()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write('{"id": 4}\n{"id": 5}\n{"id": 6}\n')
+        os.replace(tmp, self.path)
+        self.assertEqual(self.feed.poll(), [{"id": 6}])
+
+    def test_event_stream(self):
+        self.append('{"id": 1, "village": "1", "changes": {"status": "Idle"}}\n')
+        server.app.testing = True
+        with patch.object(server, "events", self.feed), \
+                patch.object(server.bm, "is_running", return_value=True), \
+                patch.object(server, "EVENT_POLL", 0):
+            response = server.app.test_client().get("/api/events", headers={"Last-Event-ID": "0"},
+                                                    buffered=False)
+            chunks = iter(response.response)
+            self.assertEqual(response.mimetype, "text/event-stream")
+            self.assertEqual(next(chunks), b"retry: 5000\n\n")
+            self.assertEqual(next(chunks), b'id: 1\ndata: {"id":1,"village":"1","changes":{"status":"Idle"}}\n\n')
+            self.assertEqual(next(chunks), b'event: bot\ndata: {"status": true}\n\n')
+            response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,7 +19,6 @@ TWB - an open source Tribal Wars bot
 #
 
 import collections
-import copy
 import datetime
 import json
 import logging
@@ -29,33 +28,44 @@ import sys
 import signal
 import time
 import traceback
-import coloredlogs
-import requests
 
 from core.configmanager import ConfigManager
 from core.notification import Notification
 from core.updater import check_update
 from core.filemanager import FileManager
+from core.profiler import Profiler
+from core.tracing import Tracer
+from core.frozenconfig import freeze, thaw
 from core.request import WebWrapper
+from core.scheduler import VillageScheduler
+from game.resources import PremiumTrader
 from game.village import Village
 from manager import VillageManager
-from pages.overview import OverviewPage
+from pages.overview import OverviewPage, OverviewSnapshot
 from core.exceptions import UnsupportedPythonVersion
 from core.extractors import Extractor
 
-# --- LOGGING IMPROVEMENT ---
-# Set default log level to DEBUG. Use -v for DEBUG, -q for WARNING.
-log_level = logging.DEBUG
-if "-v" in sys.argv or "--verbose" in sys.argv:
+
+def setup_logging():
+    """
+    Installs the colored log output, only done when running the bot (coloredlogs is slow to import)
+    """
+    # --- LOGGING IMPROVEMENT ---
+    # Set default log level to DEBUG. Use -v for DEBUG, -q for WARNING.
     log_level = logging.DEBUG
-elif "-q" in sys.argv or "--quiet" in sys.argv:
-    log_level = logging.WARNING
+    if "-v" in sys.argv or "--verbose" in sys.argv:
+        log_level = logging.DEBUG
+    elif "-q" in sys.argv or "--quiet" in sys.argv:
+        log_level = logging.WARNING
+
+    import coloredlogs
+
+    coloredlogs.install(
+        level=log_level,
+        fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    # --- END LOGGING IMPROVEMENT ---
 
-coloredlogs.install(
-    level=log_level,
-    fmt="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-)
-# --- END LOGGING IMPROVEMENT ---
 
 logging.getLogger("requests").setLevel(logging.WARNING)
 logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -87,23 +97,16 @@ class TWB:
         self.wrapper = None
         self.should_run = True
         self.runs = 0
+        self.wakeups = 0
+        self.profile = "--profile" in sys.argv
         self.found_villages = []
+        # Overview pages of the current cycle, shared by the premium trader and the resource balancer
+        self.overview = None
         # --- PERFORMANCE (POINT 4) ---
         self.config_data = None
         self.config_mtime = 0
         # --- END PERFORMANCE ---
 
-    @staticmethod
-    def internet_online():
-        """
-        Checks whether the bot has internet access
-        """
-        try:
-            requests.get("https://github.com/stefan2200/TWB", timeout=(10, 60))
-            return True
-        except requests.Timeout:
-            return False
-
     def manual_config(self):
         """
         Runs through manual steps of configuring the bot
@@ -111,7 +114,7 @@ class TWB:
         logging.info(
             "Hello and welcome, it looks like you don't have a config file (yet)"
         )
-        if not FileManager.path_exists("config.example.json"):
+        if not FileManager.path_exists(FileManager.get_install_path("config.example.json")):
             logging.error(
                 "Oh no, config.example.json and config.json do not exist. You broke something didn't you?"
             )
@@ -156,7 +159,9 @@ class TWB:
                 logging.info("Goodbye :)")
                 sys.exit(0)
 
-            template = FileManager.load_json_file("config.example.json", object_pairs_hook=collections.OrderedDict)
+            template = FileManager.load_json_file(
+                FileManager.get_install_path("config.example.json"), object_pairs_hook=collections.OrderedDict
+            )
             if not template:
                 logging.error("Unable to open config.example.json")
                 return False
@@ -178,12 +183,13 @@ class TWB:
         Also updates config file with template data in case of an update
         --- PERFORMANCE (POINT 4) ---
         Caches config in memory and only reloads if file is modified.
+        The returned config is a read-only snapshot shared with all villages, thaw() it before changing it.
         """
         config_path = "config.json"
-        config_example_path = "config.example.json"
+        config_example_path = FileManager.get_install_path("config.example.json")
 
         try:
-            current_mtime = os.path.getmtime(config_path)
+            current_mtime = os.path.getmtime(FileManager.get_path(config_path))
         except OSError:
             # Config.json doesn't exist, run manual config
             if self.manual_config():
@@ -210,10 +216,10 @@ class TWB:
                 FileManager.save_json_file(config, config_path)
                 print("Deployed new configuration file")
 
-            self.config_data = config
+            # Swapped in one go, villages keep the snapshot they got until their next run
+            self.config_data = freeze(config)
 
-        # Return a copy to prevent mutation of the cached config
-        return copy.deepcopy(self.config_data)
+        return self.config_data
         # --- END PERFORMANCE ---
 
     @staticmethod
@@ -290,7 +296,7 @@ class TWB:
                         num_existing_offense += 1
 
                     logging.info(f"New village {village_id} detected. Assigning '{template_name}'.")
-                    new_village_template = copy.deepcopy(config.get("village_template", {}))
+                    new_village_template = thaw(config.get("village_template", {}))
                     new_village_template["building"] = template_name
                     config = self.add_village(village_id=village_id, template=new_village_template)
             # --- END MULTI-VILLAGE ---
@@ -301,7 +307,7 @@ class TWB:
         """
         Adds a new village and sets the default template data
         """
-        original = self.config()
+        original = thaw(self.config())
         FileManager.copy_file("config.json", "config.bak")
 
         if not template and "village_template" not in original:
@@ -316,7 +322,7 @@ class TWB:
         # Invalidate config cache after manual edit
         self.config_data = None
         # --- END PERFORMANCE ---
-        return original
+        return self.config()
 
     @staticmethod
     def get_world_options(overview_page: OverviewPage, config):
@@ -335,6 +341,7 @@ class TWB:
 
         changed = False
         world_settings = overview_page.world_settings
+        config = thaw(config)
         world_config = config["world"]
 
         check_and_set("flags_enabled", world_settings.flags)
@@ -354,6 +361,39 @@ class TWB:
         get_h = time.localtime().tm_hour
         return get_h in range(active_h[0], active_h[1])
 
+    def write_worker_stats(self, villages_run, duration, requests=0):
+        """
+        Writes the cycle stats of this bot process, read by the multi-world supervisor
+        """
+        self.wakeups += 1
+        FileManager.save_json_file({
+            "pid": os.getpid(),
+            "runs": self.runs,
+            "wakeups": self.wakeups,
+            "villages_run": villages_run,
+            "last_cycle": int(time.time()),
+            "last_cycle_duration": round(duration, 3),
+            "requests": requests,
+            "connectivity": self.wrapper.connectivity.stats() if self.wrapper else None,
+        }, "cache/worker.json")
+
+    def configure_connectivity(self, config):
+        connectivity = self.wrapper.connectivity
+        connectivity.failure_threshold = config["bot"].get("connection_failures", 3)
+        connectivity.max_backoff = config["bot"].get("connection_max_backoff", 600)
+
+    def get_sleep_time(self, config):
+        """
+        Returns the amount of seconds between two bot cycles
+        """
+        sleep = 0
+        if self.is_active_hours(config=config):
+            sleep = config["bot"]["active_delay"]
+        else:
+            if config["bot"]["inactive_still_active"]:
+                sleep = config["bot"]["inactive_delay"]
+        return sleep + random.randint(20, 120)
+
     def run(self):
         """
         Run the bot
@@ -361,24 +401,6 @@ class TWB:
         """
         Notification.send("TWB is starting up")
         config = self.config()
-        if not self.internet_online():
-            print("Internet seems to be down, waiting till its back online...")
-            sleep = 0
-            if self.is_active_hours(config=config):
-                sleep = config["bot"]["active_delay"]
-            else:
-                if config["bot"]["inactive_still_active"]:
-                    sleep = config["bot"]["inactive_delay"]
-
-            sleep += random.randint(20, 120)
-            dtn = datetime.datetime.now()
-            dt_next = dtn + datetime.timedelta(0, sleep)
-            print(
-                "Dead for %.2f minutes (next run at: %s)" % (sleep / 60, dt_next.time())
-            )
-            time.sleep(sleep)
-            return False
-
         self.wrapper = WebWrapper(
             config["server"]["endpoint"],
             server=config["server"]["server"],
@@ -386,6 +408,11 @@ class TWB:
             reporter_enabled=config["reporting"]["enabled"],
             reporter_constr=config["reporting"]["connection_string"],
         )
+        self.configure_connectivity(config)
+        if not self.wrapper.probe():
+            print("The game server can not be reached, waiting till it is back online...")
+            self.wrapper.connectivity.trip(self.wrapper.connectivity.last_error)
+            self.wrapper.wait_for_connection()
 
         self.wrapper.start()
         if not config["bot"].get("user_agent", None):
@@ -399,105 +426,173 @@ class TWB:
         config_manager = ConfigManager()
         for vid in config["villages"]:
             v = Village(wrapper=self.wrapper, village_id=vid, config_manager=config_manager)
-            self.villages.append(copy.deepcopy(v))
+            self.villages.append(v)
         # setup additional builder
         rm = None
         defense_states = {}
+        scheduler = VillageScheduler(
+            min_interval=config["bot"].get("min_village_interval", 60)
+        )
+        for village in self.villages:
+            scheduler.set_due(village.village_id, "start", 0)
+        next_cycle = 0
         while self.should_run:
-            if not self.internet_online():
-                print("Internet seems to be down, waiting till its back online...")
-                sleep = 0
-                if self.is_active_hours(config=config):
-                    sleep = config["bot"]["active_delay"]
-                else:
-                    if config["bot"]["inactive_still_active"]:
-                        sleep = config["bot"]["inactive_delay"]
-
-                sleep += random.randint(20, 120)
-                dtn = datetime.datetime.now()
-                dt_next = dtn + datetime.timedelta(0, sleep)
-                print(
-                    "Dead for %.2f minutes (next run at: %s)" % (sleep / 60, dt_next.time())
-                )
-                time.sleep(sleep)
+            if not self.wrapper.connectivity.online:
+                print("Lost the connection to the game server, waiting till it is back online...")
+                self.wrapper.wait_for_connection()
             else:
                 # --- PERFORMANCE (POINT 4) ---
                 # Get cached config
                 config = self.config()
                 # --- END PERFORMANCE ---
-                overview_page, config = self.get_overview(config)
-                has_changed, new_cf = self.get_world_options(overview_page, config)
-                if has_changed:
-                    print("Updated world options")
-                    config = self.merge_configs(config, new_cf)
-                    FileManager.save_json_file(config, "config.json")
-                    # --- PERFORMANCE (POINT 4) ---
-                    # Invalidate config cache after manual edit
-                    self.config_data = None
-                    # --- END PERFORMANCE ---
-                    print("Deployed new configuration file")
-                village_number = 1
-                logger = logging.getLogger("TWB")
-                for village in self.villages:
-                    if village.village_id not in self.found_villages:
-                        logger.warning(
-                            f"Village {village.village_id} will be ignored because it was not detected "
-                            f"in the overview page. Found villages: {self.found_villages}. "
-                            f"This might be a detection issue rather than the village being unavailable."
+                if self.profile or config["bot"].get("profile", False):
+                    Profiler.enable(interval=config["bot"].get("profile_interval", 0.005))
+                Profiler.start_cycle()
+                Profiler.set_stage("overview")
+                Tracer.configure(export=config["bot"].get("trace", False))
+                cycle_span = Tracer.start_span("twb.cycle", cycle=self.wakeups + 1)
+                try:
+                    overview_page, config = self.get_overview(config)
+                    if self.overview is None:
+                        self.overview = OverviewSnapshot(self.wrapper)
+                    self.overview.new_cycle(
+                        overview_page, village_id=self.found_villages[0] if self.found_villages else None
+                    )
+                    has_changed, new_cf = self.get_world_options(overview_page, config)
+                    if has_changed:
+                        print("Updated world options")
+                        FileManager.save_json_file(new_cf, "config.json")
+                        # --- PERFORMANCE (POINT 4) ---
+                        # Invalidate config cache after manual edit
+                        self.config_data = None
+                        config = self.config()
+                        # --- END PERFORMANCE ---
+                        print("Deployed new configuration file")
+                    scheduler.min_interval = config["bot"].get("min_village_interval", 60)
+                    # "event" only wakes villages when one of their queues / timers expired
+                    # "fixed" runs all villages every cycle like before
+                    event_driven = config["bot"].get("scheduler", "event") == "event"
+                    now = time.time()
+                    due = scheduler.pop_due(now)
+                    fallback = now + self.get_sleep_time(config)
+                    village_number = 1
+                    villages_run = 0
+                    ran = set()
+                    logger = logging.getLogger("TWB")
+                    for village in self.villages:
+                        if village.village_id not in self.found_villages:
+                            logger.warning(
+                                f"Village {village.village_id} will be ignored because it was not detected "
+                                f"in the overview page. Found villages: {self.found_villages}. "
+                                f"This might be a detection issue rather than the village being unavailable."
+                            )
+                            scheduler.update(village.village_id, {}, fallback, now=now)
+                            continue
+                        if (
+                                event_driven
+                                and village.village_id not in due
+                                and scheduler.pending(village.village_id)
+                        ):
+                            village_number += 1
+                            continue
+                        if not rm:
+                            rm = village.rep_man
+                        else:
+                            village.rep_man = rm
+                        if (
+                                "auto_set_village_names" in config["bot"]
+                                and config["bot"]["auto_set_village_names"]
+                        ):
+                            template = config["bot"]["village_name_template"]
+                            fs = (
+                                    "%0"
+                                    + str(config["bot"]["village_name_number_length"])
+                                    + "d"
+                            )
+                            num_pad = fs % village_number
+                            template = template.replace("{num}", num_pad)
+                            village.village_set_name = template
+
+                        logger.debug(
+                            "Running village %s (due: %s)",
+                            village.village_id, ", ".join(due.get(village.village_id, ["new"]))
                         )
-                        continue
-                    if not rm:
-                        rm = village.rep_man
-                    else:
-                        village.rep_man = rm
-                    if (
-                            "auto_set_village_names" in config["bot"]
-                            and config["bot"]["auto_set_village_names"]
-                    ):
-                        template = config["bot"]["village_name_template"]
-                        fs = (
-                                "%0"
-                                + str(config["bot"]["village_name_number_length"])
-                                + "d"
+                        with Tracer.span("village.run", village_id=village.village_id):
+                            village.run(config=config)
+                        villages_run += 1
+                        ran.add(village.village_id)
+                        scheduler.update(
+                            village.village_id,
+                            village.next_due_times() if event_driven else {},
+                            fallback
                         )
-                        num_pad = fs % village_number
-                        template = template.replace("{num}", num_pad)
-                        village.village_set_name = template
-
-                    village.run(config=config)
-
-                    if (
-                            village.get_config(
-                                section="units", parameter="manage_defence", default=False
+                        if not self.wrapper.connectivity.online:
+                            # pop_due() removed the tasks of the remaining villages, they run once the connection is back
+                            scheduler.requeue(due, now, skip=ran)
+                            logger.warning("Game server unreachable, pausing the cycle")
+                            break
+
+                        if (
+                                village.get_config(
+                                    section="units", parameter="manage_defence", default=False
+                                )
+                                and village.def_man
+                        ):
+                            defense_states[village.village_id] = (
+                                village.def_man.under_attack
+                                if village.def_man.allow_support_recv
+                                else False
+                            )
+                        village_number += 1
+
+                    offers = [village.premium_offer for village in self.villages if getattr(village, "premium_offer", None)]
+                    if offers:
+                        # One look at the exchange for all villages, the sales are spread over the best prices
+                        max_points = config["market"].get("premium_max_points") or None
+                        with Tracer.span("twb.premium", villages=len(offers)):
+                            PremiumTrader(self.wrapper, max_points=max_points, overview=self.overview).run(offers)
+                        for village in self.villages:
+                            village.premium_offer = None
+
+                    if len(defense_states) and config["farms"]["farm"]:
+                        for village in self.villages:
+                            print("Syncing attack states")
+                            village.def_man.my_other_villages = defense_states
+
+                    # Global tasks keep running at the old cycle interval
+                    Profiler.set_stage("global")
+                    if now >= next_cycle:
+                        self.runs += 1
+                        next_cycle = fallback
+                        with Tracer.span("twb.global"):
+                            VillageManager.farm_manager(verbose=True)
+                            VillageManager.resource_balancer(
+                                self.wrapper, config, overview=self.overview,
+                                village_entries={
+                                    village.village_id: village.cache_entry
+                                    for village in self.villages if getattr(village, "cache_entry", None)
+                                },
                             )
-                            and village.def_man
-                    ):
-                        defense_states[village.village_id] = (
-                            village.def_man.under_attack
-                            if village.def_man.allow_support_recv
-                            else False
-                        )
-                    village_number += 1
-
-                if len(defense_states) and config["farms"]["farm"]:
-                    for village in self.villages:
-                        print("Syncing attack states")
-                        village.def_man.my_other_villages = defense_states
-
-                sleep = 0
-                if self.is_active_hours(config=config):
-                    sleep = config["bot"]["active_delay"]
-                else:
-                    if config["bot"]["inactive_still_active"]:
-                        sleep = config["bot"]["inactive_delay"]
 
-                sleep += random.randint(20, 120)
+                    cycle_span.set(villages=villages_run)
+                finally:
+                    # Also on errors, main() restarts the loop and later spans must not nest under this one
+                    cycle_span.end()
+                Tracer.export()
+                self.write_worker_stats(villages_run, time.time() - now, cycle_span.attributes.get("requests", 0))
+                profile = Profiler.end_cycle()
+                if profile:
+                    logger.info(
+                        "Profiled cycle %d in %.1fs: %s",
+                        profile["cycle"], profile["duration"],
+                        ", ".join("%s %.1fs" % (k, v) for k, v in profile["categories"].items())
+                    )
+                sleep = scheduler.seconds_until_next()
+                if sleep is None:
+                    # Nothing scheduled (e.g. no villages found), wait like a fixed cycle
+                    sleep = self.get_sleep_time(config)
                 dtn = datetime.datetime.now()
                 dt_next = dtn + datetime.timedelta(0, sleep)
-                self.runs += 1
-
-                VillageManager.farm_manager(verbose=True)
-                VillageManager.resource_balancer(self.wrapper, config)
                 print(
                     "Dead for %.2f minutes (next run at: %s)"
                     % (sleep / 60, dt_next.time())
@@ -545,10 +640,7 @@ def self_config_test():
     """
     Checks if the config file consists of valid json if it exists
     """
-    file_location = os.path.join(
-        os.path.dirname(__file__),
-        "config.json"
-    )
+    file_location = FileManager.get_path("config.json")
     if not os.path.exists(file_location):
         return None
     try:
@@ -561,7 +653,15 @@ def self_config_test():
 
 
 if __name__ == "__main__":
+    if "--home" in sys.argv:
+        # Run from a separate directory (config.json, cache and session), used for multiple worlds
+        home = os.path.abspath(sys.argv[sys.argv.index("--home") + 1])
+        os.makedirs(home, exist_ok=True)
+        os.environ["TWB_HOME"] = home
+        os.chdir(home)
     if "-i" in sys.argv:
+        # Plain logging, the integrity check should not pay for coloredlogs
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
         logging.info("Bot integrity check passed")
         check_conf = self_config_test()
         if sys.version_info[0] == 2:
@@ -573,5 +673,6 @@ if __name__ == "__main__":
             logging.error("It looks like your config file is corrupted and the bot was not able to start.")
             sys.exit(1)
         sys.exit(0)
+    setup_logging()
     main()
 
@@ -0,0 +1,189 @@
+"""
+Catalog of the building, troop and offensive templates for the web manager
+
+Templates are parsed and validated once and only read again when the file changed,
+so config pages can fill every template select without touching the disk.
+"""
+import json
+import os
+import threading
+import time
+
+CATEGORIES = ("builder", "troops", "offensive")
+EXTENSIONS = (".txt", ".json")
+BUILDINGS = {
+    "main", "barracks", "stable", "garage", "watchtower", "snob", "smith", "place", "statue", "market",
+    "wood", "stone", "iron", "farm", "storage", "hide", "wall", "church", "church_f",
+}
+
+
+def level_rows(lines):
+    """
+    Turns building:level lines into {building, from, to} rows
+    """
+    levels = {}
+    rows = []
+    for entry in lines:
+        entry = entry.strip()
+        if entry.startswith('#') or ':' not in entry:
+            continue
+        building, next_level = entry.split(':', 1)
+        try:
+            next_level = int(next_level)
+        except ValueError:
+            continue
+        rows.append({'building': building, 'from': levels.get(building, 0), 'to': next_level})
+        levels[building] = next_level
+    return rows
+
+
+class Template:
+    """
+    A parsed template file, `errors` lists what is wrong with it
+    """
+    def __init__(self, category, filename, text):
+        self.category = category
+        self.filename = filename
+        self.name = os.path.splitext(filename)[0]
+        self.text = text
+        self.errors = []
+        self.content = None
+        self.rows = []
+        self.mode = None
+        self.next_template = None
+        getattr(self, "parse_" + category)()
+
+    @property
+    def valid(self):
+        return not self.errors
+
+    def load_json(self):
+        try:
+            return json.loads(self.text)
+        except ValueError as e:
+            self.errors.append("Invalid JSON: %s" % e)
+            return None
+
+    def parse_builder(self):
+        lines = self.text.splitlines()
+        if self.filename.endswith(".json"):
+            data = self.load_json()
+            if data is None:
+                return
+            if not isinstance(data, dict) or not isinstance(data.get("template_data"), list):
+                self.errors.append("Expected an object with a template_data list")
+                return
+            self.content = data
+            self.mode = data.get("mode", "linear")
+            if self.mode not in ("linear", "dynamic"):
+                self.errors.append("Unknown mode %s" % self.mode)
+            self.next_template = (data.get("next_template") or {}).get("template_name")
+            lines = data["template_data"]
+        else:
+            self.content = lines
+            self.mode = "linear"
+        for number, line in enumerate(lines, start=1):
+            line = str(line).strip()
+            if not line or line.startswith('#'):
+                continue
+            building, _, level = line.partition(':')
+            if building not in BUILDINGS:
+                self.errors.append("Line %d: unknown building %s" % (number, building))
+            elif not level.isdigit() or int(level) < 1:
+                self.errors.append("Line %d: invalid level %s" % (number, level))
+        self.rows = level_rows(str(line) for line in lines)
+
+    def parse_troops(self):
+        # Troop templates are JSON, .txt files included
+        data = self.load_json()
+        if data is None:
+            return
+        self.content = data
+        if isinstance(data, dict):
+            self.next_template = (data.get("next_template") or {}).get("template_name")
+            data = data.get("template_data")
+        if not isinstance(data, list):
+            self.errors.append("Expected a list of steps")
+            return
+        for number, step in enumerate(data, start=1):
+            if not isinstance(step, dict) or "building" not in step or not isinstance(step.get("level"), int):
+                self.errors.append("Step %d: needs a building and a level" % number)
+            elif step["building"] not in BUILDINGS:
+                self.errors.append("Step %d: unknown building %s" % (number, step["building"]))
+
+    def parse_offensive(self):
+        data = self.load_json()
+        if data is None:
+            return
+        self.content = data
+        if not isinstance(data, dict) or not isinstance(data.get("groups"), list):
+            self.errors.append("Expected an object with a groups list")
+
+
+class TemplateCatalog:
+    """
+    All templates below `root`, a category is re-scanned at most every `min_interval` seconds
+    """
+    def __init__(self, root, min_interval=2.0):
+        self.root = root
+        self.min_interval = min_interval
+        # category -> {filename: Template}
+        self.templates = {category: {} for category in CATEGORIES}
+        self._stats = {category: {} for category in CATEGORIES}
+        self._refreshed = {category: 0 for category in CATEGORIES}
+        self._lock = threading.Lock()
+
+    def refresh(self, category, force=False):
+        """
+        Re-reads the changed templates of a category, returns the changed file names
+        """
+        with self._lock:
+            now = time.time()
+            if not force and now - self._refreshed[category] < self.min_interval:
+                return set()
+            self._refreshed[category] = now
+            path = os.path.join(self.root, category)
+            stats = {}
+            if os.path.isdir(path):
+                with os.scandir(path) as scan:
+                    for entry in scan:
+                        if entry.name.endswith(EXTENSIONS) and entry.is_file():
+                            stat = entry.stat()
+                            stats[entry.name] = (stat.st_mtime_ns, stat.st_size)
+            known = self._stats[category]
+            templates = dict(self.templates[category])
+            changed = set(known) - set(stats)
+            for filename in changed:
+                templates.pop(filename, None)
+            for filename, stat in stats.items():
+                if known.get(filename) == stat:
+                    continue
+                try:
+                    with open(os.path.join(path, filename), 'r') as f:
+                        text = f.read()
+                except OSError:
+                    continue
+                templates[filename] = Template(category, filename, text)
+                changed.add(filename)
+            self._stats[category] = {name: stat for name, stat in stats.items() if name in templates}
+            self.templates[category] = templates
+            return changed
+
+    def get(self, category):
+        """
+        Returns {filename: Template} of a category
+        """
+        self.refresh(category)
+        return self.templates[category]
+
+    def names(self, category):
+        """
+        Template names (without extension) as used in the config
+        """
+        return sorted({template.name for template in self.get(category).values()})
+
+    def building_rows(self):
+        """
+        {filename: level rows} of the building templates
+        """
+        return {filename: template.rows for filename, template in sorted(self.get("builder").items())}
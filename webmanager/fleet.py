@@ -0,0 +1,276 @@
+"""
+Fleet view over several bot nodes
+
+Every web manager serves a compact summary of its own bot on /api/summary. A web manager with
+fleet.nodes configured polls those summaries (conditional requests, so unchanged nodes only answer 304),
+nodes that cannot be reached can push their summary instead (fleet.push_to).
+The merged view is rebuilt only when a summary changed.
+"""
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+import urllib.error
+import urllib.request
+
+RESOURCES = ("wood", "stone", "iron")
+
+
+def summarize(name, snapshot, worker, running):
+    """
+    Compact state of a single node, built from the web manager state cache
+    """
+    villages = {}
+    totals = {"villages": 0, "under_attack": 0}
+    totals.update({resource: 0 for resource in RESOURCES})
+    for village_id, entry in (snapshot.get("bot") or {}).items():
+        resources = entry.get("resources") or {}
+        farm_bag = entry.get("farm_bag") or {}
+        villages[village_id] = {
+            "name": entry.get("name"),
+            "status": entry.get("status"),
+            "under_attack": bool(entry.get("under_attack")),
+            "last_run": entry.get("last_run"),
+            "resources": {resource: resources.get(resource, 0) for resource in RESOURCES},
+            "farm_bag": farm_bag.get("pct"),
+        }
+        totals["villages"] += 1
+        totals["under_attack"] += int(villages[village_id]["under_attack"])
+        for resource in RESOURCES:
+            try:
+                totals[resource] += int(resources.get(resource, 0))
+            except (TypeError, ValueError):
+                pass
+    worker = worker or {}
+    duration = worker.get("last_cycle_duration")
+    requests = worker.get("requests")
+    return {
+        "node": name,
+        "time": int(time.time()),
+        "running": running,
+        "cycle": {
+            "last": worker.get("last_cycle"),
+            "duration": duration,
+            "requests": requests,
+            "requests_per_minute": round(requests * 60 / duration, 1) if requests and duration else None,
+        },
+        "connectivity": (worker.get("connectivity") or {}).get("state"),
+        "totals": totals,
+        "villages": villages,
+    }
+
+
+class Node:
+    """
+    A remote web manager, or a node that pushes its summary (url is None)
+    """
+    def __init__(self, url=None, name=None):
+        self.url = url.rstrip("/") if url else None
+        self.name = name or url
+        self.summary = None
+        self.etag = None
+        self.last_seen = None
+        self.last_attempt = None
+        self.latency = None
+        self.error = None
+        self.failures = 0
+
+    def health(self, now, stale_after):
+        if self.failures:
+            return "down"
+        if self.last_seen is None:
+            return "unknown"
+        if now - self.last_seen > stale_after:
+            return "stale"
+        return "ok"
+
+
+class Fleet:
+    def __init__(self, poll_interval=30, timeout=5):
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.token = None
+        # url or pushed node name -> Node
+        self.nodes = {}
+        self.version = 0
+        self.logger = logging.getLogger("Fleet")
+        self._view = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def stale_after(self):
+        return 3 * self.poll_interval
+
+    def configure(self, urls, token=None, poll_interval=None):
+        """
+        Sets the polled nodes, nodes that are still configured keep their state
+        """
+        with self._lock:
+            urls = [url.rstrip("/") for url in urls or [] if url]
+            for key, node in list(self.nodes.items()):
+                if node.url and node.url not in urls:
+                    del self.nodes[key]
+            for url in urls:
+                self.nodes.setdefault(url, Node(url))
+            self.token = token or None
+            if poll_interval:
+                self.poll_interval = poll_interval
+            self.version += 1
+
+    def headers(self):
+        return {"X-TWB-Token": self.token} if self.token else {}
+
+    def fetch(self, node):
+        """
+        Gets the summary of a node, returns True when it changed
+        """
+        headers = self.headers()
+        if node.etag:
+            headers["If-None-Match"] = node.etag
+        request = urllib.request.Request(node.url + "/api/summary", headers=headers)
+        started = time.time()
+        node.last_attempt = started
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                summary = json.loads(response.read())
+                etag = response.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                return self._failed(node, "HTTP %d" % e.code)
+            summary = None
+            etag = node.etag
+        except (OSError, ValueError) as e:
+            return self._failed(node, str(e))
+        node.latency = round((time.time() - started) * 1000)
+        node.last_seen = time.time()
+        node.failures = 0
+        node.error = None
+        if summary is None:
+            return False
+        node.summary = summary
+        node.name = summary.get("node") or node.url
+        node.etag = etag
+        return True
+
+    def _failed(self, node, error):
+        # The last summary is kept, the health shows the node is down
+        node.failures += 1
+        node.error = error
+        self.logger.debug("Unable to reach %s: %s", node.url, error)
+        return False
+
+    def poll(self):
+        """
+        Fetches all polled nodes in parallel
+        """
+        nodes = [node for node in list(self.nodes.values()) if node.url]
+        if not nodes:
+            return False
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, len(nodes))) as pool:
+            changed = any(list(pool.map(self.fetch, nodes)))
+        if changed:
+            with self._lock:
+                self.version += 1
+        return changed
+
+    def receive(self, summary):
+        """
+        Stores a summary pushed by a node
+        """
+        name = summary.get("node")
+        if not name:
+            raise ValueError("The summary has no node name")
+        with self._lock:
+            node = self.nodes.get(name)
+            if node is None or node.url:
+                node = self.nodes[name] = Node(name=name)
+            node.summary = summary
+            node.last_seen = time.time()
+            node.failures = 0
+            self.version += 1
+
+    def merge(self):
+        nodes = []
+        villages = []
+        totals = {"nodes": 0, "villages": 0, "under_attack": 0}
+        totals.update({resource: 0 for resource in RESOURCES})
+        for key, node in sorted(self.nodes.items()):
+            summary = node.summary or {}
+            nodes.append({
+                "key": key,
+                "name": node.name,
+                "url": node.url,
+                "running": summary.get("running"),
+                "cycle": summary.get("cycle"),
+                "connectivity": summary.get("connectivity"),
+                "totals": summary.get("totals"),
+            })
+            totals["nodes"] += 1
+            for field, value in (summary.get("totals") or {}).items():
+                if field in totals:
+                    totals[field] += value
+            for village_id, village in (summary.get("villages") or {}).items():
+                villages.append(dict(village, id=village_id, node=node.name))
+        villages.sort(key=lambda village: (not village["under_attack"], village["node"] or "", village["id"]))
+        return {"nodes": nodes, "villages": villages, "totals": totals}
+
+    def view(self):
+        """
+        The merged fleet state, health is computed on every call
+        """
+        now = time.time()
+        with self._lock:
+            if self._view is None or self._view[0] != self.version:
+                self._view = (self.version, self.merge())
+            version, merged = self._view
+            health = {
+                key: {
+                    "health": node.health(now, self.stale_after),
+                    "last_seen": node.last_seen,
+                    "latency_ms": node.latency,
+                    "error": node.error,
+                }
+                for key, node in self.nodes.items()
+            }
+        nodes = [dict(node, **health.get(node["key"], {})) for node in merged["nodes"]]
+        return dict(merged, nodes=nodes, version=version)
+
+    def start(self):
+        """
+        Polls the nodes in the background
+        """
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="TWB-Fleet", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.logger.warning("Fleet poll failed: %s", e)
+            self._stop.wait(self.poll_interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+def push(url, summary, token=None, timeout=5):
+    """
+    Sends a summary to an aggregating web manager, returns True when it was accepted
+    """
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["X-TWB-Token"] = token
+    request = urllib.request.Request(
+        url.rstrip("/") + "/api/fleet/push", data=json.dumps(summary).encode(), headers=headers, method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
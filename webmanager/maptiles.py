@@ -0,0 +1,116 @@
+"""
+World map split into fixed-size tiles for the web manager
+
+Villages are indexed by tile, so a change to cache/villages only invalidates the tiles the
+changed villages are (or were) on. Tiles are serialized once and kept until they change.
+"""
+import json
+import threading
+import time
+
+# Width and height of a tile in fields, the world is 1000x1000
+TILE_SIZE = 20
+# Order of the values of a village in a tile
+COLUMNS = ("x", "y", "id", "name", "points", "owner", "tribe", "bonus")
+
+
+class MapTiles:
+    def __init__(self, tile_size=TILE_SIZE, instance=None):
+        self.tile_size = tile_size
+        # Tile counters restart with the web manager, the instance keeps the versions (and the
+        # browser cached tile URLs) of an older process from matching
+        self.instance = instance or "%x" % int(time.time())
+        self.version = 0
+        # village id -> cache entry, entries are replaced (never changed) by the state cache
+        self.entries = {}
+        # village id -> tile
+        self.positions = {}
+        # tile -> {village id: (x, y)}
+        self.tiles = {}
+        self.tile_versions = {}
+        # tile -> (version, serialized tile)
+        self.rendered = {}
+        self._source = None
+        self._lock = threading.Lock()
+
+    def tile_version(self, tile):
+        return "%s.%d" % (self.instance, self.tile_versions.get(tile, 0))
+
+    def tile_of(self, x, y):
+        return x // self.tile_size, y // self.tile_size
+
+    def _remove(self, village_id, changed_tiles):
+        tile = self.positions.pop(village_id, None)
+        if tile is None:
+            return
+        villages = self.tiles.get(tile)
+        if villages is not None:
+            villages.pop(village_id, None)
+            if not villages:
+                del self.tiles[tile]
+        changed_tiles.add(tile)
+
+    def sync(self, villages):
+        """
+        Updates the index from the cached villages, returns the tiles that changed
+        """
+        with self._lock:
+            if villages is self._source:
+                return set()
+            changed_tiles = set()
+            for village_id in list(self.entries):
+                if village_id not in villages:
+                    del self.entries[village_id]
+                    self._remove(village_id, changed_tiles)
+            for village_id, entry in villages.items():
+                if self.entries.get(village_id) is entry:
+                    continue
+                self.entries[village_id] = entry
+                self._remove(village_id, changed_tiles)
+                try:
+                    x, y = entry["location"]
+                except (KeyError, TypeError, ValueError):
+                    continue
+                tile = self.tile_of(x, y)
+                self.tiles.setdefault(tile, {})[village_id] = (x, y)
+                self.positions[village_id] = tile
+                changed_tiles.add(tile)
+            for tile in changed_tiles:
+                self.tile_versions[tile] = self.tile_versions.get(tile, 0) + 1
+            if changed_tiles:
+                self.version += 1
+            self._source = villages
+            return changed_tiles
+
+    def index(self):
+        """
+        Tile size and the version of every tile that has villages
+        """
+        with self._lock:
+            return {
+                "tile_size": self.tile_size,
+                "version": self.version,
+                "columns": COLUMNS,
+                "tiles": {"%d:%d" % tile: self.tile_version(tile) for tile in self.tiles},
+            }
+
+    def tile(self, tile_x, tile_y):
+        """
+        Returns (version, JSON of the tile), rendered only when the tile changed
+        """
+        tile = (tile_x, tile_y)
+        with self._lock:
+            version = self.tile_version(tile)
+            cached = self.rendered.get(tile)
+            if cached and cached[0] == version:
+                return cached
+            rows = []
+            for village_id, (x, y) in sorted(self.tiles.get(tile, {}).items(), key=lambda item: item[1]):
+                entry = self.entries[village_id]
+                rows.append([x, y, village_id] + [entry.get(column) for column in COLUMNS[3:]])
+            payload = json.dumps(
+                {"x": tile_x, "y": tile_y, "size": self.tile_size, "version": version, "villages": rows},
+                separators=(",", ":"),
+            )
+            self.rendered[tile] = (version, payload)
+            return self.rendered[tile]
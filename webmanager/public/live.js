@@ -0,0 +1,54 @@
+/*
+ * Live village updates for the dashboard
+ *
+ * The web manager streams the changes the bot publishes (/api/events) and this keeps a copy of the
+ * live fields of every village up to date. Nested objects only contain the keys that changed,
+ * a null value means the key was removed.
+ */
+var TWBLive = (function () {
+    var villages = {};
+
+    function merge(target, changes) {
+        for (const [key, value] of Object.entries(changes)) {
+            if (value !== null && typeof value === "object" && !Array.isArray(value)
+                && target[key] !== null && typeof target[key] === "object" && !Array.isArray(target[key])) {
+                for (const [sub, subValue] of Object.entries(value)) {
+                    if (subValue === null) {
+                        delete target[key][sub];
+                    } else {
+                        target[key][sub] = subValue;
+                    }
+                }
+            } else {
+                target[key] = value;
+            }
+        }
+        return target;
+    }
+
+    function connect(handlers) {
+        if (!window.EventSource) {
+            if (handlers.unsupported) {
+                handlers.unsupported();
+            }
+            return null;
+        }
+        var source = new EventSource("/api/events");
+        source.onmessage = function (message) {
+            var event = JSON.parse(message.data);
+            var village = villages[event.village] || (villages[event.village] = {});
+            merge(village, event.changes);
+            if (handlers.village) {
+                handlers.village(event.village, village, event.changes);
+            }
+        };
+        source.addEventListener("bot", function (message) {
+            if (handlers.bot) {
+                handlers.bot(JSON.parse(message.data).status);
+            }
+        });
+        return source;
+    }
+
+    return {villages: villages, merge: merge, connect: connect};
+})();
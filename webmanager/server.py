@@ -1,22 +1,54 @@
+import gzip
+import hmac
 import json
 import os
 import sys
+import threading
+import time
 sys.path.insert(0, "../")
 
-from flask import Flask, jsonify, send_from_directory, request, render_template
+from flask import Flask, Response, jsonify, send_from_directory, request, render_template
 from datetime import datetime
 
 try:
+    from webmanager.catalog import TemplateCatalog
+    from webmanager.fleet import Fleet, push, summarize
     from webmanager.helpfile import help_file, buildings
-    from webmanager.utils import DataReader, BotManager, MapBuilder, BuildingTemplateManager
+    from webmanager.maptiles import MapTiles
+    from webmanager.state import EventFeed, StateCache
+    from webmanager.utils import DataReader, BotManager
 except ImportError:
+    from catalog import TemplateCatalog
+    from fleet import Fleet, push, summarize
     from helpfile import help_file, buildings
-    from utils import DataReader, BotManager, MapBuilder, BuildingTemplateManager
+    from maptiles import MapTiles
+    from state import EventFeed, StateCache
+    from utils import DataReader, BotManager
 
 bm = BotManager()
+state = StateCache(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+events = EventFeed(os.path.join(state.root, "cache", "events.jsonl"))
+map_tiles = MapTiles(instance=state.instance)
+catalog = TemplateCatalog(os.path.join(state.root, "templates"))
+fleet = Fleet()
+fleet_config = {}
+
+# Seconds between checks for new events and between keep-alive comments of an event stream
+EVENT_POLL = 0.5
+EVENT_KEEPALIVE = 15
+# API responses smaller than this are not worth compressing
+GZIP_MIN_SIZE = 1024
+# Hosts only this machine can reach, anything else needs fleet.token for changes
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+# Routes that check the fleet token themselves, everything else needs it when not bound to localhost
+FLEET_ENDPOINTS = {"get_summary", "push_fleet"}
+# Config values that are never sent to the browser
+SECRET_KEYS = (("fleet", "token"), ("notifications", "token"), ("reporting", "connection_string"))
+SECRET_PLACEHOLDER = "********"
 
 app = Flask(__name__)
 app.config["DEBUG"] = True
+app.config["TWB_HOST"] = "localhost"
 
 @app.template_filter('timestamp_to_datetime')
 def timestamp_to_datetime(s):
@@ -43,7 +75,7 @@ def preprocess_select(key, value, templates, village_id=None):
         output = '<select data-type-option="%s" data-village-id="%s" data-type="select" class="form-control">' % (
         key, village_id)
 
-    for template in DataReader.template_grab(templates):
+    for template in catalog.names(templates.split('.')[-1]):
         output += '<option value="%s" %s>%s</option>' % (template, 'selected' if template == value else '', template)
     output += '</select>'
     return output
@@ -145,25 +177,29 @@ def pre_process_village_config(village_id):
     return config_data
 
 
+def redact(config):
+    """
+    Copy of the config without the secrets (tokens and database credentials)
+    """
+    config = dict(config or {})
+    for section, parameter in SECRET_KEYS:
+        if isinstance(config.get(section), dict) and config[section].get(parameter):
+            config[section] = dict(config[section], **{parameter: SECRET_PLACEHOLDER})
+    return config
+
+
+def secret_config():
+    """
+    The full config including the secrets, never to be returned to a client
+    """
+    return state.snapshot().get("config") or {}
+
+
 def sync():
-    reports = DataReader.cache_grab("reports")
-    villages = DataReader.cache_grab("villages")
-    attacks = DataReader.cache_grab("attacks")
-    config = DataReader.config_grab()
-    managed = DataReader.cache_grab("managed")
-    bot_status = bm.is_running()
-
-    sort_reports = {key: value for key, value in sorted(reports.items(), key=lambda item: int(item[0]))}
-    n_items = {k: sort_reports[k] for k in list(sort_reports)[:100]}
-
-    out_struct = {
-        "attacks": attacks,
-        "villages": villages,
-        "config": config,
-        "reports": n_items,
-        "bot": managed,
-        "status": bot_status
-    }
+    # Served from memory, only files that changed since the last call are read again
+    out_struct = state.snapshot()
+    out_struct["config"] = redact(out_struct.get("config"))
+    out_struct["status"] = bm.is_running()
     return out_struct
 
 
@@ -172,6 +208,167 @@ def get_vars():
     return jsonify(sync())
 
 
+@app.route('/api/series', methods=['GET'])
+def get_series():
+    series = DataReader.series_grab(
+        village_id=request.args.get("village"),
+        data_type=request.args.get("type", "village.resources"),
+        since=request.args.get("since", None, type=int),
+    )
+    if series is None:
+        return jsonify({"error": "History needs reporting enabled with a sqlite:// connection string"}), 404
+    return jsonify(series)
+
+
+@app.route('/api/<any(villages, reports, attacks, managed):collection>', methods=['GET'])
+def get_collection(collection):
+    args = request.args
+    fields = args.get("fields")
+    page = state.query(
+        collection,
+        village=args.get("village"),
+        report_type=args.get("type"),
+        since=args.get("since", None, type=int),
+        until=args.get("until", None, type=int),
+        fields=fields.split(",") if fields else None,
+        cursor=args.get("cursor"),
+        limit=args.get("limit", 50, type=int),
+    )
+    etag = state.etag(collection, page["version"], args.to_dict())
+    # Compressed responses carry the same tag with a -gzip suffix
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(etag + "-gzip"):
+        response = Response(status=304)
+    else:
+        response = jsonify(page)
+    response.set_etag(etag)
+    return response
+
+
+def node_summary():
+    data = sync()
+    config = data.get("config") or {}
+    name = (config.get("fleet") or {}).get("name") or (config.get("server") or {}).get("server") or "twb"
+    return summarize(name, data, data.get("worker"), data["status"])
+
+
+def request_token():
+    # Browsers can not send the header, the token can be passed once as ?token= and is kept in a cookie
+    return request.headers.get("X-TWB-Token") or request.values.get("token") or request.cookies.get("twb_token")
+
+
+def token_valid(required=False):
+    token = (secret_config().get("fleet") or {}).get("token")
+    if not token:
+        return not required
+    return hmac.compare_digest(str(request_token() or "").encode(), str(token).encode())
+
+
+def is_local():
+    return app.config["TWB_HOST"] in LOCAL_HOSTS
+
+
+@app.before_request
+def guard_remote():
+    # On the network every page shows or changes the bot, only the fleet API has its own check
+    if is_local() or request.endpoint in FLEET_ENDPOINTS:
+        return None
+    if not token_valid(required=True):
+        return jsonify({"error": "fleet.token is needed when the web manager is not bound to localhost"}), 403
+    return None
+
+
+@app.after_request
+def remember_token(response):
+    if request.args.get("token") and not is_local() and token_valid(required=True):
+        response.set_cookie("twb_token", request.args["token"], httponly=True, samesite="Strict")
+    return response
+
+
+def setup_fleet():
+    """
+    (Re)configures the aggregator and the push thread when the fleet config changed
+    """
+    global fleet_config
+    config = secret_config().get("fleet") or {}
+    if config == fleet_config:
+        return
+    fleet_config = config
+    fleet.configure(config.get("nodes", []), token=config.get("token"), poll_interval=config.get("poll_interval"))
+    if config.get("nodes"):
+        fleet.start()
+    if config.get("push_to"):
+        threading.Thread(target=push_summaries, name="TWB-Fleet-Push", daemon=True).start()
+
+
+def push_summaries():
+    config = fleet_config
+    while fleet_config is config:
+        if not push(config["push_to"], node_summary(), token=config.get("token")):
+            app.logger.warning("Unable to push the summary to %s", config["push_to"])
+        time.sleep(config.get("poll_interval") or 30)
+
+
+@app.route('/api/summary', methods=['GET'])
+def get_summary():
+    if not token_valid():
+        return jsonify({"error": "Invalid fleet token"}), 403
+    summary = node_summary()
+    # The summary time changes every call, the tag only follows the data
+    etag = "summary-%s-%s-%s" % (state.instance, state.version, summary["running"])
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(etag + "-gzip"):
+        response = Response(status=304)
+    else:
+        response = jsonify(summary)
+    response.set_etag(etag)
+    return response
+
+
+@app.route('/api/fleet', methods=['GET'])
+def get_fleet():
+    setup_fleet()
+    return jsonify(fleet.view())
+
+
+@app.route('/api/fleet/push', methods=['POST'])
+def push_fleet():
+    if not token_valid():
+        return jsonify({"error": "Invalid fleet token"}), 403
+    try:
+        fleet.receive(request.get_json(force=True))
+    except (AttributeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(True)
+
+
+@app.route('/fleet', methods=['GET'])
+def get_fleet_page():
+    setup_fleet()
+    return render_template('fleet.html', fleet=fleet.view())
+
+
+@app.after_request
+def compress_response(response):
+    if (
+            not request.path.startswith("/api/")
+            or response.status_code != 200
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    if "gzip" not in request.headers.get("Accept-Encoding", ""):
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + "-gzip", weak)
+    return response
+
+
 @app.route('/bot/start')
 def start_bot():
     bm.start()
@@ -211,9 +408,40 @@ def get_village_config():
 def get_map():
     sync_data = sync()
     center_id = request.args.get("center", None)
-    center = next(iter(sync_data['bot'])) if not center_id else center_id
-    map_data = json.dumps(MapBuilder.build(sync_data['villages'], current_village=center, size=15))
-    return render_template('map.html', data=sync_data, map=map_data)
+    center = center_id or next(iter(sync_data['bot']), None)
+    village = sync_data['villages'].get(center) or {}
+    map_data = {
+        "center": village.get("location", [500, 500]),
+        "owner": village.get("owner"),
+        "tribe": village.get("tribe"),
+    }
+    return render_template('map.html', data=sync_data, map=json.dumps(map_data))
+
+
+@app.route('/api/map', methods=['GET'])
+def get_map_index():
+    map_tiles.sync(state.collection("villages").data)
+    return jsonify(map_tiles.index())
+
+
+@app.route('/api/map/tile/<int:tile_x>/<int:tile_y>', methods=['GET'])
+def get_map_tile(tile_x, tile_y):
+    map_tiles.sync(state.collection("villages").data)
+    version, payload = map_tiles.tile(tile_x, tile_y)
+    etag = "tile-%d-%d-%s" % (tile_x, tile_y, version)
+    if request.if_none_match.contains(etag) or request.if_none_match.contains(etag + "-gzip"):
+        response = Response(status=304)
+    else:
+        response = Response(payload, mimetype="application/json")
+    response.set_etag(etag)
+    # Tiles requested with their current version (from /api/map) never change
+    if request.args.get("v") == version:
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
 
 
 @app.route('/villages', methods=['GET'])
@@ -227,13 +455,15 @@ def get_building_templates():
         plain = os.path.basename(request.form.get('new'))
         if not plain.endswith('.txt'):
             plain = "%s.txt" % plain
-        tempfile = '../templates/builder/%s' % plain
+        tempfile = os.path.join(catalog.root, "builder", plain)
         if not os.path.exists(tempfile):
             with open(tempfile, 'w') as ouf:
                 ouf.write("")
+        catalog.refresh("builder", force=True)
     selected = request.args.get('t', None)
     return render_template('templates.html',
-                           templates=BuildingTemplateManager.template_cache_list(),
+                           templates=catalog.building_rows(),
+                           errors={name: t.errors for name, t in catalog.get("builder").items() if t.errors},
                            selected=selected,
                            buildings=buildings)
 
@@ -250,6 +480,59 @@ def get_home():
     return render_template('status.html', data=sync(), session=session)
 
 
+@app.route('/profile', methods=['GET'])
+def get_profile():
+    profiles = DataReader.profile_grab()
+    selected = request.args.get("cycle", None)
+    current = next((p for p in profiles if str(p["cycle"]) == selected), profiles[0] if profiles else None)
+    return render_template('profile.html', profiles=profiles, current=current)
+
+
+@app.route('/profile/flamegraph/<name>', methods=['GET'])
+def get_flamegraph(name):
+    urlpath = os.path.join(os.path.dirname(__file__), "..", "cache", "logs")
+    return send_from_directory(urlpath, os.path.basename(name), mimetype="image/svg+xml")
+
+
+def event_stream(last_id):
+    yield "retry: 5000\n\n"
+    running = None
+    last_write = time.time()
+    while True:
+        for event in events.since(last_id):
+            last_id = event["id"]
+            last_write = time.time()
+            yield "id: %d\ndata: %s\n\n" % (last_id, json.dumps(event, separators=(",", ":")))
+        status = bm.is_running()
+        if status != running:
+            running = status
+            last_write = time.time()
+            yield "event: bot\ndata: %s\n\n" % json.dumps({"status": status})
+        if time.time() - last_write > EVENT_KEEPALIVE:
+            last_write = time.time()
+            yield ": keep-alive\n\n"
+        time.sleep(EVENT_POLL)
+
+
+@app.route('/api/events', methods=['GET'])
+def get_events():
+    # Browsers send Last-Event-ID when they reconnect, new clients only get what happens from now on
+    last_id = request.headers.get("Last-Event-ID", request.args.get("since"))
+    try:
+        last_id = int(last_id)
+    except (TypeError, ValueError):
+        events.poll()
+        last_id = events.last_id
+    return Response(event_stream(last_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route('/app/live.js', methods=['GET'])
+def get_live_js():
+    urlpath = os.path.join(os.path.dirname(__file__), "public")
+    return send_from_directory(urlpath, "live.js", mimetype="application/javascript")
+
+
 @app.route('/app/js', methods=['GET'])
 def get_js():
     urlpath = os.path.join(os.path.dirname(__file__), "public")
@@ -259,6 +542,9 @@ def get_js():
 @app.route('/app/config/set', methods=['GET'])
 def config_set():
     vid = request.args.get("village_id", None)
+    if request.args.get("value") in (SECRET_PLACEHOLDER, json.dumps(SECRET_PLACEHOLDER)):
+        # The page only knows the placeholder of a secret, keep the stored value
+        return jsonify(sync())
     if not vid:
         DataReader.config_set(parameter=request.args.get("parameter"), value=request.args.get("value", None))
     else:
@@ -267,11 +553,19 @@ def config_set():
             param = param.replace("village.", "")
         DataReader.village_config_set(village_id=vid, parameter=param, value=request.args.get("value", None))
 
+    state.refresh(force=True)
     return jsonify(sync())
 
 
 if __name__ == "__main__":
+    setup_fleet()
+    if len(sys.argv) > 2:
+        # Listen on another interface (e.g. 0.0.0.0) so an aggregating web manager can reach this one
+        app.config["TWB_HOST"] = sys.argv[2]
+    if not is_local():
+        # Never expose the debugger and the reloader to the network
+        app.config["DEBUG"] = False
     if len(sys.argv) > 1:
-        app.run(host="localhost", port=sys.argv[1])
+        app.run(host=app.config["TWB_HOST"], port=sys.argv[1], debug=app.config["DEBUG"])
     else:
-        app.run()
+        app.run(debug=app.config["DEBUG"])
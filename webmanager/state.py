@@ -0,0 +1,324 @@
+"""
+In-memory copy of the bot cache for the web manager
+
+Files are parsed once and only re-read when their modification time or size changed,
+so a page view costs a directory scan instead of parsing every cached file.
+"""
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class CacheDirectory:
+    """
+    Parsed JSON files of a single cache directory, keyed by file name (without .json)
+    `window` limits the entries that are kept (and parsed) to the first N keys in sorted order.
+    """
+    def __init__(self, path, window=None, sort_key=None):
+        self.path = path
+        self.window = window
+        self.sort_key = sort_key
+        self.data = {}
+        # Bumped whenever an entry was added, changed or removed
+        self.version = 0
+        self._stats = {}
+
+    def _selected(self, entries):
+        if self.window is None:
+            return entries
+        names = sorted(entries, key=self.sort_key)[:self.window]
+        return {name: entries[name] for name in names}
+
+    def refresh(self):
+        """
+        Re-reads changed files, returns the keys that changed
+        """
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        entries = {}
+        with os.scandir(self.path) as scan:
+            for entry in scan:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries[entry.name[:-len(".json")]] = (stat.st_mtime_ns, stat.st_size)
+        entries = self._selected(entries)
+
+        changed = set()
+        # Changes go to a copy, so requests still using the previous dict are not affected
+        data = dict(self.data)
+        for key in list(data):
+            if key not in entries:
+                del data[key]
+                self._stats.pop(key, None)
+                changed.add(key)
+        for key, stat in entries.items():
+            if self._stats.get(key) == stat:
+                continue
+            try:
+                with open(os.path.join(self.path, key + ".json"), 'r') as f:
+                    data[key] = json.load(f)
+            except (OSError, ValueError) as e:
+                # Most likely written by the bot right now, the next refresh picks it up
+                print("Cache read error for %s: %s" % (key, str(e)))
+                continue
+            self._stats[key] = stat
+            changed.add(key)
+        if changed:
+            self.data = data
+            self.version += 1
+        return changed
+
+    def modified(self, key):
+        """
+        Returns the modification time of an entry in seconds
+        """
+        stat = self._stats.get(key)
+        return stat[0] // 1_000_000_000 if stat else None
+
+    def items(self):
+        """
+        Returns the entries in sorted order
+        """
+        return {key: self.data[key] for key in sorted(self.data, key=self.sort_key)}
+
+
+class CachedFile:
+    """
+    A single parsed JSON file, re-read when it changed
+    """
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        self.version = 0
+        self._stat = None
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        stat = (stat.st_mtime_ns, stat.st_size)
+        if stat == self._stat:
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self._stat = stat
+        self.version += 1
+        return True
+
+
+def _report_key(name):
+    try:
+        return 0, int(name)
+    except ValueError:
+        return 1, name
+
+
+# Field holding the time of an entry for the since / until filters, others use the file time
+TIME_FIELDS = {"attacks": "last_attack", "managed": "last_run"}
+# Collections listed newest first
+NEWEST_FIRST = {"reports"}
+MAX_LIMIT = 500
+
+
+class StateCache:
+    """
+    Everything sync() returns, refreshed at most every `min_interval` seconds
+    """
+    def __init__(self, root, min_interval=1.0, report_window=100):
+        self.root = root
+        self.min_interval = min_interval
+        self.directories = {
+            "reports": CacheDirectory(os.path.join(root, "cache", "reports"), window=report_window,
+                                      sort_key=_report_key),
+            "villages": CacheDirectory(os.path.join(root, "cache", "villages")),
+            "attacks": CacheDirectory(os.path.join(root, "cache", "attacks")),
+            "managed": CacheDirectory(os.path.join(root, "cache", "managed")),
+        }
+        self.config = CachedFile(os.path.join(root, "config.json"))
+        # Cycle stats written by the bot
+        self.worker = CachedFile(os.path.join(root, "cache", "worker.json"))
+        # All reports, only loaded when the API asks for them
+        self.all_reports = None
+        self.all_reports_refresh = 0
+        # Versions restart with the web manager, this keeps ETags of an older process from matching
+        self.instance = "%x" % int(time.time())
+        self.last_refresh = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """
+        Changes whenever any of the cached data changed
+        """
+        return "%d-%d-%s" % (
+            self.config.version, self.worker.version, "-".join(str(d.version) for d in self.directories.values())
+        )
+
+    def refresh(self, force=False):
+        """
+        Re-reads what changed on disk, returns {name: changed keys}
+        """
+        with self._lock:
+            now = time.time()
+            if not force and now - self.last_refresh < self.min_interval:
+                return {}
+            self.last_refresh = now
+            changes = {name: directory.refresh() for name, directory in self.directories.items()}
+            if self.config.refresh():
+                changes["config"] = {"config"}
+            if self.worker.refresh():
+                changes["worker"] = {"worker"}
+            changes = {name: keys for name, keys in changes.items() if keys}
+            if changes or self._snapshot is None:
+                self._snapshot = {
+                    "attacks": self.directories["attacks"].data,
+                    "villages": self.directories["villages"].data,
+                    "config": self.config.data,
+                    "reports": self.directories["reports"].items(),
+                    "bot": self.directories["managed"].data,
+                    "worker": self.worker.data,
+                }
+            return changes
+
+    def snapshot(self):
+        """
+        Returns the cached state, the dicts are shared so callers must not change them
+        """
+        self.refresh()
+        return dict(self._snapshot)
+
+    def collection(self, name):
+        """
+        Returns the refreshed CacheDirectory of reports, villages, attacks or managed
+        """
+        if name != "reports":
+            self.refresh()
+            return self.directories[name]
+        with self._lock:
+            if self.all_reports is None:
+                self.all_reports = CacheDirectory(self.directories["reports"].path, sort_key=_report_key)
+            now = time.time()
+            if now - self.all_reports_refresh >= self.min_interval:
+                self.all_reports_refresh = now
+                self.all_reports.refresh()
+            return self.all_reports
+
+    def etag(self, name, version, args):
+        """
+        Strong ETag of a query, changes with the data of the collection
+        """
+        query = hashlib.sha1(json.dumps(sorted(args.items())).encode()).hexdigest()[:12]
+        return "%s-%s-%d-%s" % (name, self.instance, version, query)
+
+    def query(self, name, village=None, report_type=None, since=None, until=None, fields=None,
+              cursor=None, limit=50):
+        """
+        Returns a page of a collection: {"items": [...], "next": cursor of the next page or None, "version": ...}
+        Items are the cached entries with their key as "id", `fields` limits the keys that are returned.
+        """
+        directory = self.collection(name)
+        with self._lock:
+            data, version = directory.data, directory.version
+        sort_key = directory.sort_key or str
+        newest_first = name in NEWEST_FIRST
+        keys = sorted(data, key=sort_key, reverse=newest_first)
+        if cursor is not None:
+            cursor_key = sort_key(cursor)
+            if newest_first:
+                keys = [key for key in keys if sort_key(key) < cursor_key]
+            else:
+                keys = [key for key in keys if sort_key(key) > cursor_key]
+        limit = max(1, min(limit, MAX_LIMIT))
+        items = []
+        next_cursor = None
+        for key in keys:
+            entry = data[key]
+            if village is not None:
+                if name == "reports":
+                    if village not in (str(entry.get("origin")), str(entry.get("dest"))):
+                        continue
+                elif key != village:
+                    continue
+            if report_type is not None and entry.get("type") != report_type:
+                continue
+            if since is not None or until is not None:
+                timestamp = entry.get(TIME_FIELDS[name]) if name in TIME_FIELDS else directory.modified(key)
+                if timestamp is None or (since is not None and timestamp < since) \
+                        or (until is not None and timestamp > until):
+                    continue
+            if len(items) == limit:
+                next_cursor = items[-1]["id"]
+                break
+            if fields:
+                entry = {field: entry.get(field) for field in fields}
+            items.append(dict(entry, id=key))
+        return {"items": items, "next": next_cursor, "version": version}
+
+
+class EventFeed:
+    """
+    Tails cache/events.jsonl (written by the bot) and keeps the most recent events in memory
+    """
+    def __init__(self, path, keep=500):
+        self.path = path
+        self.events = collections.deque(maxlen=keep)
+        self._offset = 0
+        self._inode = None
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """
+        Reads the lines appended since the last poll, returns the new events
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return []
+            if stat.st_ino != self._inode or stat.st_size < self._offset:
+                # Rotated by the bot, ids tell which events were already seen
+                self._inode = stat.st_ino
+                self._offset = 0
+            if stat.st_size == self._offset:
+                return []
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read(stat.st_size - self._offset)
+            # A line without a newline is still being written
+            end = chunk.rfind(b"\n") + 1
+            self._offset += end
+            last_id = self.events[-1]["id"] if self.events else 0
+            new = []
+            for line in chunk[:end].splitlines():
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("id", 0) > last_id:
+                    new.append(event)
+                    last_id = event["id"]
+            self.events.extend(new)
+            return new
+
+    @property
+    def last_id(self):
+        return self.events[-1]["id"] if self.events else 0
+
+    def since(self, last_id):
+        """
+        Returns the events after last_id
+        """
+        self.poll()
+        return [event for event in list(self.events) if event["id"] > last_id]
@@ -1,11 +1,17 @@
 import collections
+import glob
 import json
 import os
 import signal
 import subprocess
+import threading
 
 import psutil
 
+# Open report databases by path, kept between requests
+_report_databases = {}
+_report_databases_lock = threading.Lock()
+
 
 class DataReader:
     @staticmethod
@@ -36,16 +42,55 @@ class DataReader:
         return output
 
     @staticmethod
-    def template_grab(template_location):
-        output = []
-        template_location = template_location.replace('.', '/')
-        c_path = os.path.join(os.path.dirname(__file__), "..", template_location)
-        for existing in os.listdir(c_path):
-            existing = str(existing)
-            if not existing.endswith(".txt"):
-                continue
-            output.append(existing.split('.')[0])
-        return output
+    def profile_grab():
+        """
+        Returns the summaries of the last profiled cycles, newest first
+        """
+        c_path = os.path.join(os.path.dirname(__file__), "..", "cache", "logs", "profile.json")
+        if not os.path.exists(c_path):
+            return []
+        with open(c_path, 'r') as f:
+            try:
+                return list(reversed(json.load(f)))
+            except ValueError:
+                return []
+
+    @staticmethod
+    def report_database():
+        """
+        Returns the SQLite report database (read-only) when the bot reports to sqlite://, None otherwise
+        The connection is opened once per database file and reused by later requests.
+        """
+        reporting = DataReader.config_grab().get("reporting", {})
+        connection_string = reporting.get("connection_string") or ""
+        if not reporting.get("enabled") or not connection_string.startswith("sqlite://"):
+            return None
+        path = os.path.join(os.path.dirname(__file__), "..", connection_string.split("://")[1])
+        # Databases named after the start time ({ts}), use the newest one
+        candidates = [p for p in glob.glob(path.replace("{ts}", "*")) if os.path.isfile(p)]
+        if not candidates:
+            return None
+        newest = max(candidates, key=os.path.getmtime)
+        with _report_databases_lock:
+            database = _report_databases.get(newest)
+            if database is None:
+                from core.reporter import ReportDatabase
+                # The bot started a new database ({ts}), the old ones are not read anymore
+                for old in _report_databases.values():
+                    old.close()
+                _report_databases.clear()
+                database = _report_databases[newest] = ReportDatabase(newest, read_only=True)
+        return database
+
+    @staticmethod
+    def series_grab(village_id, data_type, since=None):
+        """
+        Returns the time series of a village data type for charts, None without a report database
+        """
+        database = DataReader.report_database()
+        if not database:
+            return None
+        return database.series(village_id, data_type, since=since)
 
     @staticmethod
     def config_grab():
@@ -101,93 +146,6 @@ class DataReader:
             return session_data
 
 
-class BuildingTemplateManager:
-
-    @staticmethod
-    def template_cache_list():
-        c_path = os.path.join(os.path.dirname(__file__), "..", "templates", "builder")
-        output = {}
-        for existing in os.listdir(c_path):
-            if not existing.endswith(".txt"):
-                continue
-            with open(os.path.join(os.path.dirname(__file__), "..", "templates", "builder", existing),
-                      'r') as template_file:
-                output[existing] = BuildingTemplateManager.template_to_dict(
-                    [x.strip() for x in template_file.readlines()])
-        return output
-
-    @staticmethod
-    def template_to_dict(t_list):
-        out_data = {}
-        rows = []
-
-        for entry in t_list:
-            if entry.startswith('#') or ':' not in entry:
-                continue
-            building, next_level = entry.split(':')
-            next_level = int(next_level)
-            old = 0
-            if building in out_data:
-                old = out_data[building]
-            rows.append({'building': building, 'from': old, 'to': next_level})
-            out_data[building] = next_level
-
-        return rows
-
-
-class MapBuilder:
-
-    @staticmethod
-    def build(villages, current_village=None, size=None):
-        out_map = {}
-        min_x = 999
-        max_x = 0
-        min_y = 999
-        max_y = 0
-
-        current_location = None
-        grid_vils = {}
-        extra_data = {}
-
-        for v in villages:
-            vdata = villages[v]
-            x, y = vdata['location']
-            if x < min_x:
-                min_x = x
-            if x > max_x:
-                max_x = x
-
-            if y < min_y:
-                min_y = y
-            if y > max_y:
-                max_y = y
-            if current_village and vdata['id'] == current_village:
-                current_location = vdata['location']
-                extra_data['owner'] = vdata['owner']
-                extra_data['tribe'] = vdata['tribe']
-            grid_vils["%d:%d" % (x, y)] = vdata
-
-        if current_location and size:
-            min_x = current_location[0] - size
-            min_y = current_location[1] - size
-            max_x = current_location[0] + size
-            max_y = current_location[1] + size
-
-        for location_x in range(min_x, max_x):
-            if location_x not in out_map:
-                out_map[location_x - min_x] = {}
-            ylocs = {}
-            for location_y in range(min_y, max_y):
-                location = "%d:%d" % (location_x, location_y)
-                if location in grid_vils:
-                    ylocs[location_y - min_y] = grid_vils[location]
-                else:
-                    ylocs[location_y - min_y] = None
-            out_map[location_x - min_x] = ylocs
-
-        return {"grid": out_map, "extra": extra_data}
-
-
 class BotManager:
     pid = None
 